@@ -0,0 +1,182 @@
+"""
+Auto Payouts Module - background scheduler for wallet auto_payout settings
+Features:
+- Due wallets selected through an index on auto_payout_next_run_at
+- Run times spread across the day per barber so payouts never arrive in one burst
+- Leases so several workers can run the scheduler without paying twice
+- Rate-limited batches, exponential backoff on failures, and a per-run idempotency
+  key kept on the wallet as a checkpoint until the run completes
+- Runs that keep failing are flagged as stuck and retried hourly with the same key,
+  never skipped: their money may already be in transit at Stripe
+"""
+
+import os
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+AUTO_PAYOUT_POLL_SECONDS = int(os.environ.get('AUTO_PAYOUT_POLL_SECONDS', '60'))
+AUTO_PAYOUT_BATCH_SIZE = int(os.environ.get('AUTO_PAYOUT_BATCH_SIZE', '20'))
+AUTO_PAYOUT_RATE_PER_SECOND = float(os.environ.get('AUTO_PAYOUT_RATE_PER_SECOND', '2'))
+AUTO_PAYOUT_LEASE_SECONDS = int(os.environ.get('AUTO_PAYOUT_LEASE_SECONDS', '300'))
+AUTO_PAYOUT_MAX_ATTEMPTS = int(os.environ.get('AUTO_PAYOUT_MAX_ATTEMPTS', '5'))
+AUTO_PAYOUT_MAX_BACKOFF_SECONDS = 3600
+
+SECONDS_PER_DAY = 86400
+
+
+def next_run_time(frequency: str, barber_id: str, after: datetime) -> datetime:
+    """Next scheduled payout for a barber: the start of the next period plus a stable per-barber offset"""
+    day = after.replace(hour=0, minute=0, second=0, microsecond=0)
+    offset = timedelta(seconds=int(hashlib.sha256(barber_id.encode()).hexdigest(), 16) % SECONDS_PER_DAY)
+
+    if frequency == "daily":
+        candidate = day + offset
+        if candidate <= after:
+            candidate += timedelta(days=1)
+        return candidate
+
+    if frequency == "weekly":
+        candidate = day - timedelta(days=day.weekday()) + offset
+        while candidate <= after:
+            candidate += timedelta(days=7)
+        return candidate
+
+    # monthly
+    candidate = day.replace(day=1) + offset
+    while candidate <= after:
+        month_start = candidate.replace(day=1, hour=0, minute=0, second=0) + timedelta(days=32)
+        candidate = month_start.replace(day=1) + offset
+    return candidate
+
+
+class AutoPayoutScheduler:
+    """Polls for due wallets and runs their payouts through `run_payout`.
+
+    `run_payout(wallet, run_key)` returns a short outcome string ("paid", "skipped", ...)
+    and raises to ask for a retry; it must be idempotent for a given run_key.
+    """
+
+    def __init__(
+        self,
+        db,
+        run_payout: Callable[[dict, str], Awaitable[str]],
+        poll_seconds: int = AUTO_PAYOUT_POLL_SECONDS,
+        batch_size: int = AUTO_PAYOUT_BATCH_SIZE,
+        rate_per_second: float = AUTO_PAYOUT_RATE_PER_SECOND,
+        lease_seconds: int = AUTO_PAYOUT_LEASE_SECONDS,
+        max_attempts: int = AUTO_PAYOUT_MAX_ATTEMPTS
+    ):
+        self.db = db
+        self.run_payout = run_payout
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self.rate_per_second = rate_per_second
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.outcomes = {}
+        self.retries = 0
+        self.stuck = 0
+        self.last_run_at: Optional[str] = None
+
+    async def claim(self, now: datetime) -> Optional[dict]:
+        """Lease the most overdue wallet and pin its run key"""
+        now_iso = now.isoformat()
+        wallet = await self.db.wallets.find_one_and_update(
+            {
+                "auto_payout_next_run_at": {"$lte": now_iso},
+                "$or": [
+                    {"auto_payout_lease_until": {"$exists": False}},
+                    {"auto_payout_lease_until": {"$lte": now_iso}}
+                ]
+            },
+            {"$set": {"auto_payout_lease_until": (now + timedelta(seconds=self.lease_seconds)).isoformat()}},
+            sort=[("auto_payout_next_run_at", 1)],
+            projection={"_id": 0}
+        )
+        if wallet and not wallet.get("auto_payout_run_key"):
+            # Checkpoint: retries of this run reuse the same key and cannot pay twice
+            wallet["auto_payout_run_key"] = f"auto-{wallet['auto_payout_next_run_at']}"
+            await self.db.wallets.update_one(
+                {"barber_id": wallet["barber_id"]},
+                {"$set": {"auto_payout_run_key": wallet["auto_payout_run_key"]}}
+            )
+        return wallet
+
+    async def complete(self, wallet: dict, now: datetime):
+        """Finish the run and schedule the next period"""
+        config = wallet.get("auto_payout") or {}
+        await self.db.wallets.update_one(
+            {"barber_id": wallet["barber_id"]},
+            {
+                "$set": {
+                    "auto_payout_next_run_at": next_run_time(config.get("frequency", "weekly"), wallet["barber_id"], now).isoformat(),
+                    "auto_payout_attempts": 0
+                },
+                "$unset": {"auto_payout_run_key": "", "auto_payout_lease_until": "", "auto_payout_stuck_since": ""}
+            }
+        )
+
+    async def retry_later(self, wallet: dict, now: datetime, error: Exception):
+        """Back off and retry the same run; the run key is kept so a retry cannot pay twice"""
+        attempts = wallet.get("auto_payout_attempts", 0) + 1
+        update = {
+            "$set": {"auto_payout_attempts": attempts},
+            "$unset": {"auto_payout_lease_until": ""}
+        }
+        if attempts >= self.max_attempts:
+            # The payout may be in transit at Stripe: keep retrying hourly, flagged for an operator
+            self.stuck += 1
+            backoff = AUTO_PAYOUT_MAX_BACKOFF_SECONDS
+            update["$set"]["auto_payout_stuck_since"] = wallet.get("auto_payout_stuck_since") or now.isoformat()
+            logger.error(f"Auto payout for {wallet['barber_id']} stuck after {attempts} attempts, retrying in {backoff}s: {error}")
+        else:
+            self.retries += 1
+            backoff = min(60 * 2 ** attempts, AUTO_PAYOUT_MAX_BACKOFF_SECONDS)
+            logger.warning(f"Auto payout for {wallet['barber_id']} failed (attempt {attempts}), retrying in {backoff}s: {error}")
+        update["$set"]["auto_payout_next_run_at"] = (now + timedelta(seconds=backoff)).isoformat()
+        await self.db.wallets.update_one({"barber_id": wallet["barber_id"]}, update)
+
+    async def run_once(self) -> int:
+        """Process one rate-limited batch of due wallets; returns how many were claimed"""
+        processed = 0
+        interval = 1 / self.rate_per_second if self.rate_per_second > 0 else 0
+        for _ in range(self.batch_size):
+            now = datetime.now(timezone.utc)
+            wallet = await self.claim(now)
+            if not wallet:
+                break
+            started = asyncio.get_running_loop().time()
+            try:
+                outcome = await self.run_payout(wallet, wallet["auto_payout_run_key"])
+                self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+                await self.complete(wallet, now)
+            except Exception as e:
+                await self.retry_later(wallet, now, e)
+            processed += 1
+            # Spread Stripe calls evenly instead of firing the whole batch at once
+            await asyncio.sleep(max(0.0, interval - (asyncio.get_running_loop().time() - started)))
+        self.last_run_at = datetime.now(timezone.utc).isoformat()
+        return processed
+
+    async def run_forever(self):
+        while True:
+            try:
+                processed = await self.run_once()
+                if processed == self.batch_size:
+                    continue  # more wallets are due, keep draining
+            except Exception as e:
+                logger.error(f"Auto payout scheduler error: {e}")
+            await asyncio.sleep(self.poll_seconds)
+
+    def stats(self) -> dict:
+        return {
+            "outcomes": self.outcomes,
+            "retries": self.retries,
+            "stuck": self.stuck,
+            "last_run_at": self.last_run_at
+        }
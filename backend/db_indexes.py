@@ -0,0 +1,132 @@
+"""
+Database Indexes Module - declarative index registry for the ClickBarber API
+Features:
+- One registry of every index the hot query shapes rely on
+- Idempotent creation at startup with background builds
+- Explain-based report of query shapes that still fall back to a collection scan
+"""
+
+import logging
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# ============== INDEX REGISTRY ==============
+
+INDEX_REGISTRY = [
+    # Users: token resolution, login, nearby barber search
+    {"collection": "users", "keys": [("id", 1)], "unique": True},
+    {"collection": "users", "keys": [("email", 1)], "unique": True},
+    {"collection": "users", "keys": [("location", "2dsphere"), ("user_type", 1), ("is_online", 1)]},
+    {"collection": "users", "keys": [("user_type", 1), ("is_online", 1), ("id", 1)]},
+    {"collection": "users", "keys": [("stripe_account_id", 1)], "sparse": True},
+
+    # Queue: per-barber ordering, race-free joins, client lookups and history pages
+    {"collection": "queue", "keys": [("id", 1)], "unique": True},
+    {"collection": "queue", "keys": [("barber_id", 1), ("status", 1), ("ticket", 1)]},
+    {
+        "collection": "queue",
+        "keys": [("client_id", 1), ("barber_id", 1)],
+        "unique": True,
+        "partialFilterExpression": {"status": "waiting"}
+    },
+    {"collection": "queue", "keys": [("client_id", 1), ("created_at", -1), ("id", -1)]},
+    {"collection": "queue", "keys": [("barber_id", 1), ("created_at", -1), ("id", -1)]},
+    {"collection": "queue_counters", "keys": [("barber_id", 1)], "unique": True},
+
+    # Reviews
+    {"collection": "reviews", "keys": [("barber_id", 1), ("created_at", -1), ("id", -1)]},
+
+    # Wallet
+    {"collection": "wallets", "keys": [("barber_id", 1)], "unique": True},
+    {"collection": "wallets", "keys": [("auto_payout_next_run_at", 1)], "sparse": True},
+    {"collection": "transactions", "keys": [("barber_id", 1), ("created_at", -1), ("id", -1)]},
+    {"collection": "earnings_daily", "keys": [("barber_id", 1), ("day", 1)], "unique": True},
+    {"collection": "payouts", "keys": [("barber_id", 1), ("created_at", -1), ("id", -1)]},
+    {
+        "collection": "payouts",
+        "keys": [("status", 1), ("created_at", 1)],
+        "partialFilterExpression": {"status": "processing"}
+    },
+    {"collection": "pending_payments", "keys": [("session_id", 1)], "unique": True},
+    {"collection": "stripe_accounts", "keys": [("account_id", 1)], "unique": True},
+
+    # Ledger: idempotent journals, per-account postings and snapshots
+    {"collection": "ledger_journals", "keys": [("idempotency_key", 1)], "unique": True},
+    {"collection": "ledger_journals", "keys": [("barber_id", 1), ("created_at", -1)]},
+    {"collection": "ledger_postings", "keys": [("account", 1), ("created_at", 1)]},
+    {"collection": "ledger_postings", "keys": [("created_at", 1)]},
+    {"collection": "ledger_snapshots", "keys": [("account", 1)], "unique": True},
+
+    # Verification, subscriptions, referrals, password recovery
+    {"collection": "verifications", "keys": [("barber_id", 1)], "unique": True},
+    {"collection": "verifications", "keys": [("status", 1)]},
+    {"collection": "subscriptions", "keys": [("barber_id", 1)]},
+    {"collection": "referrals", "keys": [("user_id", 1)], "unique": True},
+    {"collection": "referrals", "keys": [("referral_code", 1)]},
+    {"collection": "referral_uses", "keys": [("user_id", 1)]},
+    {"collection": "password_resets", "keys": [("email", 1)]},
+]
+
+# Representative filters for the scan report, one per hot route
+QUERY_SHAPES = [
+    {"name": "get_current_user", "collection": "users", "filter": {"id": "x"}},
+    {"name": "login", "collection": "users", "filter": {"email": "x"}},
+    {"name": "get_barbers", "collection": "users", "filter": {"user_type": "barber", "is_online": True}, "sort": {"id": 1}},
+    {"name": "get_waiting_counts", "collection": "queue", "filter": {"barber_id": {"$in": ["x"]}, "status": "waiting"}},
+    {"name": "get_barber_queue", "collection": "queue", "filter": {"barber_id": "x", "status": {"$in": ["waiting", "in_progress"]}}, "sort": {"ticket": 1}},
+    {"name": "get_my_position", "collection": "queue", "filter": {"client_id": "x", "status": {"$in": ["waiting", "in_progress"]}}},
+    {"name": "get_queue_positions", "collection": "queue", "filter": {"barber_id": "x", "status": {"$in": ["waiting", "in_progress"]}, "ticket": {"$lt": 1}}},
+    {"name": "get_history", "collection": "queue", "filter": {"client_id": "x", "status": {"$in": ["completed", "cancelled"]}}, "sort": {"created_at": -1, "id": -1}},
+    {"name": "get_reviews", "collection": "reviews", "filter": {"barber_id": "x"}, "sort": {"created_at": -1, "id": -1}},
+    {"name": "get_wallet_transactions", "collection": "transactions", "filter": {"barber_id": "x"}, "sort": {"created_at": -1, "id": -1}},
+    {"name": "get_wallet_balance", "collection": "earnings_daily", "filter": {"barber_id": "x", "day": {"$gte": "2024-01-01"}}},
+    {"name": "auto_payout_claim", "collection": "wallets", "filter": {"auto_payout_next_run_at": {"$lte": "x"}}, "sort": {"auto_payout_next_run_at": 1}},
+    {"name": "get_wallet_payouts", "collection": "payouts", "filter": {"barber_id": "x"}, "sort": {"created_at": -1, "id": -1}},
+    {"name": "sweep_processing_payouts", "collection": "payouts", "filter": {"status": "processing", "created_at": {"$lte": "x"}}, "sort": {"created_at": 1}},
+    {"name": "confirm_payment", "collection": "pending_payments", "filter": {"session_id": "x"}},
+    {"name": "get_stripe_connect_status", "collection": "stripe_accounts", "filter": {"account_id": "x"}},
+    {"name": "ledger_balance", "collection": "ledger_postings", "filter": {"account": "wallet:x", "created_at": {"$gte": ""}}},
+    {"name": "get_pending_verifications", "collection": "verifications", "filter": {"status": "under_review"}},
+]
+
+# ============== HELPER FUNCTIONS ==============
+
+async def ensure_indexes(db, registry: Optional[List[dict]] = None):
+    """Create every registered index; existing indexes are left untouched"""
+    for spec in registry or INDEX_REGISTRY:
+        options = {k: v for k, v in spec.items() if k not in ("collection", "keys")}
+        try:
+            await db[spec["collection"]].create_index(spec["keys"], background=True, **options)
+        except Exception as e:
+            logger.warning(f"Index {spec['collection']}{spec['keys']}: {e}")
+    logger.info(f"Index registry applied ({len(registry or INDEX_REGISTRY)} indexes)")
+
+def _plan_stages(plan: dict) -> List[str]:
+    stages = [plan.get("stage")] if plan.get("stage") else []
+    for child_key in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(child_key), dict):
+            stages += _plan_stages(plan[child_key])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+async def report_collection_scans(db, shapes: Optional[List[dict]] = None) -> List[dict]:
+    """Explain each registered query shape and flag the ones planned as COLLSCAN"""
+    report = []
+    for shape in shapes or QUERY_SHAPES:
+        find = {"find": shape["collection"], "filter": shape["filter"]}
+        if shape.get("sort"):
+            find["sort"] = shape["sort"]
+        try:
+            explain = await db.command({"explain": find, "verbosity": "queryPlanner"})
+            stages = _plan_stages(explain["queryPlanner"]["winningPlan"])
+            report.append({
+                "name": shape["name"],
+                "collection": shape["collection"],
+                "stages": stages,
+                "collection_scan": "COLLSCAN" in stages
+            })
+        except Exception as e:
+            report.append({"name": shape["name"], "collection": shape["collection"], "error": str(e)})
+    return report
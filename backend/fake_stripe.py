@@ -0,0 +1,192 @@
+"""
+Fake Stripe Server - local stand-in for the Stripe endpoints the app calls
+Features:
+- Accounts, account links, login links, checkout sessions and transfers
+- Idempotency-Key replay, like the real API
+- Optional artificial latency (FAKE_STRIPE_LATENCY_MS) for load and timeout tests
+- Test helpers under /_fake to complete onboarding and pay sessions
+
+Run with: uvicorn fake_stripe:app --port 12111
+Then start the API with STRIPE_API_BASE=http://localhost:12111
+"""
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from urllib.parse import parse_qsl
+import asyncio
+import json
+import os
+import re
+import uuid
+
+app = FastAPI(title="Fake Stripe")
+
+FAKE_STRIPE_LATENCY_MS = int(os.environ.get('FAKE_STRIPE_LATENCY_MS', '0'))
+
+accounts = {}
+sessions = {}
+transfers = {}
+idempotent_responses = {}
+request_log = []
+
+# ============== HELPERS ==============
+
+def unflatten(pairs) -> dict:
+    """Turn Stripe form keys like metadata[barber_id] into nested dicts"""
+    result = {}
+    for key, value in pairs:
+        parts = re.findall(r"[^\[\]]+", key)
+        node = result
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = value
+    return result
+
+def new_id(prefix: str) -> str:
+    return f"{prefix}_fake_{uuid.uuid4().hex[:16]}"
+
+def not_found(kind: str, object_id: str) -> JSONResponse:
+    return JSONResponse(status_code=404, content={"error": {
+        "type": "invalid_request_error",
+        "message": f"No such {kind}: '{object_id}'"
+    }})
+
+@app.middleware("http")
+async def stripe_semantics(request: Request, call_next):
+    """Latency injection, request log and Idempotency-Key replay"""
+    if request.url.path.startswith("/_fake"):
+        return await call_next(request)
+
+    request_log.append({"method": request.method, "path": request.url.path})
+    if FAKE_STRIPE_LATENCY_MS:
+        await asyncio.sleep(FAKE_STRIPE_LATENCY_MS / 1000)
+
+    key = request.headers.get("idempotency-key")
+    if request.method == "POST" and key:
+        cache_key = (request.url.path, key)
+        if cache_key in idempotent_responses:
+            status_code, content = idempotent_responses[cache_key]
+            return JSONResponse(status_code=status_code, content=content, headers={"Idempotent-Replayed": "true"})
+        response = await call_next(request)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        content = json.loads(body)
+        idempotent_responses[cache_key] = (response.status_code, content)
+        return JSONResponse(status_code=response.status_code, content=content)
+
+    return await call_next(request)
+
+async def form(request: Request) -> dict:
+    return unflatten(parse_qsl((await request.body()).decode()))
+
+# ============== CONNECT ==============
+
+@app.post("/v1/accounts")
+async def create_account(request: Request):
+    params = await form(request)
+    account = {
+        "id": new_id("acct"),
+        "object": "account",
+        "type": params.get("type", "express"),
+        "email": params.get("email"),
+        "country": params.get("country"),
+        "charges_enabled": False,
+        "payouts_enabled": False,
+        "details_submitted": False,
+        "requirements": {"currently_due": ["external_account"], "disabled_reason": "requirements.past_due"},
+        "metadata": params.get("metadata", {})
+    }
+    accounts[account["id"]] = account
+    return account
+
+@app.get("/v1/accounts/{account_id}")
+async def retrieve_account(account_id: str):
+    if account_id not in accounts:
+        return not_found("account", account_id)
+    return accounts[account_id]
+
+@app.post("/v1/account_links")
+async def create_account_link(request: Request):
+    params = await form(request)
+    return {
+        "object": "account_link",
+        "url": f"{request.base_url}_fake/onboarding/{params.get('account')}",
+        "expires_at": 0
+    }
+
+@app.post("/v1/accounts/{account_id}/login_links")
+async def create_login_link(account_id: str, request: Request):
+    if account_id not in accounts:
+        return not_found("account", account_id)
+    return {"object": "login_link", "url": f"{request.base_url}_fake/dashboard/{account_id}"}
+
+# ============== CHECKOUT AND TRANSFERS ==============
+
+@app.post("/v1/checkout/sessions")
+async def create_checkout_session(request: Request):
+    params = await form(request)
+    session_id = new_id("cs")
+    session = {
+        "id": session_id,
+        "object": "checkout.session",
+        "mode": params.get("mode"),
+        "url": f"{request.base_url}_fake/checkout/{session_id}",
+        "status": "open",
+        "payment_status": "unpaid",
+        "metadata": params.get("metadata", {})
+    }
+    sessions[session_id] = session
+    return session
+
+@app.get("/v1/checkout/sessions/{session_id}")
+async def retrieve_checkout_session(session_id: str):
+    if session_id not in sessions:
+        return not_found("checkout.session", session_id)
+    return sessions[session_id]
+
+@app.post("/v1/transfers")
+async def create_transfer(request: Request):
+    params = await form(request)
+    if params.get("destination") not in accounts:
+        return not_found("account", params.get("destination"))
+    transfer = {
+        "id": new_id("tr"),
+        "object": "transfer",
+        "amount": int(params.get("amount", 0)),
+        "currency": params.get("currency"),
+        "destination": params.get("destination"),
+        "metadata": params.get("metadata", {})
+    }
+    transfers[transfer["id"]] = transfer
+    return transfer
+
+# ============== TEST HELPERS ==============
+
+@app.post("/_fake/accounts/{account_id}/complete")
+async def complete_onboarding(account_id: str):
+    if account_id not in accounts:
+        return not_found("account", account_id)
+    accounts[account_id].update({
+        "charges_enabled": True,
+        "payouts_enabled": True,
+        "details_submitted": True,
+        "requirements": {"currently_due": [], "disabled_reason": None}
+    })
+    return accounts[account_id]
+
+@app.post("/_fake/checkout/{session_id}/pay")
+async def pay_session(session_id: str):
+    if session_id not in sessions:
+        return not_found("checkout.session", session_id)
+    sessions[session_id].update({"status": "complete", "payment_status": "paid"})
+    return sessions[session_id]
+
+@app.get("/_fake/requests")
+async def get_request_log():
+    return {"requests": request_log}
+
+@app.post("/_fake/reset")
+async def reset():
+    for store in (accounts, sessions, transfers, idempotent_responses):
+        store.clear()
+    request_log.clear()
+    return {"reset": True}
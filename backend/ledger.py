@@ -0,0 +1,215 @@
+"""
+Ledger Module - append-only double-entry wallet ledger
+Features:
+- Every money movement is a journal whose postings sum to zero (amounts in integer cents)
+- Idempotency keys: a journal key can only ever be posted once
+- Multi-document transactions around journal + wallet + history writes
+- Periodic snapshots of account totals; balances = snapshot + postings since the snapshot
+- Reconciliation of the O(1) wallet read model against the ledger, with or without transactions
+"""
+
+import os
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+LEDGER_SNAPSHOT_LAG_SECONDS = int(os.environ.get('LEDGER_SNAPSHOT_LAG_SECONDS', '300'))
+# Without transactions a journal and its wallet update land moments apart; drift must
+# survive this long unchanged before it is corrected
+LEDGER_RECONCILE_SETTLE_SECONDS = float(os.environ.get('LEDGER_RECONCILE_SETTLE_SECONDS', '2'))
+
+# ============== ACCOUNTS ==============
+
+PLATFORM_FEES = "platform:fees"
+STRIPE_CLEARING = "platform:stripe_clearing"
+OPENING_BALANCES = "platform:opening_balances"
+
+def wallet_account(barber_id: str) -> str:
+    return f"wallet:{barber_id}"
+
+def payouts_in_transit_account(barber_id: str) -> str:
+    return f"payouts_in_transit:{barber_id}"
+
+def to_cents(amount: float) -> int:
+    return int(round(amount * 100))
+
+# ============== ERRORS ==============
+
+class JournalAlreadyPosted(Exception):
+    """The idempotency key was used before; `journal` is the original posting"""
+
+    def __init__(self, journal: dict):
+        super().__init__(journal["idempotency_key"])
+        self.journal = journal
+
+class InsufficientFunds(Exception):
+    """The wallet cannot cover the requested debit"""
+
+# ============== LEDGER ==============
+
+class Ledger:
+    """Posts balanced journals and derives account balances from snapshots"""
+
+    def __init__(self, client, db, settle_seconds: float = LEDGER_RECONCILE_SETTLE_SECONDS):
+        self.client = client
+        self.db = db
+        self.settle_seconds = settle_seconds
+        self.transactions_supported: Optional[bool] = None
+
+    async def run_transaction(self, fn: Callable[[Optional[object]], Awaitable]):
+        """Run `fn(session)` in a multi-document transaction.
+
+        Standalone servers (dev) cannot run transactions; there `fn(None)` runs
+        unwrapped and the journal idempotency key is still the retry guard.
+        """
+        if self.transactions_supported is not False:
+            try:
+                async with await self.client.start_session() as session:
+                    result = await session.with_transaction(fn)
+                self.transactions_supported = True
+                return result
+            except OperationFailure as e:
+                if e.code != 20:  # IllegalOperation: not a replica set
+                    raise
+                self.transactions_supported = False
+                logger.warning("MongoDB transactions unavailable; ledger writes run without a transaction")
+        return await fn(None)
+
+    async def post(
+        self,
+        idempotency_key: str,
+        journal_type: str,
+        postings: List[Tuple[str, int]],
+        session=None,
+        barber_id: Optional[str] = None,
+        metadata: Optional[dict] = None
+    ) -> dict:
+        """Append one balanced journal; raises JournalAlreadyPosted on a reused key"""
+        if sum(amount for _, amount in postings) != 0:
+            raise ValueError(f"Unbalanced journal {idempotency_key}: {postings}")
+
+        now = datetime.now(timezone.utc).isoformat()
+        journal = {
+            "id": str(uuid.uuid4()),
+            "idempotency_key": idempotency_key,
+            "type": journal_type,
+            "barber_id": barber_id,
+            "metadata": metadata or {},
+            "created_at": now
+        }
+        try:
+            await self.db.ledger_journals.insert_one(journal, session=session)
+        except DuplicateKeyError:
+            existing = await self.db.ledger_journals.find_one({"idempotency_key": idempotency_key}, {"_id": 0})
+            if not existing:
+                raise
+            raise JournalAlreadyPosted(existing)
+        journal.pop("_id", None)
+
+        await self.db.ledger_postings.insert_many([
+            {
+                "id": str(uuid.uuid4()),
+                "journal_id": journal["id"],
+                "account": account,
+                "amount_cents": amount,
+                "created_at": now
+            }
+            for account, amount in postings if amount
+        ], session=session)
+        return journal
+
+    async def balance(self, account: str, session=None) -> int:
+        """Snapshot total plus every posting since the snapshot, in cents"""
+        state = await self.db.ledger_snapshot_state.find_one({"_id": "global"}, session=session) or {}
+        through = state.get("through", "")
+        snapshot = await self.db.ledger_snapshots.find_one({"account": account}, session=session) or {}
+        delta = await self.db.ledger_postings.aggregate([
+            {"$match": {"account": account, "created_at": {"$gte": through}}},
+            {"$group": {"_id": None, "total": {"$sum": "$amount_cents"}}}
+        ], session=session).to_list(1)
+        return snapshot.get("balance_cents", 0) + (delta[0]["total"] if delta else 0)
+
+    async def snapshot(self, lag_seconds: int = LEDGER_SNAPSHOT_LAG_SECONDS) -> int:
+        """Fold postings older than `lag_seconds` into per-account snapshot totals.
+
+        The lag leaves room for transactions still in flight when the snapshot runs.
+        Returns the number of accounts updated.
+        """
+        cutoff = (datetime.now(timezone.utc) - timedelta(seconds=lag_seconds)).isoformat()
+
+        async def fold(session):
+            state = await self.db.ledger_snapshot_state.find_one({"_id": "global"}, session=session) or {}
+            through = state.get("through", "")
+            if cutoff <= through:
+                return 0
+            # Claim the window first so two workers never fold the same postings
+            if state:
+                claimed = await self.db.ledger_snapshot_state.update_one(
+                    {"_id": "global", "through": through}, {"$set": {"through": cutoff}}, session=session
+                )
+                if claimed.modified_count == 0:
+                    return 0
+            else:
+                try:
+                    await self.db.ledger_snapshot_state.insert_one({"_id": "global", "through": cutoff}, session=session)
+                except DuplicateKeyError:
+                    return 0
+            totals = await self.db.ledger_postings.aggregate([
+                {"$match": {"created_at": {"$gte": through, "$lt": cutoff}}},
+                {"$group": {"_id": "$account", "total": {"$sum": "$amount_cents"}}}
+            ], session=session).to_list(None)
+            for row in totals:
+                await self.db.ledger_snapshots.update_one(
+                    {"account": row["_id"]},
+                    {"$inc": {"balance_cents": row["total"]}, "$set": {"through": cutoff}},
+                    upsert=True,
+                    session=session
+                )
+            return len(totals)
+
+        return await self.run_transaction(fold)
+
+    async def _compare_wallet(self, barber_id: str, session=None) -> Tuple[Optional[float], int]:
+        """The wallet's stored balance (None without a wallet) and the ledger balance in cents"""
+        wallet = await self.db.wallets.find_one({"barber_id": barber_id}, {"_id": 0, "available_balance": 1}, session=session)
+        expected = await self.balance(wallet_account(barber_id), session=session)
+        return (wallet or {}).get("available_balance"), expected
+
+    async def reconcile_wallet(self, barber_id: str) -> bool:
+        """Compare one wallet read model with the ledger and correct it; returns True when it drifted.
+
+        With transactions the comparison and the fix are atomic. Without them a concurrent
+        posting can look like drift, so the wallet is only corrected when the same drift is
+        still there after `settle_seconds`, and only if its balance did not move meanwhile.
+        """
+        async def check(session):
+            stored, expected = await self._compare_wallet(barber_id, session=session)
+            if stored is None or to_cents(stored) == expected:
+                return False
+            if session is None:
+                await asyncio.sleep(self.settle_seconds)
+                if await self._compare_wallet(barber_id) != (stored, expected):
+                    return False  # still moving: a posting was in flight
+            logger.warning(f"Wallet {barber_id} drifted: stored {stored}, ledger {expected / 100}")
+            await self.db.wallets.update_one(
+                {"barber_id": barber_id, "available_balance": stored},
+                {"$set": {"available_balance": expected / 100}},
+                session=session
+            )
+            return True
+
+        return await self.run_transaction(check)
+
+    async def reconcile_wallets(self) -> int:
+        """Reconcile every ledger-backed wallet; returns the number that drifted"""
+        drifted = 0
+        async for wallet in self.db.wallets.find({"ledger_opened": True}, {"_id": 0, "barber_id": 1}):
+            if await self.reconcile_wallet(wallet["barber_id"]):
+                drifted += 1
+        return drifted
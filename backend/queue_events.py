@@ -0,0 +1,203 @@
+"""
+Queue Events Module - WebSocket push channel for live queue updates
+Features:
+- One topic per barber: barbers follow their own queue, clients follow the barbers they queue with
+- Events for join, leave and status changes, each carrying refreshed positions and ETAs
+- Initial snapshot on connect so clients never need to poll
+- Clients see other entries without who holds them; their own entries are flagged `mine`
+- Fan-out sends run concurrently with a timeout, so one slow socket cannot hold up the topic
+- Ping/pong keepalive
+"""
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+import os
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Will be set by main server.py
+resolve_token: Optional[Callable[[str], Awaitable[Optional[dict]]]] = None
+load_queue: Optional[Callable[[str], Awaitable[List[dict]]]] = None
+resolve_client_topics: Optional[Callable[[str], Awaitable[List[str]]]] = None
+
+queue_events_router = APIRouter(prefix="/api/queue", tags=["queue-events"])
+
+# Fields a client may see about other people's entries
+PUBLIC_ENTRY_FIELDS = ("id", "status", "position", "estimated_wait")
+QUEUE_EVENT_SEND_TIMEOUT_SECONDS = float(os.environ.get('QUEUE_EVENT_SEND_TIMEOUT_SECONDS', '5'))
+
+def public_queue(queue: List[dict], user_id: str) -> List[dict]:
+    """Queue as a client sees it: public fields only, with the client's own entries marked"""
+    return [
+        {**{field: q.get(field) for field in PUBLIC_ENTRY_FIELDS}, "mine": q.get("client_id") == user_id}
+        for q in queue
+    ]
+
+# ============== CONNECTION MANAGER ==============
+
+class QueueConnectionManager:
+    """Manages WebSocket connections subscribed to per-barber queue topics"""
+
+    def __init__(self):
+        self.topics: Dict[str, Set[WebSocket]] = {}  # barber_id -> websockets
+        self.user_sockets: Dict[str, Set[WebSocket]] = {}  # user_id -> websockets
+        self.socket_info: Dict[WebSocket, dict] = {}  # websocket -> {user_id, user_type, topics}
+
+    async def connect(self, websocket: WebSocket, user: dict):
+        await websocket.accept()
+        self.user_sockets.setdefault(user["id"], set()).add(websocket)
+        self.socket_info[websocket] = {"user_id": user["id"], "user_type": user["user_type"], "topics": set()}
+        logger.info(f"User {user['id']} connected to queue events")
+
+    def disconnect(self, websocket: WebSocket):
+        info = self.socket_info.pop(websocket, None)
+        if not info:
+            return
+        for barber_id in info["topics"]:
+            self._remove_from_topic(barber_id, websocket)
+        sockets = self.user_sockets.get(info["user_id"])
+        if sockets:
+            sockets.discard(websocket)
+            if not sockets:
+                del self.user_sockets[info["user_id"]]
+        logger.info(f"User {info['user_id']} disconnected from queue events")
+
+    def subscribe(self, websocket: WebSocket, barber_id: str):
+        if websocket not in self.socket_info:
+            return
+        self.topics.setdefault(barber_id, set()).add(websocket)
+        self.socket_info[websocket]["topics"].add(barber_id)
+
+    def unsubscribe(self, websocket: WebSocket, barber_id: str):
+        if websocket in self.socket_info:
+            self.socket_info[websocket]["topics"].discard(barber_id)
+        self._remove_from_topic(barber_id, websocket)
+
+    def subscribe_user(self, user_id: str, barber_id: str):
+        """Follow a barber's queue on every socket the user has open"""
+        for websocket in list(self.user_sockets.get(user_id, ())):
+            self.subscribe(websocket, barber_id)
+
+    def has_subscribers(self, barber_id: str) -> bool:
+        return bool(self.topics.get(barber_id))
+
+    def _remove_from_topic(self, barber_id: str, websocket: WebSocket):
+        sockets = self.topics.get(barber_id)
+        if sockets:
+            sockets.discard(websocket)
+            if not sockets:
+                del self.topics[barber_id]
+
+    async def _send(self, websocket: WebSocket, message: dict) -> bool:
+        try:
+            await asyncio.wait_for(websocket.send_json(message), timeout=QUEUE_EVENT_SEND_TIMEOUT_SECONDS)
+            return True
+        except Exception as e:
+            info = self.socket_info.get(websocket) or {}
+            logger.error(f"Error sending queue event to {info.get('user_id')}: {e!r}")
+            return False
+
+    async def publish(self, barber_id: str, event: dict, queue: List[dict]):
+        """Send an event with the barber's current queue to everyone on the topic"""
+        sends = []
+        for websocket in list(self.topics.get(barber_id, ())):
+            info = self.socket_info.get(websocket)
+            if not info:
+                continue
+            is_owner = info["user_type"] == "barber" and info["user_id"] == barber_id
+            entries = queue if is_owner else public_queue(queue, info["user_id"])
+            sends.append((websocket, {**event, "barber_id": barber_id, "queue": entries}))
+
+        results = await asyncio.gather(*(self._send(websocket, message) for websocket, message in sends))
+        for (websocket, _), sent in zip(sends, results):
+            if not sent:
+                self.disconnect(websocket)
+
+queue_manager = QueueConnectionManager()
+
+# Strong references to in-flight publishes; the event loop only keeps weak ones
+_publish_tasks: Set[asyncio.Task] = set()
+
+# ============== HELPER FUNCTIONS ==============
+
+def init_queue_events(token_resolver, queue_loader, client_topics_resolver):
+    """Initialize the module with the app's token, queue and client-topic resolvers"""
+    global resolve_token, load_queue, resolve_client_topics
+    resolve_token = token_resolver
+    load_queue = queue_loader
+    resolve_client_topics = client_topics_resolver
+
+async def publish_queue_event(barber_id: str, event_type: str, entry_id: Optional[str] = None):
+    """Push the refreshed queue to subscribers; skips the query when nobody listens"""
+    if not queue_manager.has_subscribers(barber_id):
+        return
+    try:
+        queue = await load_queue(barber_id)
+        await queue_manager.publish(barber_id, {"type": event_type, "entry_id": entry_id}, queue)
+    except Exception as e:
+        logger.error(f"Error publishing queue event for barber {barber_id}: {e}")
+
+def notify_queue_changed(barber_id: str, event_type: str, entry_id: Optional[str] = None):
+    """Fire-and-forget publish so request handlers never wait on slow sockets"""
+    if queue_manager.has_subscribers(barber_id):
+        task = asyncio.create_task(publish_queue_event(barber_id, event_type, entry_id))
+        _publish_tasks.add(task)
+        task.add_done_callback(_publish_tasks.discard)
+
+async def send_snapshot(websocket: WebSocket, barber_id: str):
+    queue = await load_queue(barber_id)
+    info = queue_manager.socket_info[websocket]
+    is_owner = info["user_type"] == "barber" and info["user_id"] == barber_id
+    await websocket.send_json({
+        "type": "snapshot",
+        "barber_id": barber_id,
+        "queue": queue if is_owner else public_queue(queue, info["user_id"])
+    })
+
+# ============== WEBSOCKET ENDPOINT ==============
+
+@queue_events_router.websocket("/ws")
+async def queue_websocket(websocket: WebSocket, token: str = Query(...)):
+    """WebSocket endpoint for live queue updates.
+
+    Client frames: {"type": "subscribe" | "unsubscribe", "barber_id": ...} and {"type": "ping"}.
+    """
+    user = await resolve_token(token)
+    if not user:
+        await websocket.close(code=4001, reason="Invalid token")
+        return
+
+    await queue_manager.connect(websocket, user)
+
+    try:
+        # Follow the barber's own queue, or every queue the client is currently in
+        if user["user_type"] == "barber":
+            initial_topics = [user["id"]]
+        else:
+            initial_topics = await resolve_client_topics(user["id"])
+
+        for barber_id in initial_topics:
+            queue_manager.subscribe(websocket, barber_id)
+            await send_snapshot(websocket, barber_id)
+
+        while True:
+            data = await websocket.receive_json()
+
+            if data.get("type") == "subscribe" and data.get("barber_id"):
+                queue_manager.subscribe(websocket, data["barber_id"])
+                await send_snapshot(websocket, data["barber_id"])
+
+            elif data.get("type") == "unsubscribe" and data.get("barber_id"):
+                queue_manager.unsubscribe(websocket, data["barber_id"])
+
+            elif data.get("type") == "ping":
+                await websocket.send_json({"type": "pong"})
+
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Queue WebSocket error for user {user['id']}: {e}")
+    finally:
+        queue_manager.disconnect(websocket)
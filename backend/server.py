@@ -1,14 +1,18 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 import os
+import sys
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from typing import List, Literal, Optional
 import uuid
+import asyncio
 from datetime import datetime, timezone, timedelta
 import hashlib
 import jwt
@@ -16,21 +20,42 @@ import math
 import stripe
 import resend
 
+# Helpers shared by every backend live in shared/ at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from shared.user_cache import user_cache
+from shared.hydrate import hydrate
+from shared.pagination import decode_cursor, encode_cursor, fetch_page
+from shared.payment_gateway import PaymentGateway
+from shared.connect_status import ConnectStatusCache
+from ledger import (
+    Ledger, JournalAlreadyPosted, InsufficientFunds, wallet_account, payouts_in_transit_account,
+    to_cents, PLATFORM_FEES, STRIPE_CLEARING, OPENING_BALANCES
+)
+from db_indexes import ensure_indexes, report_collection_scans
+from auto_payouts import AutoPayoutScheduler, next_run_time
+from queue_events import queue_events_router, init_queue_events, queue_manager, notify_queue_changed
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
+ledger = Ledger(client, db)
 
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer(auto_error=False)
 
 JWT_SECRET = os.environ.get('JWT_SECRET', 'barberx-secret-key-2024')
+LEDGER_SNAPSHOT_INTERVAL_SECONDS = int(os.environ.get('LEDGER_SNAPSHOT_INTERVAL_SECONDS', '3600'))
+PAYOUT_SWEEP_INTERVAL_SECONDS = int(os.environ.get('PAYOUT_SWEEP_INTERVAL_SECONDS', '300'))
+PAYOUT_SWEEP_AFTER_SECONDS = int(os.environ.get('PAYOUT_SWEEP_AFTER_SECONDS', '600'))
 
 # Stripe configuration
-stripe.api_key = os.environ.get('STRIPE_API_KEY', '')
+payment_gateway = PaymentGateway(api_key=os.environ.get('STRIPE_API_KEY', ''))
+STRIPE_CONNECT_WEBHOOK_SECRET = os.environ.get('STRIPE_CONNECT_WEBHOOK_SECRET', '')
 FRONTEND_URL = os.environ.get('FRONTEND_URL', 'http://localhost:3000')
 
 # Resend configuration for emails
@@ -43,7 +68,7 @@ class UserRegister(BaseModel):
     email: str
     password: str
     phone: str
-    user_type: str  # 'client' or 'barber'
+    user_type: Literal["client", "barber"]
     # Barber specific fields
     specialty: Optional[str] = None
     services: Optional[List[dict]] = None
@@ -89,7 +114,8 @@ class QueueEntry(BaseModel):
     barber_id: str
     service: dict
     status: str = "waiting"  # waiting, in_progress, completed, cancelled
-    position: int = 0
+    ticket: int = 0  # per-barber monotonic sequence, orders the queue
+    position: int = 0  # rank among active entries, computed at read time
     estimated_wait: int = 0  # minutes
     # Home service fields
     is_home_service: bool = False
@@ -138,11 +164,28 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     payload = decode_token(credentials.credentials)
     if not payload:
         raise HTTPException(status_code=401, detail="Invalid token")
-    user = await db.users.find_one({"id": payload["user_id"]}, {"_id": 0, "password": 0})
+    user = await user_cache.get_or_load(payload["user_id"], load_user)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     return user
 
+async def get_admin_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    user = await get_current_user(credentials)
+    # is_admin is granted by an operator directly in the database; no route sets it
+    if user.get("is_admin") is not True:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
+
+async def load_user(user_id: str) -> Optional[dict]:
+    return await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+
+async def resolve_token_user(token: str) -> Optional[dict]:
+    """Resolve a raw JWT (e.g. from a WebSocket query string) to a user"""
+    payload = decode_token(token)
+    if not payload:
+        return None
+    return await user_cache.get_or_load(payload["user_id"], load_user)
+
 def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """Calculate distance in km using Haversine formula"""
     R = 6371  # Earth's radius in km
@@ -152,6 +195,80 @@ def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
     return R * c
 
+def geo_point(latitude: Optional[float], longitude: Optional[float]) -> Optional[dict]:
+    """Build a GeoJSON point for the 2dsphere index (GeoJSON is [lon, lat])"""
+    if latitude is None or longitude is None:
+        return None
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+# Queue entries still holding a spot in line
+ACTIVE_QUEUE_STATUSES = ["waiting", "in_progress"]
+
+async def next_queue_ticket(barber_id: str) -> int:
+    """Atomically take the next ticket from the barber's queue counter"""
+    counter = await db.queue_counters.find_one_and_update(
+        {"barber_id": barber_id},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
+
+async def get_queue_position(entry: dict) -> int:
+    """Rank of an entry among the barber's active entries (1 = next)"""
+    ahead = await db.queue.count_documents({
+        "barber_id": entry["barber_id"],
+        "status": {"$in": ACTIVE_QUEUE_STATUSES},
+        "ticket": {"$lt": entry["ticket"]}
+    })
+    return ahead + 1
+
+async def get_queue_positions(entries: List[dict]) -> List[int]:
+    """Ranks of several entries, in one aggregation instead of a count per entry"""
+    if not entries:
+        return []
+    ahead_of = lambda e: {"$and": [{"$eq": ["$barber_id", e["barber_id"]]}, {"$lt": ["$ticket", e["ticket"]]}]}
+    result = await db.queue.aggregate([
+        {"$match": {
+            "status": {"$in": ACTIVE_QUEUE_STATUSES},
+            "$or": [{"barber_id": e["barber_id"], "ticket": {"$lt": e["ticket"]}} for e in entries]
+        }},
+        {"$group": {
+            "_id": None,
+            **{f"e{i}": {"$sum": {"$cond": [ahead_of(e), 1, 0]}} for i, e in enumerate(entries)}
+        }}
+    ]).to_list(1)
+    ahead = result[0] if result else {}
+    return [ahead.get(f"e{i}", 0) + 1 for i in range(len(entries))]
+
+def apply_queue_position(entry: dict, position: int):
+    entry["position"] = position
+    entry["estimated_wait"] = position * entry.get("service", {}).get("duration", 30)
+
+async def load_active_queue(barber_id: str) -> List[dict]:
+    """Active entries of a barber in ticket order, with positions and ETAs applied"""
+    queue = await db.queue.find(
+        {"barber_id": barber_id, "status": {"$in": ACTIVE_QUEUE_STATUSES}},
+        {"_id": 0}
+    ).sort("ticket", 1).to_list(50)
+    for index, q in enumerate(queue):
+        apply_queue_position(q, index + 1)
+    return queue
+
+async def get_client_queue_barbers(client_id: str) -> List[str]:
+    """Barbers whose queue a client is currently in"""
+    return await db.queue.distinct("barber_id", {"client_id": client_id, "status": {"$in": ACTIVE_QUEUE_STATUSES}})
+
+async def get_waiting_counts(barber_ids: List[str]) -> dict:
+    """Count waiting clients for many barbers with a single $group aggregation"""
+    if not barber_ids:
+        return {}
+    counts = await db.queue.aggregate([
+        {"$match": {"barber_id": {"$in": barber_ids}, "status": "waiting"}},
+        {"$group": {"_id": "$barber_id", "count": {"$sum": 1}}}
+    ]).to_list(len(barber_ids))
+    return {c["_id"]: c["count"] for c in counts}
+
 # ==================== AUTH ROUTES ====================
 
 @api_router.post("/auth/register")
@@ -166,6 +283,8 @@ async def register(input: UserRegister):
     doc = user.model_dump()
     doc["password"] = user_data["password"]
     doc["created_at"] = doc["created_at"].isoformat()
+    if user.user_type == "barber":
+        doc["location"] = geo_point(user.latitude, user.longitude)
     
     await db.users.insert_one(doc)
     token = create_token(user.id, user.user_type)
@@ -296,10 +415,13 @@ async def reset_password(request: ResetPasswordRequest):
     
     # Update password
     hashed_password = hash_password(request.new_password)
-    await db.users.update_one(
+    updated_user = await db.users.find_one_and_update(
         {"email": request.email},
-        {"$set": {"password": hashed_password}}
+        {"$set": {"password": hashed_password}},
+        projection={"id": 1}
     )
+    if updated_user:
+        user_cache.invalidate(updated_user["id"])
     
     # Mark code as used
     await db.password_resets.update_one(
@@ -312,30 +434,78 @@ async def reset_password(request: ResetPasswordRequest):
 # ==================== BARBER ROUTES ====================
 
 @api_router.get("/barbers")
-async def get_barbers(lat: Optional[float] = None, lon: Optional[float] = None, online_only: bool = False):
+async def get_barbers(
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
+    online_only: bool = False,
+    radius_km: Optional[float] = Query(None, gt=0),
+    limit: int = Query(100, ge=1, le=200),
+    cursor: Optional[str] = None
+):
+    """List barbers, nearest first when coordinates are given, with the next page token as `next_cursor`"""
     query = {"user_type": "barber"}
     if online_only:
         query["is_online"] = True
     
-    barbers = await db.users.find(query, {"_id": 0, "password": 0}).to_list(100)
+    page_state = decode_cursor(cursor) if cursor else None
+    
+    if lat is not None and lon is not None:
+        # Nearby search runs in MongoDB against the 2dsphere index on `location`
+        geo_near = {
+            "near": geo_point(lat, lon),
+            "distanceField": "distance_m",
+            "spherical": True,
+            "query": query
+        }
+        if radius_km:
+            geo_near["maxDistance"] = radius_km * 1000
+        pipeline = [{"$geoNear": geo_near}]
+        if page_state:
+            if "d" not in page_state or "id" not in page_state:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            # Resume after the last (distance, id) seen: minDistance prunes the index scan,
+            # and id breaks ties between barbers at exactly that distance
+            geo_near["minDistance"] = page_state["d"]
+            pipeline.append({"$match": {"$or": [
+                {"distance_m": {"$gt": page_state["d"]}},
+                {"distance_m": page_state["d"], "id": {"$gt": page_state["id"]}}
+            ]}})
+        
+        # $geoNear orders by distance only; the id tie-break makes page boundaries stable
+        barbers = await db.users.aggregate(pipeline + [
+            {"$sort": {"distance_m": 1, "id": 1}},
+            {"$limit": limit + 1},
+            {"$project": {"_id": 0, "password": 0}}
+        ]).to_list(limit + 1)
+    else:
+        if page_state:
+            if "id" not in page_state:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            query["id"] = {"$gt": page_state["id"]}
+        barbers = await db.users.find(query, {"_id": 0, "password": 0}).sort("id", 1).limit(limit + 1).to_list(limit + 1)
+    
+    has_more = len(barbers) > limit
+    barbers = barbers[:limit]
+    
+    next_cursor = None
+    if has_more:
+        last = barbers[-1]
+        if "distance_m" in last:
+            next_cursor = encode_cursor({"d": last["distance_m"], "id": last["id"]})
+        else:
+            next_cursor = encode_cursor({"id": last["id"]})
+    
+    # Queue counts for the whole page in one round trip
+    queue_counts = await get_waiting_counts([b["id"] for b in barbers])
     
     for b in barbers:
         if isinstance(b.get("created_at"), str):
             b["created_at"] = datetime.fromisoformat(b["created_at"])
-        # Calculate distance if coordinates provided
-        if lat and lon and b.get("latitude") and b.get("longitude"):
-            b["distance"] = round(calculate_distance(lat, lon, b["latitude"], b["longitude"]), 1)
-        else:
-            b["distance"] = None
-        # Get queue count
-        queue_count = await db.queue.count_documents({"barber_id": b["id"], "status": "waiting"})
-        b["queue_count"] = queue_count
-    
-    # Sort by distance if provided
-    if lat and lon:
-        barbers = sorted(barbers, key=lambda x: x.get("distance") or 9999)
+        distance_m = b.pop("distance_m", None)
+        b["distance"] = round(distance_m / 1000, 1) if distance_m is not None else None
+        b["queue_count"] = queue_counts.get(b["id"], 0)
     
-    return barbers
+    return {"barbers": barbers, "next_cursor": next_cursor}
 
 @api_router.get("/barbers/{barber_id}")
 async def get_barber(barber_id: str):
@@ -354,7 +524,10 @@ async def get_barber(barber_id: str):
     barber["reviews"] = reviews
     
     # Get queue
-    queue = await db.queue.find({"barber_id": barber_id, "status": "waiting"}, {"_id": 0}).sort("position", 1).to_list(50)
+    queue = await db.queue.find({"barber_id": barber_id, "status": "waiting"}, {"_id": 0}).sort("ticket", 1).to_list(50)
+    in_progress = await db.queue.count_documents({"barber_id": barber_id, "status": "in_progress"})
+    for index, q in enumerate(queue):
+        apply_queue_position(q, in_progress + index + 1)
     barber["queue"] = queue
     
     return barber
@@ -365,6 +538,7 @@ async def update_status(is_online: bool, user: dict = Depends(get_current_user))
         raise HTTPException(status_code=403, detail="Only barbers can update status")
     
     await db.users.update_one({"id": user["id"]}, {"$set": {"is_online": is_online}})
+    user_cache.invalidate(user["id"])
     return {"success": True, "is_online": is_online}
 
 @api_router.put("/barbers/profile")
@@ -385,15 +559,21 @@ async def update_barber_profile(
     update = {}
     if specialty: update["specialty"] = specialty
     if services: update["services"] = services
-    if latitude: update["latitude"] = latitude
-    if longitude: update["longitude"] = longitude
+    if latitude is not None: update["latitude"] = latitude
+    if longitude is not None: update["longitude"] = longitude
     if address: update["address"] = address
     if photo_url: update["photo_url"] = photo_url
     if instagram is not None: update["instagram"] = instagram
     if phone: update["phone"] = phone
+    if latitude is not None or longitude is not None:
+        update["location"] = geo_point(
+            update.get("latitude", user.get("latitude")),
+            update.get("longitude", user.get("longitude"))
+        )
     
     if update:
         await db.users.update_one({"id": user["id"]}, {"$set": update})
+        user_cache.invalidate(user["id"])
     
     return {"success": True}
 
@@ -411,15 +591,20 @@ async def get_referral_info(user: dict = Depends(get_current_user)):
         import string
         referral_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
         
-        referral_data = {
-            "user_id": user["id"],
-            "referral_code": referral_code,
-            "total_referrals": 0,
-            "referral_balance": 0,
-            "referred_users": [],
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }
-        await db.referrals.insert_one(referral_data)
+        # Upsert so two concurrent first requests settle on a single referral record
+        referral_data = await db.referrals.find_one_and_update(
+            {"user_id": user["id"]},
+            {"$setOnInsert": {
+                "referral_code": referral_code,
+                "total_referrals": 0,
+                "referral_balance": 0,
+                "referred_users": [],
+                "created_at": datetime.now(timezone.utc).isoformat()
+            }},
+            upsert=True,
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
     
     return {
         "referral_code": referral_data["referral_code"],
@@ -489,7 +674,7 @@ async def join_queue(
     if user["user_type"] != "client":
         raise HTTPException(status_code=403, detail="Only clients can join queue")
     
-    # Check if already in queue
+    # Check if already in queue (the unique partial index also guards concurrent joins)
     existing = await db.queue.find_one({
         "client_id": user["id"],
         "barber_id": barber_id,
@@ -519,20 +704,12 @@ async def join_queue(
         travel_fee = round(distance_km * barber.get("home_service_fee_per_km", 2.0), 2)
         total_price = service.get("price", 0) + travel_fee
     
-    # Get position
-    last_in_queue = await db.queue.find_one(
-        {"barber_id": barber_id, "status": "waiting"},
-        sort=[("position", -1)]
-    )
-    position = (last_in_queue["position"] + 1) if last_in_queue else 1
-    
     entry = QueueEntry(
         client_id=user["id"],
         client_name=user["name"],
         barber_id=barber_id,
         service=service,
-        position=position,
-        estimated_wait=position * service.get("duration", 30),
+        ticket=await next_queue_ticket(barber_id),
         is_home_service=is_home_service,
         client_address=client_address,
         client_latitude=client_latitude,
@@ -545,9 +722,22 @@ async def join_queue(
     
     doc = entry.model_dump()
     doc["created_at"] = doc["created_at"].isoformat()
-    await db.queue.insert_one(doc)
+    # Position and wait depend on who is ahead, so they are derived on read
+    del doc["position"]
+    del doc["estimated_wait"]
+    try:
+        await db.queue.insert_one(doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Already in queue for this barber")
+    
+    queue_entry = entry.model_dump()
+    apply_queue_position(queue_entry, await get_queue_position(queue_entry))
     
-    return {"success": True, "queue_entry": entry.model_dump()}
+    # Start pushing this barber's queue to the client's open sockets
+    queue_manager.subscribe_user(user["id"], barber_id)
+    notify_queue_changed(barber_id, "joined", entry.id)
+    
+    return {"success": True, "queue_entry": queue_entry}
 
 @api_router.get("/queue/my-position")
 async def get_my_position(user: dict = Depends(get_current_user)):
@@ -556,12 +746,13 @@ async def get_my_position(user: dict = Depends(get_current_user)):
         {"_id": 0}
     ).to_list(10)
     
-    for e in entries:
+    for e, position in zip(entries, await get_queue_positions(entries)):
         if isinstance(e.get("created_at"), str):
             e["created_at"] = datetime.fromisoformat(e["created_at"])
-        # Get barber info
-        barber = await db.users.find_one({"id": e["barber_id"]}, {"_id": 0, "name": 1, "photo_url": 1, "address": 1})
-        e["barber"] = barber
+        apply_queue_position(e, position)
+    
+    # Barber info for all entries in one query
+    await hydrate(entries, db.users, "barber_id", "barber", {"_id": 0, "name": 1, "photo_url": 1, "address": 1})
     
     return entries
 
@@ -570,10 +761,7 @@ async def get_barber_queue(user: dict = Depends(get_current_user)):
     if user["user_type"] != "barber":
         raise HTTPException(status_code=403, detail="Only barbers can view their queue")
     
-    queue = await db.queue.find(
-        {"barber_id": user["id"], "status": {"$in": ["waiting", "in_progress"]}},
-        {"_id": 0}
-    ).sort("position", 1).to_list(50)
+    queue = await load_active_queue(user["id"])
     
     for q in queue:
         if isinstance(q.get("created_at"), str):
@@ -593,43 +781,33 @@ async def update_queue_status(entry_id: str, status: str, user: dict = Depends(g
     if user["user_type"] == "client" and entry["client_id"] != user["id"]:
         raise HTTPException(status_code=403, detail="Not your entry")
     
+    # Positions are ranks over tickets, so nobody behind needs renumbering
     await db.queue.update_one({"id": entry_id}, {"$set": {"status": status}})
-    
-    # If completed or cancelled, update positions
-    if status in ["completed", "cancelled"]:
-        await db.queue.update_many(
-            {"barber_id": entry["barber_id"], "status": "waiting", "position": {"$gt": entry["position"]}},
-            {"$inc": {"position": -1}}
-        )
+    notify_queue_changed(entry["barber_id"], "status_changed", entry_id)
     
     return {"success": True}
 
 @api_router.delete("/queue/{entry_id}")
 async def leave_queue(entry_id: str, user: dict = Depends(get_current_user)):
-    entry = await db.queue.find_one({"id": entry_id, "client_id": user["id"]})
+    entry = await db.queue.find_one_and_delete({"id": entry_id, "client_id": user["id"]}, {"barber_id": 1})
     if not entry:
         raise HTTPException(status_code=404, detail="Queue entry not found")
-    
-    await db.queue.delete_one({"id": entry_id})
-    
-    # Update positions
-    await db.queue.update_many(
-        {"barber_id": entry["barber_id"], "status": "waiting", "position": {"$gt": entry["position"]}},
-        {"$inc": {"position": -1}}
-    )
+    notify_queue_changed(entry["barber_id"], "left", entry_id)
     
     return {"success": True}
 
 # ==================== REVIEW ROUTES ====================
 
 @api_router.post("/reviews")
-async def create_review(barber_id: str, rating: int, comment: Optional[str] = None, user: dict = Depends(get_current_user)):
+async def create_review(
+    barber_id: str,
+    rating: int = Query(..., ge=1, le=5),
+    comment: Optional[str] = None,
+    user: dict = Depends(get_current_user)
+):
     if user["user_type"] != "client":
         raise HTTPException(status_code=403, detail="Only clients can leave reviews")
     
-    if rating < 1 or rating > 5:
-        raise HTTPException(status_code=400, detail="Rating must be between 1 and 5")
-    
     review = Review(
         client_id=user["id"],
         client_name=user["name"],
@@ -642,44 +820,113 @@ async def create_review(barber_id: str, rating: int, comment: Optional[str] = No
     doc["created_at"] = doc["created_at"].isoformat()
     await db.reviews.insert_one(doc)
     
-    # Update barber rating
-    reviews = await db.reviews.find({"barber_id": barber_id}, {"rating": 1}).to_list(1000)
-    avg_rating = sum(r["rating"] for r in reviews) / len(reviews)
-    await db.users.update_one(
-        {"id": barber_id},
-        {"$set": {"rating": round(avg_rating, 1), "total_reviews": len(reviews)}}
-    )
+    # Update barber rating aggregates in a single atomic pipeline update
+    await db.users.update_one({"id": barber_id}, [
+        {"$set": {
+            "rating_sum": {"$add": [{"$ifNull": ["$rating_sum", 0]}, rating]},
+            "rating_count": {"$add": [{"$ifNull": ["$rating_count", 0]}, 1]},
+            "rating_histogram": {"$mergeObjects": [
+                {"$ifNull": ["$rating_histogram", {}]},
+                {str(rating): {"$add": [{"$ifNull": [f"$rating_histogram.{rating}", 0]}, 1]}}
+            ]}
+        }},
+        {"$set": {
+            "rating": {"$round": [{"$divide": ["$rating_sum", "$rating_count"]}, 1]},
+            "total_reviews": "$rating_count"
+        }}
+    ])
+    user_cache.invalidate(barber_id)
     
     return {"success": True, "review": review.model_dump()}
 
+async def recompute_rating_aggregates(barber_ids: Optional[List[str]] = None) -> int:
+    """Rebuild rating_sum/rating_count/rating_histogram from the reviews collection"""
+    match = {"barber_id": {"$in": barber_ids}} if barber_ids is not None else {}
+    totals = await db.reviews.aggregate([
+        {"$match": match},
+        {"$group": {"_id": {"barber_id": "$barber_id", "rating": "$rating"}, "count": {"$sum": 1}}},
+        {"$group": {
+            "_id": "$_id.barber_id",
+            "rating_sum": {"$sum": {"$multiply": ["$_id.rating", "$count"]}},
+            "rating_count": {"$sum": "$count"},
+            "histogram": {"$push": {"k": {"$toString": "$_id.rating"}, "v": "$count"}}
+        }}
+    ]).to_list(None)
+    
+    # Barbers whose reviews were all deleted go back to a new barber's rating; barbers never
+    # reviewed since totals were tracked only get empty counters, keeping whatever rating they had
+    id_filter = {"$nin": [t["_id"] for t in totals]}
+    if barber_ids is not None:
+        id_filter["$in"] = barber_ids
+    reset_ids = await db.users.distinct("id", {"user_type": "barber", "id": id_filter, "rating_count": {"$gt": 0}})
+    untracked_ids = await db.users.distinct("id", {"user_type": "barber", "id": id_filter, "rating_count": {"$exists": False}})
+    empty_counters = {"rating_sum": 0, "rating_count": 0, "rating_histogram": {}, "total_reviews": 0}
+    
+    updates = [
+        UpdateOne({"id": t["_id"]}, {"$set": {
+            "rating_sum": t["rating_sum"],
+            "rating_count": t["rating_count"],
+            "rating_histogram": {h["k"]: h["v"] for h in t["histogram"]},
+            "rating": round(t["rating_sum"] / t["rating_count"], 1),
+            "total_reviews": t["rating_count"]
+        }})
+        for t in totals
+    ] + [
+        UpdateOne({"id": barber_id}, {"$set": {**empty_counters, "rating": User.model_fields["rating"].default}})
+        for barber_id in reset_ids
+    ] + [
+        UpdateOne({"id": barber_id}, {"$set": empty_counters})
+        for barber_id in untracked_ids
+    ]
+    if not updates:
+        return 0
+    
+    await db.users.bulk_write(updates, ordered=False)
+    for barber_id in [t["_id"] for t in totals] + reset_ids + untracked_ids:
+        user_cache.invalidate(barber_id)
+    return len(updates)
+
+@api_router.post("/admin/ratings/recompute")
+async def repair_rating_aggregates(barber_id: Optional[str] = None, user: dict = Depends(get_admin_user)):
+    """Recompute rating aggregates for one barber, or all barbers"""
+    updated = await recompute_rating_aggregates([barber_id] if barber_id else None)
+    return {"success": True, "barbers_updated": updated}
+
 @api_router.get("/reviews/{barber_id}")
-async def get_reviews(barber_id: str):
-    reviews = await db.reviews.find({"barber_id": barber_id}, {"_id": 0}).sort("created_at", -1).to_list(50)
+async def get_reviews(
+    barber_id: str,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None
+):
+    """Reviews newest first, with the next page token as `next_cursor`"""
+    reviews, next_cursor = await fetch_page(db.reviews, {"barber_id": barber_id}, limit, cursor)
     for r in reviews:
         if isinstance(r.get("created_at"), str):
             r["created_at"] = datetime.fromisoformat(r["created_at"])
-    return reviews
+    return {"reviews": reviews, "next_cursor": next_cursor}
 
 # ==================== HISTORY ROUTES ====================
 
 @api_router.get("/history")
-async def get_history(user: dict = Depends(get_current_user)):
-    if user["user_type"] == "client":
-        entries = await db.queue.find(
-            {"client_id": user["id"], "status": {"$in": ["completed", "cancelled"]}},
-            {"_id": 0}
-        ).sort("created_at", -1).to_list(50)
-    else:
-        entries = await db.queue.find(
-            {"barber_id": user["id"], "status": {"$in": ["completed", "cancelled"]}},
-            {"_id": 0}
-        ).sort("created_at", -1).to_list(50)
+async def get_history(
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    user: dict = Depends(get_current_user)
+):
+    """Finished queue entries newest first, with the next page token as `next_cursor`"""
+    owner_field = "client_id" if user["user_type"] == "client" else "barber_id"
+    entries, next_cursor = await fetch_page(
+        db.queue,
+        {owner_field: user["id"], "status": {"$in": ["completed", "cancelled"]}},
+        limit,
+        cursor
+    )
     
     for e in entries:
         if isinstance(e.get("created_at"), str):
             e["created_at"] = datetime.fromisoformat(e["created_at"])
     
-    return entries
+    return {"history": entries, "next_cursor": next_cursor}
 
 # ==================== SEED DATA ====================
 
@@ -785,6 +1032,7 @@ async def seed_data():
     
     for barber in barbers:
         barber["id"] = str(uuid.uuid4())
+        barber["location"] = geo_point(barber["latitude"], barber["longitude"])
         barber["created_at"] = datetime.now(timezone.utc).isoformat()
         await db.users.insert_one(barber)
     
@@ -792,6 +1040,18 @@ async def seed_data():
 
 # ==================== STRIPE CONNECT ROUTES ====================
 
+async def sync_barber_onboarding(account_id: str, onboarding_complete: bool):
+    """Mirror Connect onboarding completion onto the barber record"""
+    barber = await db.users.find_one_and_update(
+        {"stripe_account_id": account_id},
+        {"$set": {"stripe_onboarding_complete": onboarding_complete}},
+        projection={"id": 1}
+    )
+    if barber:
+        user_cache.invalidate(barber["id"])
+
+connect_status = ConnectStatusCache(db, payment_gateway, on_onboarding_change=sync_barber_onboarding)
+
 @api_router.post("/connect/onboard")
 @api_router.post("/stripe/connect/onboard")
 async def create_stripe_connect_account(user: dict = Depends(get_current_user)):
@@ -805,40 +1065,41 @@ async def create_stripe_connect_account(user: dict = Depends(get_current_user)):
         
         if barber.get("stripe_account_id"):
             # Create new account link for existing account
-            account_link = stripe.AccountLink.create(
-                account=barber["stripe_account_id"],
-                refresh_url=f"{FRONTEND_URL}/barber/wallet",
-                return_url=f"{FRONTEND_URL}/barber/wallet?stripe_success=true",
-                type="account_onboarding",
-            )
+            account_link = await payment_gateway.create_account_link({
+                "account": barber["stripe_account_id"],
+                "refresh_url": f"{FRONTEND_URL}/barber/wallet",
+                "return_url": f"{FRONTEND_URL}/barber/wallet?stripe_success=true",
+                "type": "account_onboarding"
+            })
             return {"url": account_link.url}
         
         # Create new Stripe Connect Express account
-        account = stripe.Account.create(
-            type="express",
-            country="IE",  # Ireland
-            email=user["email"],
-            capabilities={
+        account = await payment_gateway.create_account({
+            "type": "express",
+            "country": "IE",  # Ireland
+            "email": user["email"],
+            "capabilities": {
                 "card_payments": {"requested": True},
                 "transfers": {"requested": True},
             },
-            business_type="individual",
-            metadata={"barber_id": user["id"]}
-        )
+            "business_type": "individual",
+            "metadata": {"barber_id": user["id"]}
+        }, idempotency_key=f"connect-account-{user['id']}")
         
         # Save Stripe account ID to barber
         await db.users.update_one(
             {"id": user["id"]},
             {"$set": {"stripe_account_id": account.id, "stripe_onboarding_complete": False}}
         )
+        user_cache.invalidate(user["id"])
         
         # Create account link for onboarding
-        account_link = stripe.AccountLink.create(
-            account=account.id,
-            refresh_url=f"{FRONTEND_URL}/barber/wallet",
-            return_url=f"{FRONTEND_URL}/barber/wallet?stripe_success=true",
-            type="account_onboarding",
-        )
+        account_link = await payment_gateway.create_account_link({
+            "account": account.id,
+            "refresh_url": f"{FRONTEND_URL}/barber/wallet",
+            "return_url": f"{FRONTEND_URL}/barber/wallet?stripe_success=true",
+            "type": "account_onboarding"
+        })
         
         return {"url": account_link.url}
         
@@ -847,8 +1108,8 @@ async def create_stripe_connect_account(user: dict = Depends(get_current_user)):
 
 @api_router.get("/connect/status")
 @api_router.get("/stripe/connect/status")
-async def get_stripe_connect_status(user: dict = Depends(get_current_user)):
-    """Get Stripe Connect account status"""
+async def get_stripe_connect_status(refresh: bool = False, user: dict = Depends(get_current_user)):
+    """Get Stripe Connect account status from the local cache; refresh=true forces a Stripe lookup"""
     if user["user_type"] != "barber":
         raise HTTPException(status_code=403, detail="Only barbers can check Stripe status")
     
@@ -858,20 +1119,15 @@ async def get_stripe_connect_status(user: dict = Depends(get_current_user)):
         return {"connected": False, "onboarding_complete": False}
     
     try:
-        account = stripe.Account.retrieve(barber["stripe_account_id"])
-        
-        # Update onboarding status
-        onboarding_complete = account.charges_enabled and account.payouts_enabled
-        await db.users.update_one(
-            {"id": user["id"]},
-            {"$set": {"stripe_onboarding_complete": onboarding_complete}}
-        )
+        account = await connect_status.get(barber["stripe_account_id"], force_refresh=refresh)
         
         return {
             "connected": True,
-            "onboarding_complete": onboarding_complete,
-            "charges_enabled": account.charges_enabled,
-            "payouts_enabled": account.payouts_enabled,
+            "onboarding_complete": account["onboarding_complete"],
+            "charges_enabled": account["charges_enabled"],
+            "payouts_enabled": account["payouts_enabled"],
+            "requirements": account["requirements"],
+            "refreshed_at": account["refreshed_at"],
             "account_id": barber["stripe_account_id"]
         }
     except stripe.error.StripeError as e:
@@ -890,11 +1146,28 @@ async def get_stripe_dashboard_link(user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=400, detail="Stripe account not connected")
     
     try:
-        login_link = stripe.Account.create_login_link(barber["stripe_account_id"])
+        login_link = await payment_gateway.create_login_link(barber["stripe_account_id"])
         return {"url": login_link.url}
     except stripe.error.StripeError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@api_router.post("/webhook/stripe/connect")
+async def stripe_connect_webhook(request: Request):
+    """Stripe Connect webhook; account.updated events refresh the cached account state"""
+    if not STRIPE_CONNECT_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Connect webhook not configured")
+    
+    payload = await request.body()
+    try:
+        event = stripe.Webhook.construct_event(
+            payload, request.headers.get("Stripe-Signature"), STRIPE_CONNECT_WEBHOOK_SECRET
+        )
+    except (ValueError, stripe.error.SignatureVerificationError):
+        raise HTTPException(status_code=400, detail="Invalid webhook signature")
+    
+    await connect_status.apply_event(event)
+    return {"received": True}
+
 # ==================== CLIENT PAYMENT ROUTES ====================
 
 PLATFORM_FEE_PERCENT = 10  # 10% platform fee
@@ -933,9 +1206,9 @@ async def create_client_payment(
     
     try:
         # Create Stripe Checkout Session with Connected Account
-        session = stripe.checkout.Session.create(
-            payment_method_types=["card"],
-            line_items=[
+        session = await payment_gateway.create_checkout_session({
+            "payment_method_types": ["card"],
+            "line_items": [
                 {
                     "price_data": {
                         "currency": "eur",
@@ -960,10 +1233,10 @@ async def create_client_payment(
                     "quantity": 1,
                 }
             ] if travel_fee > 0 else []),
-            mode="payment",
-            success_url=f"{FRONTEND_URL}/client?payment=success&session_id={{CHECKOUT_SESSION_ID}}",
-            cancel_url=f"{FRONTEND_URL}/client?payment=cancelled",
-            payment_intent_data={
+            "mode": "payment",
+            "success_url": f"{FRONTEND_URL}/client?payment=success&session_id={{CHECKOUT_SESSION_ID}}",
+            "cancel_url": f"{FRONTEND_URL}/client?payment=cancelled",
+            "payment_intent_data": {
                 "application_fee_amount": platform_fee_cents,
                 "transfer_data": {
                     "destination": barber["stripe_account_id"],
@@ -975,7 +1248,7 @@ async def create_client_payment(
                     "is_home_service": str(is_home_service),
                 }
             },
-            metadata={
+            "metadata": {
                 "client_id": user["id"],
                 "barber_id": barber_id,
                 "service_name": service_name,
@@ -983,7 +1256,7 @@ async def create_client_payment(
                 "travel_fee": str(travel_fee),
                 "is_home_service": str(is_home_service),
             }
-        )
+        })
         
         # Store pending payment info
         await db.pending_payments.insert_one({
@@ -1010,7 +1283,7 @@ async def confirm_payment(session_id: str, user: dict = Depends(get_current_user
     """Confirm payment was successful and add client to queue"""
     try:
         # Retrieve the session to verify payment
-        session = stripe.checkout.Session.retrieve(session_id)
+        session = await payment_gateway.retrieve_checkout_session(session_id)
         
         if session.payment_status != "paid":
             raise HTTPException(status_code=400, detail="Payment not completed")
@@ -1023,37 +1296,58 @@ async def confirm_payment(session_id: str, user: dict = Depends(get_current_user
         if pending["status"] == "completed":
             return {"success": True, "message": "Payment already processed"}
         
-        # Update pending payment status
-        await db.pending_payments.update_one(
-            {"session_id": session_id},
-            {"$set": {"status": "completed", "completed_at": datetime.now(timezone.utc).isoformat()}}
-        )
-        
-        # Add earnings to barber wallet
         barber_earnings = pending["total_amount"] - pending["platform_fee"]
+        earning_cents = to_cents(barber_earnings)
+        fee_cents = to_cents(pending["platform_fee"])
+        now = datetime.now(timezone.utc).isoformat()
         
-        await db.wallets.update_one(
-            {"barber_id": pending["barber_id"]},
-            {
-                "$inc": {
-                    "available_balance": barber_earnings,
-                    "total_earned": barber_earnings
-                }
-            },
-            upsert=True
-        )
+        async def settle(session):
+            # The journal key makes a retried confirm a no-op
+            await ledger.post(
+                f"payment-{session_id}",
+                "earning",
+                [
+                    (wallet_account(pending["barber_id"]), earning_cents),
+                    (PLATFORM_FEES, fee_cents),
+                    (STRIPE_CLEARING, -(earning_cents + fee_cents))
+                ],
+                session=session,
+                barber_id=pending["barber_id"],
+                metadata={"session_id": session_id}
+            )
+            await db.pending_payments.update_one(
+                {"session_id": session_id},
+                {"$set": {"status": "completed", "completed_at": now}},
+                session=session
+            )
+            await db.wallets.update_one(
+                {"barber_id": pending["barber_id"]},
+                {
+                    "$inc": {
+                        "available_balance": barber_earnings,
+                        "total_earned": barber_earnings
+                    },
+                    "$setOnInsert": {"ledger_opened": True}
+                },
+                upsert=True,
+                session=session
+            )
+            await db.transactions.insert_one({
+                "id": str(uuid.uuid4()),
+                "barber_id": pending["barber_id"],
+                "type": "earning",
+                "amount": barber_earnings,
+                "description": f"Pagamento: {pending['service_name']}",
+                "client_id": pending["client_id"],
+                "status": "completed",
+                "created_at": now
+            }, session=session)
+            await record_daily_earning(pending["barber_id"], barber_earnings, now, session=session)
         
-        # Record transaction
-        await db.transactions.insert_one({
-            "id": str(uuid.uuid4()),
-            "barber_id": pending["barber_id"],
-            "type": "earning",
-            "amount": barber_earnings,
-            "description": f"Pagamento: {pending['service_name']}",
-            "client_id": pending["client_id"],
-            "status": "completed",
-            "created_at": datetime.now(timezone.utc).isoformat()
-        })
+        try:
+            await ledger.run_transaction(settle)
+        except JournalAlreadyPosted:
+            return {"success": True, "message": "Payment already processed"}
         
         return {"success": True, "message": "Payment confirmed"}
         
@@ -1062,6 +1356,53 @@ async def confirm_payment(session_id: str, user: dict = Depends(get_current_user
 
 # ==================== WALLET ROUTES ====================
 
+async def record_daily_earning(barber_id: str, amount: float, created_at: str, session=None):
+    """Add one earning to the barber's rollup row for that UTC day"""
+    await db.earnings_daily.update_one(
+        {"barber_id": barber_id, "day": created_at[:10]},
+        {"$inc": {"total": amount, "count": 1}},
+        upsert=True,
+        session=session
+    )
+
+async def sum_daily_earnings(barber_id: str, start_day: str, end_day: Optional[str] = None) -> float:
+    """Total earnings between two YYYY-MM-DD days (inclusive) from the rollup rows"""
+    day_range = {"$gte": start_day}
+    if end_day:
+        day_range["$lte"] = end_day
+    totals = await db.earnings_daily.aggregate([
+        {"$match": {"barber_id": barber_id, "day": day_range}},
+        {"$group": {"_id": None, "total": {"$sum": "$total"}}}
+    ]).to_list(1)
+    return round(totals[0]["total"], 2) if totals else 0
+
+async def rebuild_daily_earnings(barber_ids: Optional[List[str]] = None) -> int:
+    """Rebuild earnings_daily from the transactions collection"""
+    match = {"type": "earning"}
+    if barber_ids is not None:
+        match["barber_id"] = {"$in": barber_ids}
+    days = await db.transactions.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": {"barber_id": "$barber_id", "day": {"$substrBytes": ["$created_at", 0, 10]}},
+            "total": {"$sum": "$amount"},
+            "count": {"$sum": 1}
+        }}
+    ]).to_list(None)
+    
+    if not days:
+        return 0
+    
+    await db.earnings_daily.bulk_write([
+        UpdateOne(
+            {"barber_id": d["_id"]["barber_id"], "day": d["_id"]["day"]},
+            {"$set": {"total": d["total"], "count": d["count"]}},
+            upsert=True
+        )
+        for d in days
+    ], ordered=False)
+    return len(days)
+
 @api_router.get("/wallet/balance")
 async def get_wallet_balance(user: dict = Depends(get_current_user)):
     """Get wallet balance and earnings summary"""
@@ -1073,53 +1414,77 @@ async def get_wallet_balance(user: dict = Depends(get_current_user)):
     # Check if Stripe is connected
     stripe_connected = bool(barber.get("stripe_account_id") and barber.get("stripe_onboarding_complete"))
     
-    # Get wallet data from DB or create default
-    wallet = await db.wallets.find_one({"barber_id": user["id"]})
-    if not wallet:
-        wallet = {
-            "barber_id": user["id"],
+    # Get wallet data from DB or create default; an upsert keeps racing first reads to one wallet
+    wallet = await db.wallets.find_one_and_update(
+        {"barber_id": user["id"]},
+        {"$setOnInsert": {
             "available_balance": 0,
             "pending_balance": 0,
             "total_earned": 0,
-            "auto_payout": {"enabled": False, "frequency": "weekly", "minimum_amount": 50}
-        }
-        await db.wallets.insert_one(wallet)
+            "auto_payout": {"enabled": False, "frequency": "weekly", "minimum_amount": 50},
+            "ledger_opened": True
+        }},
+        upsert=True,
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
     
-    # Calculate week and month earnings
+    # Week and month earnings from the daily rollups (at most 31 rows each)
     now = datetime.now(timezone.utc)
-    week_start = now - timedelta(days=now.weekday())
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    week_start = (now - timedelta(days=now.weekday())).strftime("%Y-%m-%d")
+    month_start = now.strftime("%Y-%m-01")
     
-    week_earnings = await db.transactions.aggregate([
-        {"$match": {"barber_id": user["id"], "type": "earning", "created_at": {"$gte": week_start.isoformat()}}},
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]).to_list(1)
-    
-    month_earnings = await db.transactions.aggregate([
-        {"$match": {"barber_id": user["id"], "type": "earning", "created_at": {"$gte": month_start.isoformat()}}},
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]).to_list(1)
+    week_earnings, month_earnings = await asyncio.gather(
+        sum_daily_earnings(user["id"], week_start),
+        sum_daily_earnings(user["id"], month_start)
+    )
     
     return {
         "connected": stripe_connected,
         "available_balance": wallet.get("available_balance", 0),
         "pending_balance": wallet.get("pending_balance", 0),
         "total_earned": wallet.get("total_earned", 0),
-        "week_earnings": week_earnings[0]["total"] if week_earnings else 0,
-        "month_earnings": month_earnings[0]["total"] if month_earnings else 0,
+        "week_earnings": week_earnings,
+        "month_earnings": month_earnings,
         "auto_payout": wallet.get("auto_payout", {"enabled": False, "frequency": "weekly", "minimum_amount": 50})
     }
 
+@api_router.get("/wallet/earnings")
+async def get_wallet_earnings(
+    start: str = Query(..., pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    end: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    user: dict = Depends(get_current_user)
+):
+    """Earnings for an arbitrary day range, with the per-day breakdown"""
+    if user["user_type"] != "barber":
+        raise HTTPException(status_code=403, detail="Only barbers have wallets")
+    
+    day_range = {"$gte": start}
+    if end:
+        day_range["$lte"] = end
+    days = await db.earnings_daily.find(
+        {"barber_id": user["id"], "day": day_range},
+        {"_id": 0, "day": 1, "total": 1, "count": 1}
+    ).sort("day", 1).to_list(None)
+    
+    return {
+        "start": start,
+        "end": end,
+        "total": round(sum(d["total"] for d in days), 2),
+        "days": days
+    }
+
 @api_router.get("/wallet/transactions")
-async def get_wallet_transactions(limit: int = 50, user: dict = Depends(get_current_user)):
+async def get_wallet_transactions(
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    user: dict = Depends(get_current_user)
+):
     """Get wallet transactions"""
     if user["user_type"] != "barber":
         raise HTTPException(status_code=403, detail="Only barbers have wallets")
     
-    transactions = await db.transactions.find(
-        {"barber_id": user["id"]},
-        {"_id": 0}
-    ).sort("created_at", -1).limit(limit).to_list(limit)
+    transactions, next_cursor = await fetch_page(db.transactions, {"barber_id": user["id"]}, limit, cursor)
     
     # Format for frontend
     formatted = []
@@ -1133,95 +1498,331 @@ async def get_wallet_transactions(limit: int = 50, user: dict = Depends(get_curr
             "date": t.get("created_at")
         })
     
-    return {"transactions": formatted}
+    return {"transactions": formatted, "next_cursor": next_cursor}
 
 @api_router.get("/wallet/payouts")
-async def get_wallet_payouts(user: dict = Depends(get_current_user)):
+async def get_wallet_payouts(
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    user: dict = Depends(get_current_user)
+):
     """Get payout history"""
     if user["user_type"] != "barber":
         raise HTTPException(status_code=403, detail="Only barbers have wallets")
     
-    payouts = await db.payouts.find(
-        {"barber_id": user["id"]},
-        {"_id": 0}
-    ).sort("created_at", -1).limit(50).to_list(50)
+    payouts, next_cursor = await fetch_page(db.payouts, {"barber_id": user["id"]}, limit, cursor)
     
-    return {"payouts": payouts}
+    return {"payouts": payouts, "next_cursor": next_cursor}
 
 class PayoutRequest(BaseModel):
     amount: float
     payout_type: str = "standard"
 
+async def reserve_payout(payout: dict, idempotency_key: str):
+    """Move the payout amount from the wallet to in-transit; raises InsufficientFunds"""
+    amount_cents = to_cents(payout["amount"])
+    
+    async def post_reservation(session):
+        await ledger.post(
+            f"payout-{payout['barber_id']}-{idempotency_key}",
+            "payout_reserve",
+            [
+                (wallet_account(payout["barber_id"]), -amount_cents),
+                (payouts_in_transit_account(payout["barber_id"]), amount_cents)
+            ],
+            session=session,
+            barber_id=payout["barber_id"],
+            metadata={"payout_id": payout["id"]}
+        )
+    
+    async def debit_wallet(session) -> bool:
+        debited = await db.wallets.update_one(
+            {"barber_id": payout["barber_id"], "available_balance": {"$gte": payout["amount"]}},
+            {"$inc": {"available_balance": -payout["amount"]}},
+            session=session
+        )
+        return debited.modified_count == 1
+    
+    async def reserve(session):
+        if session is None:
+            # No transaction to abort: debit first, so a refused payout never posts a
+            # journal and the client's idempotency key stays usable for a later retry
+            if not await debit_wallet(None):
+                raise InsufficientFunds()
+            try:
+                await post_reservation(None)
+            except Exception:
+                await db.wallets.update_one(
+                    {"barber_id": payout["barber_id"]}, {"$inc": {"available_balance": payout["amount"]}}
+                )
+                raise
+        else:
+            await post_reservation(session)
+            if not await debit_wallet(session):
+                raise InsufficientFunds()
+        await db.payouts.insert_one(payout, session=session)
+    
+    await ledger.run_transaction(reserve)
+    payout.pop("_id", None)
+
+# Errors where Stripe definitely did not create the transfer; anything else
+# (5xx, rate limiting, network) may have succeeded and must be retried, not released
+PAYOUT_REJECTED_ERRORS = (
+    stripe.error.InvalidRequestError,
+    stripe.error.CardError,
+    stripe.error.PermissionError
+)
+
+async def execute_payout(payout: dict, stripe_account_id: str):
+    """Send a reserved payout to Stripe, then settle or release it in the ledger.
+
+    Safe to call again for a payout left in "processing": the Stripe idempotency
+    key and the settle/reversal journal keys make every step run at most once.
+    """
+    amount_cents = to_cents(payout["amount"])
+    fee_cents = to_cents(payout["fee"])
+    
+    try:
+        transfer = await payment_gateway.create_transfer({
+            "amount": amount_cents - fee_cents,
+            "currency": "eur",
+            "destination": stripe_account_id,
+            "metadata": {"barber_id": payout["barber_id"], "payout_type": payout["payout_type"], "payout_id": payout["id"]}
+        }, idempotency_key=f"payout-{payout['id']}")
+    except PAYOUT_REJECTED_ERRORS as e:
+        async def release(session):
+            await ledger.post(
+                f"payout-reversal-{payout['id']}",
+                "payout_reversal",
+                [
+                    (payouts_in_transit_account(payout["barber_id"]), -amount_cents),
+                    (wallet_account(payout["barber_id"]), amount_cents)
+                ],
+                session=session,
+                barber_id=payout["barber_id"],
+                metadata={"payout_id": payout["id"]}
+            )
+            await db.wallets.update_one(
+                {"barber_id": payout["barber_id"]},
+                {"$inc": {"available_balance": payout["amount"]}},
+                session=session
+            )
+            await db.payouts.update_one(
+                {"id": payout["id"]},
+                {"$set": {"status": "failed", "failure_reason": str(e)}},
+                session=session
+            )
+        
+        try:
+            await ledger.run_transaction(release)
+        except JournalAlreadyPosted:
+            pass
+        raise
+    # Any other StripeError: outcome unknown, the funds stay in transit until a
+    # retry with the same idempotency key resolves it
+    
+    async def settle(session):
+        await ledger.post(
+            f"payout-settle-{payout['id']}",
+            "payout",
+            [
+                (payouts_in_transit_account(payout["barber_id"]), -amount_cents),
+                (STRIPE_CLEARING, amount_cents - fee_cents),
+                (PLATFORM_FEES, fee_cents)
+            ],
+            session=session,
+            barber_id=payout["barber_id"],
+            metadata={"payout_id": payout["id"], "stripe_transfer_id": transfer.id}
+        )
+        await db.payouts.update_one(
+            {"id": payout["id"]},
+            {"$set": {"status": "pending", "stripe_transfer_id": transfer.id}},
+            session=session
+        )
+        await db.transactions.insert_one({
+            "id": str(uuid.uuid4()),
+            "barber_id": payout["barber_id"],
+            "type": "payout",
+            "amount": -payout["amount"],
+            "description": f"Saque {'Instantâneo' if payout['payout_type'] == 'instant' else 'Standard'}",
+            "status": "completed",
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }, session=session)
+    
+    try:
+        await ledger.run_transaction(settle)
+    except JournalAlreadyPosted:
+        pass
+    return transfer
+
+async def submit_payout(
+    barber_id: str,
+    stripe_account_id: str,
+    amount: float,
+    payout_type: str,
+    idempotency_key: Optional[str] = None
+) -> dict:
+    """Reserve, transfer and settle one payout; returns the payout record.
+
+    Reusing an idempotency key returns (or resumes) the payout it created first.
+    Raises InsufficientFunds, or StripeError when the transfer fails.
+    """
+    # Calculate fee for instant payout
+    fee = round(amount * 0.015, 2) if payout_type == "instant" else 0
+    net_amount = amount - fee
+    
+    payout = {
+        "id": str(uuid.uuid4()),
+        "barber_id": barber_id,
+        "amount": amount,
+        "fee": fee,
+        "net_amount": net_amount,
+        "payout_type": payout_type,
+        "status": "processing",
+        "stripe_transfer_id": None,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "arrival_date": (datetime.now(timezone.utc) + timedelta(days=0 if payout_type == "instant" else 3)).isoformat()
+    }
+    
+    try:
+        await reserve_payout(payout, idempotency_key or payout["id"])
+    except JournalAlreadyPosted as e:
+        # Retried request: resume the original payout instead of creating another
+        payout = await db.payouts.find_one({"id": e.journal["metadata"]["payout_id"]}, {"_id": 0})
+        if not payout:
+            raise InsufficientFunds()
+        if payout["status"] != "processing":
+            return payout
+    
+    transfer = await execute_payout(payout, stripe_account_id)
+    payout.update({"status": "pending", "stripe_transfer_id": transfer.id})
+    return payout
+
 @api_router.post("/wallet/payout")
-async def request_payout(request: PayoutRequest, user: dict = Depends(get_current_user)):
-    """Request a payout"""
+async def request_payout(
+    request: PayoutRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    user: dict = Depends(get_current_user)
+):
+    """Request a payout; retries carrying the same Idempotency-Key never pay out twice"""
     if user["user_type"] != "barber":
         raise HTTPException(status_code=403, detail="Only barbers can request payouts")
     
-    amount = request.amount
-    payout_type = request.payout_type
-    
     barber = await db.users.find_one({"id": user["id"]})
     if not barber.get("stripe_account_id") or not barber.get("stripe_onboarding_complete"):
         raise HTTPException(status_code=400, detail="Stripe account not connected or onboarding incomplete")
     
-    wallet = await db.wallets.find_one({"barber_id": user["id"]})
-    if not wallet or wallet.get("available_balance", 0) < amount:
+    if request.amount < 1:
+        raise HTTPException(status_code=400, detail="Minimum payout is €1")
+    
+    # The balance check happens atomically inside reserve_payout
+    try:
+        payout = await submit_payout(
+            user["id"], barber["stripe_account_id"], request.amount, request.payout_type, idempotency_key
+        )
+    except InsufficientFunds:
         raise HTTPException(status_code=400, detail="Insufficient balance")
+    except PAYOUT_REJECTED_ERRORS as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except stripe.error.StripeError:
+        raise HTTPException(
+            status_code=503,
+            detail="Payout is being confirmed with Stripe; retry with the same Idempotency-Key"
+        )
     
-    if amount < 1:
-        raise HTTPException(status_code=400, detail="Minimum payout is €1")
+    if payout["status"] == "failed":
+        raise HTTPException(status_code=400, detail=payout.get("failure_reason", "Payout failed"))
     
-    # Calculate fee for instant payout
-    fee = round(amount * 0.015, 2) if payout_type == "instant" else 0
-    net_amount = amount - fee
+    return {
+        "success": True,
+        "message": f"Saque de €{payout['net_amount']:.2f} solicitado com sucesso",
+        "payout_id": payout["id"]
+    }
+
+async def run_auto_payout(wallet: dict, run_key: str) -> str:
+    """Scheduler callback: pay out the wallet balance when it meets the barber's minimum"""
+    config = wallet.get("auto_payout") or {}
+    if not config.get("enabled"):
+        return "disabled"
+    
+    barber = await db.users.find_one({"id": wallet["barber_id"]}, {"_id": 0, "stripe_account_id": 1, "stripe_onboarding_complete": 1})
+    if not barber or not barber.get("stripe_account_id") or not barber.get("stripe_onboarding_complete"):
+        return "not_connected"
+    
+    # A resumed run must reuse its original amount, so look for it first
+    existing = await db.ledger_journals.find_one(
+        {"idempotency_key": f"payout-{wallet['barber_id']}-{run_key}"}, {"_id": 0, "id": 1}
+    )
+    amount = wallet.get("available_balance", 0)
+    if not existing and amount < config.get("minimum_amount", 50):
+        return "below_minimum"
     
     try:
-        # Create payout via Stripe
-        payout = stripe.Transfer.create(
-            amount=int(net_amount * 100),  # Convert to cents
-            currency="eur",
-            destination=barber["stripe_account_id"],
-            metadata={"barber_id": user["id"], "payout_type": payout_type}
-        )
-        
-        # Update wallet balance
-        await db.wallets.update_one(
-            {"barber_id": user["id"]},
-            {"$inc": {"available_balance": -amount}}
+        payout = await submit_payout(wallet["barber_id"], barber["stripe_account_id"], round(amount, 2), "standard", run_key)
+    except InsufficientFunds:
+        return "insufficient_funds"
+    except PAYOUT_REJECTED_ERRORS:
+        return "failed"
+    # Other StripeErrors propagate: outcome unknown, the scheduler retries with the same run key
+    return "paid" if payout["status"] != "failed" else "failed"
+
+auto_payout_scheduler = AutoPayoutScheduler(db, run_auto_payout)
+
+async def sweep_processing_payouts() -> dict:
+    """Re-run execute_payout for payouts left in "processing" by an unknown Stripe outcome.
+
+    Each retry reuses the payout's idempotency key, so Stripe either returns the
+    transfer it already made or makes it now; a lease keeps workers from racing.
+    """
+    now = datetime.now(timezone.utc)
+    cutoff = (now - timedelta(seconds=PAYOUT_SWEEP_AFTER_SECONDS)).isoformat()
+    results = {"settled": 0, "released": 0, "still_processing": 0}
+    while True:
+        payout = await db.payouts.find_one_and_update(
+            {
+                "status": "processing",
+                "created_at": {"$lte": cutoff},
+                "$or": [
+                    {"sweep_lease_until": {"$exists": False}},
+                    {"sweep_lease_until": {"$lte": now.isoformat()}}
+                ]
+            },
+            {"$set": {"sweep_lease_until": (now + timedelta(seconds=PAYOUT_SWEEP_INTERVAL_SECONDS)).isoformat()}},
+            sort=[("created_at", 1)],
+            projection={"_id": 0}
         )
-        
-        # Record payout
-        payout_record = {
-            "id": str(uuid.uuid4()),
-            "barber_id": user["id"],
-            "amount": amount,
-            "fee": fee,
-            "net_amount": net_amount,
-            "payout_type": payout_type,
-            "status": "pending",
-            "stripe_transfer_id": payout.id,
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "arrival_date": (datetime.now(timezone.utc) + timedelta(days=0 if payout_type == "instant" else 3)).isoformat()
-        }
-        await db.payouts.insert_one(payout_record)
-        
-        # Record transaction
-        transaction = {
-            "id": str(uuid.uuid4()),
-            "barber_id": user["id"],
-            "type": "payout",
-            "amount": -amount,
-            "description": f"Saque {'Instantâneo' if payout_type == 'instant' else 'Standard'}",
-            "status": "completed",
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }
-        await db.transactions.insert_one(transaction)
-        
-        return {"success": True, "message": f"Saque de €{net_amount:.2f} solicitado com sucesso"}
-        
-    except stripe.error.StripeError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        if not payout:
+            return results
+        barber = await db.users.find_one({"id": payout["barber_id"]}, {"_id": 0, "stripe_account_id": 1})
+        if not barber or not barber.get("stripe_account_id"):
+            results["still_processing"] += 1
+            continue
+        try:
+            await execute_payout(payout, barber["stripe_account_id"])
+            results["settled"] += 1
+        except PAYOUT_REJECTED_ERRORS:
+            results["released"] += 1
+        except stripe.error.StripeError as e:
+            results["still_processing"] += 1
+            logger.warning(f"Payout {payout['id']} still unresolved at Stripe: {e}")
+
+async def payout_sweep_loop():
+    """Periodically resolve payouts stuck in "processing" """
+    while True:
+        await asyncio.sleep(PAYOUT_SWEEP_INTERVAL_SECONDS)
+        try:
+            results = await sweep_processing_payouts()
+            if any(results.values()):
+                logger.info(f"Payout sweep: {results}")
+        except Exception as e:
+            logger.error(f"Payout sweep failed: {e}")
+
+@api_router.post("/admin/ledger/reconcile")
+async def reconcile_ledger(user: dict = Depends(get_admin_user)):
+    """Fold ledger postings into snapshots and repair wallet balances that drifted"""
+    accounts = await ledger.snapshot()
+    drifted = await ledger.reconcile_wallets()
+    return {"success": True, "accounts_snapshotted": accounts, "wallets_drifted": drifted}
 
 class AutoPayoutConfig(BaseModel):
     enabled: bool
@@ -1240,13 +1841,21 @@ async def configure_auto_payout(config: AutoPayoutConfig, user: dict = Depends(g
     if config.minimum_amount < 10:
         raise HTTPException(status_code=400, detail="Minimum amount must be at least €10")
     
-    await db.wallets.update_one(
-        {"barber_id": user["id"]},
-        {"$set": {"auto_payout": {"enabled": config.enabled, "frequency": config.frequency, "minimum_amount": config.minimum_amount}}},
-        upsert=True
-    )
+    update = {
+        "$set": {"auto_payout": {"enabled": config.enabled, "frequency": config.frequency, "minimum_amount": config.minimum_amount}},
+        "$setOnInsert": {"ledger_opened": True, "available_balance": 0, "total_earned": 0}
+    }
+    # Enabled wallets carry the next run time the scheduler polls on; disabled ones drop out of its index
+    if config.enabled:
+        next_run_at = next_run_time(config.frequency, user["id"], datetime.now(timezone.utc)).isoformat()
+        update["$set"]["auto_payout_next_run_at"] = next_run_at
+    else:
+        next_run_at = None
+        update["$unset"] = {"auto_payout_next_run_at": ""}
     
-    return {"success": True}
+    await db.wallets.update_one({"barber_id": user["id"]}, update, upsert=True)
+    
+    return {"success": True, "next_run_at": next_run_at}
 
 # ==================== VERIFICATION ROUTES ====================
 
@@ -1381,10 +1990,8 @@ async def get_pending_verifications(user: dict = Depends(get_current_user)):
         {"_id": 0}
     ).to_list(100)
     
-    # Get barber info for each verification
-    for v in verifications:
-        barber = await db.users.find_one({"id": v["barber_id"]}, {"_id": 0, "password": 0})
-        v["barber"] = barber
+    # Get barber info for all verifications in one query
+    await hydrate(verifications, db.users, "barber_id", "barber", {"_id": 0, "password": 0})
     
     return {"verifications": verifications}
 
@@ -1405,6 +2012,7 @@ async def approve_verification(barber_id: str, user: dict = Depends(get_current_
         {"id": barber_id},
         {"$set": {"is_verified": True}}
     )
+    user_cache.invalidate(barber_id)
     
     return {"success": True}
 
@@ -1495,9 +2103,9 @@ async def create_checkout_session(plan_id: str, user: dict = Depends(get_current
         raise HTTPException(status_code=400, detail="Invalid plan")
     
     try:
-        session = stripe.checkout.Session.create(
-            payment_method_types=["card"],
-            line_items=[{
+        session = await payment_gateway.create_checkout_session({
+            "payment_method_types": ["card"],
+            "line_items": [{
                 "price_data": {
                     "currency": "eur",
                     "product_data": {
@@ -1508,20 +2116,43 @@ async def create_checkout_session(plan_id: str, user: dict = Depends(get_current
                 },
                 "quantity": 1
             }],
-            mode="subscription",
-            success_url=f"{FRONTEND_URL}/subscription?success=true",
-            cancel_url=f"{FRONTEND_URL}/subscription?canceled=true",
-            metadata={"barber_id": user["id"], "plan_id": plan_id}
-        )
+            "mode": "subscription",
+            "success_url": f"{FRONTEND_URL}/subscription?success=true",
+            "cancel_url": f"{FRONTEND_URL}/subscription?canceled=true",
+            "metadata": {"barber_id": user["id"], "plan_id": plan_id}
+        })
         return {"checkout_url": session.url}
     except stripe.error.StripeError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@api_router.get("/admin/metrics")
+async def get_admin_metrics(user: dict = Depends(get_admin_user)):
+    """In-process performance counters for this worker"""
+    return {
+        "user_cache": user_cache.stats(),
+        "payment_gateway": payment_gateway.stats(),
+        "connect_status": connect_status.stats(),
+        "auto_payouts": auto_payout_scheduler.stats()
+    }
+
+@api_router.get("/admin/index-report")
+async def get_index_report(user: dict = Depends(get_admin_user)):
+    """Explain the hot query shapes and flag those still doing collection scans"""
+    report = await report_collection_scans(db)
+    return {
+        "collection_scans": [r["name"] for r in report if r.get("collection_scan")],
+        "queries": report
+    }
+
 @api_router.get("/")
 async def root():
     return {"message": "BarberX API v1.0"}
 
 app.include_router(api_router)
+app.include_router(queue_events_router)
+
+# Initialize live queue events
+init_queue_events(resolve_token_user, load_active_queue, get_client_queue_barbers)
 
 app.add_middleware(
     CORSMiddleware,
@@ -1537,6 +2168,154 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+async def backfill_barber_locations():
+    """Give legacy barbers a GeoJSON location built from latitude/longitude"""
+    try:
+        await db.users.update_many(
+            {
+                "user_type": "barber",
+                "location": {"$exists": False},
+                "latitude": {"$type": "number"},
+                "longitude": {"$type": "number"}
+            },
+            [{"$set": {"location": {"type": "Point", "coordinates": ["$longitude", "$latitude"]}}}]
+        )
+    except Exception as e:
+        logger.warning(f"Barber location backfill: {e}")
+
+async def backfill_queue_tickets():
+    """Move legacy position-numbered queue entries onto tickets"""
+    try:
+        legacy_filter = {"ticket": {"$exists": False}, "status": {"$in": ACTIVE_QUEUE_STATUSES}}
+        legacy_tops = await db.queue.aggregate([
+            {"$match": legacy_filter},
+            {"$group": {"_id": "$barber_id", "max_position": {"$max": "$position"}}}
+        ]).to_list(None)
+        await db.queue.update_many(legacy_filter, [{"$set": {"ticket": "$position"}}])
+        for top in legacy_tops:
+            await db.queue_counters.update_one(
+                {"barber_id": top["_id"]},
+                {"$max": {"seq": top["max_position"]}},
+                upsert=True
+            )
+    except Exception as e:
+        logger.warning(f"Queue ticket backfill: {e}")
+
+async def backfill_rating_aggregates():
+    """Seed running rating totals for barbers reviewed before they were tracked, and repair drifted ones"""
+    try:
+        totals = {
+            t["_id"]: (t["rating_count"], t["rating_sum"])
+            async for t in db.reviews.aggregate([
+                {"$group": {"_id": "$barber_id", "rating_count": {"$sum": 1}, "rating_sum": {"$sum": "$rating"}}}
+            ])
+        }
+        barber_ids = [
+            b["id"]
+            async for b in db.users.find({"user_type": "barber"}, {"_id": 0, "id": 1, "rating_count": 1, "rating_sum": 1})
+            if "rating_count" not in b or (b["rating_count"], b.get("rating_sum", 0)) != totals.get(b["id"], (0, 0))
+        ]
+        if barber_ids:
+            updated = await recompute_rating_aggregates(barber_ids)
+            logger.info(f"Rating aggregates backfilled for {updated} barbers")
+    except Exception as e:
+        logger.warning(f"Rating aggregate backfill: {e}")
+
+async def backfill_ledger_openings():
+    """Open ledger accounts for wallets funded before the ledger existed"""
+    try:
+        opened = 0
+        async for wallet in db.wallets.find({"ledger_opened": {"$ne": True}}, {"_id": 0, "barber_id": 1}):
+            barber_id = wallet["barber_id"]
+            
+            async def open_account(session):
+                current = await db.wallets.find_one({"barber_id": barber_id}, {"_id": 0, "available_balance": 1}, session=session)
+                # Postings written before this ran are already in the ledger
+                cents = to_cents(current.get("available_balance", 0)) - await ledger.balance(wallet_account(barber_id), session=session)
+                if cents:
+                    await ledger.post(
+                        f"opening-{barber_id}",
+                        "opening_balance",
+                        [(wallet_account(barber_id), cents), (OPENING_BALANCES, -cents)],
+                        session=session,
+                        barber_id=barber_id
+                    )
+                await db.wallets.update_one({"barber_id": barber_id}, {"$set": {"ledger_opened": True}}, session=session)
+            
+            try:
+                await ledger.run_transaction(open_account)
+                opened += 1
+            except JournalAlreadyPosted:
+                await db.wallets.update_one({"barber_id": barber_id}, {"$set": {"ledger_opened": True}})
+        if opened:
+            logger.info(f"Ledger opened for {opened} existing wallets")
+    except Exception as e:
+        logger.warning(f"Ledger opening backfill: {e}")
+
+async def backfill_daily_earnings():
+    """Build earnings rollups the first time the collection is empty"""
+    try:
+        if await db.earnings_daily.estimated_document_count() == 0:
+            rows = await rebuild_daily_earnings()
+            if rows:
+                logger.info(f"Daily earnings rollups backfilled ({rows} rows)")
+    except Exception as e:
+        logger.warning(f"Daily earnings backfill: {e}")
+
+async def backfill_auto_payout_schedule():
+    """Schedule wallets that enabled auto payouts before the scheduler existed"""
+    try:
+        now = datetime.now(timezone.utc)
+        wallets = await db.wallets.find(
+            {"auto_payout.enabled": True, "auto_payout_next_run_at": {"$exists": False}},
+            {"_id": 0, "barber_id": 1, "auto_payout": 1}
+        ).to_list(None)
+        if wallets:
+            await db.wallets.bulk_write([
+                UpdateOne(
+                    {"barber_id": w["barber_id"]},
+                    {"$set": {"auto_payout_next_run_at": next_run_time(w["auto_payout"].get("frequency", "weekly"), w["barber_id"], now).isoformat()}}
+                )
+                for w in wallets
+            ], ordered=False)
+            logger.info(f"Auto payouts scheduled for {len(wallets)} wallets")
+    except Exception as e:
+        logger.warning(f"Auto payout schedule backfill: {e}")
+
+# Strong references to the background loops, cancelled at shutdown
+background_tasks: List[asyncio.Task] = []
+
+async def ledger_snapshot_loop():
+    """Periodically fold ledger postings into snapshots and reconcile wallet balances"""
+    while True:
+        await asyncio.sleep(LEDGER_SNAPSHOT_INTERVAL_SECONDS)
+        try:
+            accounts = await ledger.snapshot()
+            drifted = await ledger.reconcile_wallets()
+            logger.info(f"Ledger snapshot: {accounts} accounts folded, {drifted} wallets drifted")
+        except Exception as e:
+            logger.error(f"Ledger snapshot failed: {e}")
+
+@app.on_event("startup")
+async def startup_event():
+    """Initialize on startup"""
+    await backfill_barber_locations()
+    await backfill_queue_tickets()
+    await ensure_indexes(db)
+    await backfill_rating_aggregates()
+    await backfill_ledger_openings()
+    await backfill_daily_earnings()
+    await backfill_auto_payout_schedule()
+    background_tasks.extend([
+        asyncio.create_task(ledger_snapshot_loop()),
+        asyncio.create_task(auto_payout_scheduler.run_forever()),
+        asyncio.create_task(payout_sweep_loop())
+    ])
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
     client.close()
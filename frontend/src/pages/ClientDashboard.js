@@ -358,8 +358,8 @@ const ClientDashboard = () => {
   const fetchBarbers = async () => {
     try {
       const res = await axios.get(`${API}/barbers?lat=${userLocation.lat}&lon=${userLocation.lng}`);
-      setBarbers(res.data);
-      setFilteredBarbers(res.data);
+      setBarbers(res.data.barbers);
+      setFilteredBarbers(res.data.barbers);
     } catch (e) {
       console.error(e);
     }
@@ -0,0 +1,78 @@
+"""
+Database Indexes Module - declarative index registry for the QuickCut API
+Features:
+- One registry of every index the hot query shapes rely on
+- Idempotent creation at startup with background builds
+- Explain-based report of query shapes that still fall back to a collection scan
+"""
+
+import logging
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# ============== INDEX REGISTRY ==============
+
+INDEX_REGISTRY = [
+    # Users: token resolution, login, available barbers
+    {"collection": "quickcut_users", "keys": [("id", 1)], "unique": True},
+    {"collection": "quickcut_users", "keys": [("email", 1)], "unique": True},
+    {"collection": "quickcut_users", "keys": [("role", 1), ("is_available", 1)]},
+
+    # Bookings: day views, stats and keyset pages
+    {"collection": "quickcut_bookings", "keys": [("id", 1)], "unique": True},
+    {"collection": "quickcut_bookings", "keys": [("barber_id", 1), ("date", 1), ("status", 1)]},
+    {"collection": "quickcut_bookings", "keys": [("client_id", 1), ("created_at", -1), ("id", -1)]},
+    {"collection": "quickcut_bookings", "keys": [("barber_id", 1), ("created_at", -1), ("id", -1)]},
+]
+
+# Representative filters for the scan report, one per hot route
+QUERY_SHAPES = [
+    {"name": "get_current_user", "collection": "quickcut_users", "filter": {"id": "x"}},
+    {"name": "login", "collection": "quickcut_users", "filter": {"email": "x"}},
+    {"name": "get_available_barbers", "collection": "quickcut_users", "filter": {"role": "barber", "is_available": True}},
+    {"name": "get_today_bookings", "collection": "quickcut_bookings", "filter": {"barber_id": "x", "date": "x", "status": {"$in": ["pending", "confirmed"]}}, "sort": {"time": 1}},
+    {"name": "get_my_bookings", "collection": "quickcut_bookings", "filter": {"client_id": "x"}, "sort": {"created_at": -1, "id": -1}},
+    {"name": "get_barber_bookings", "collection": "quickcut_bookings", "filter": {"barber_id": "x"}, "sort": {"created_at": -1, "id": -1}},
+]
+
+# ============== HELPER FUNCTIONS ==============
+
+async def ensure_indexes(db, registry: Optional[List[dict]] = None):
+    """Create every registered index; existing indexes are left untouched"""
+    for spec in registry or INDEX_REGISTRY:
+        options = {k: v for k, v in spec.items() if k not in ("collection", "keys")}
+        try:
+            await db[spec["collection"]].create_index(spec["keys"], background=True, **options)
+        except Exception as e:
+            logger.warning(f"Index {spec['collection']}{spec['keys']}: {e}")
+    logger.info(f"Index registry applied ({len(registry or INDEX_REGISTRY)} indexes)")
+
+def _plan_stages(plan: dict) -> List[str]:
+    stages = [plan.get("stage")] if plan.get("stage") else []
+    for child_key in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(child_key), dict):
+            stages += _plan_stages(plan[child_key])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+async def report_collection_scans(db, shapes: Optional[List[dict]] = None) -> List[dict]:
+    """Explain each registered query shape and flag the ones planned as COLLSCAN"""
+    report = []
+    for shape in shapes or QUERY_SHAPES:
+        find = {"find": shape["collection"], "filter": shape["filter"]}
+        if shape.get("sort"):
+            find["sort"] = shape["sort"]
+        try:
+            explain = await db.command({"explain": find, "verbosity": "queryPlanner"})
+            stages = _plan_stages(explain["queryPlanner"]["winningPlan"])
+            report.append({
+                "name": shape["name"],
+                "collection": shape["collection"],
+                "stages": stages,
+                "collection_scan": "COLLSCAN" in stages
+            })
+        except Exception as e:
+            report.append({"name": shape["name"], "collection": shape["collection"], "error": str(e)})
+    return report
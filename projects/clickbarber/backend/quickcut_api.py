@@ -2,15 +2,27 @@
 # QuickCut - Backend API for Barber Booking App
 # ============================================================
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional
 from datetime import datetime, timezone, timedelta
 import uuid
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
-import bcrypt
+import sys
 import jwt
+from pathlib import Path
+
+# Helpers shared by every backend live in shared/ at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from shared.user_cache import UserCache
+from shared.pagination import fetch_page
+from db_indexes import ensure_indexes, report_collection_scans
+from shared.password_hasher import password_hasher, PasswordHasherBusy
+
+# Users resolved from tokens, keyed by user id (separate from the main app's cache)
+user_cache = UserCache()
 
 # Get database from main app
 mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
@@ -29,6 +41,7 @@ quickcut_router = APIRouter(prefix="/quickcut", tags=["QuickCut"])
 class UserRole:
     CLIENT = "client"
     BARBER = "barber"
+    ADMIN = "admin"  # assigned by operators in the database; registration never sets it
 
 class Location(BaseModel):
     lat: float
@@ -79,11 +92,11 @@ class BookingStatusUpdate(BaseModel):
 
 # ============== HELPERS ==============
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode(), hashed.encode())
+async def verify_password(password: str, hashed: str) -> bool:
+    return await password_hasher.verify(password, hashed)
 
 def create_token(user_id: str, email: str, role: str) -> str:
     payload = {
@@ -97,7 +110,7 @@ def create_token(user_id: str, email: str, role: str) -> str:
 async def get_current_user(token: str) -> dict:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user = await db.quickcut_users.find_one({"id": payload["user_id"]})
+        user = await user_cache.get_or_load(payload["user_id"], load_user)
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
         return user
@@ -106,6 +119,10 @@ async def get_current_user(token: str) -> dict:
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+async def load_user(user_id: str) -> Optional[dict]:
+    return await db.quickcut_users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+
+
 # ============== AUTH ROUTES ==============
 
 @quickcut_router.post("/auth/register/barber")
@@ -121,7 +138,7 @@ async def register_barber(data: BarberRegister):
         "name": data.name,
         "email": data.email,
         "phone": data.phone,
-        "password": hash_password(data.password),
+        "password": await hash_password(data.password),
         "role": UserRole.BARBER,
         "shop_name": data.shop_name,
         "bio": data.bio,
@@ -175,7 +192,7 @@ async def register_client(data: ClientRegister):
         "name": data.name,
         "email": data.email,
         "phone": data.phone,
-        "password": hash_password(data.password),
+        "password": await hash_password(data.password),
         "role": UserRole.CLIENT,
         "favorite_barbers": [],
         "created_at": datetime.now(timezone.utc).isoformat(),
@@ -203,7 +220,15 @@ async def login(data: LoginRequest):
     if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    if not verify_password(data.password, user["password"]):
+    try:
+        valid = await verify_password(data.password, user["password"])
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many login attempts, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     token = create_token(user["id"], user["email"], user["role"])
@@ -332,6 +357,7 @@ async def update_availability(data: AvailabilityUpdate, token: str):
         {"id": user["id"]},
         {"$set": {"is_available": data.available}}
     )
+    user_cache.invalidate(user["id"])
     
     return {
         "status": "success",
@@ -358,6 +384,7 @@ async def update_location(data: LocationUpdate, token: str):
         {"id": user["id"]},
         {"$set": {"location": location}}
     )
+    user_cache.invalidate(user["id"])
     
     return {"status": "success", "location": location}
 
@@ -388,6 +415,7 @@ async def add_service(service: Service, token: str):
         {"id": user["id"]},
         {"$push": {"services": service_dict}}
     )
+    user_cache.invalidate(user["id"])
     
     return {"status": "success", "service": service_dict}
 
@@ -435,29 +463,33 @@ async def create_booking(data: BookingCreate, token: str):
     return booking
 
 @quickcut_router.get("/bookings/my")
-async def get_my_bookings(token: str):
-    """Get client's bookings"""
+async def get_my_bookings(
+    token: str,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None
+):
+    """Get client's bookings, with the next page token as `next_cursor`"""
     user = await get_current_user(token)
     
-    bookings = await db.quickcut_bookings.find({
-        "client_id": user["id"]
-    }).sort("created_at", -1).to_list(50)
+    bookings, next_cursor = await fetch_page(db.quickcut_bookings, {"client_id": user["id"]}, limit, cursor)
     
-    return bookings
+    return {"bookings": bookings, "next_cursor": next_cursor}
 
 @quickcut_router.get("/bookings/barber")
-async def get_barber_bookings(token: str):
-    """Get barber's bookings"""
+async def get_barber_bookings(
+    token: str,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None
+):
+    """Get barber's bookings, with the next page token as `next_cursor`"""
     user = await get_current_user(token)
     
     if user["role"] != UserRole.BARBER:
         raise HTTPException(status_code=403, detail="Only barbers can view barber bookings")
     
-    bookings = await db.quickcut_bookings.find({
-        "barber_id": user["id"]
-    }).sort("created_at", -1).to_list(50)
+    bookings, next_cursor = await fetch_page(db.quickcut_bookings, {"barber_id": user["id"]}, limit, cursor)
     
-    return bookings
+    return {"bookings": bookings, "next_cursor": next_cursor}
 
 @quickcut_router.get("/bookings/barber/today")
 async def get_today_bookings(token: str):
@@ -513,6 +545,7 @@ async def update_booking_status(booking_id: str, data: BookingStatusUpdate, toke
             {"id": booking["barber_id"]},
             {"$inc": {"total_cuts": 1}}
         )
+        user_cache.invalidate(booking["barber_id"])
     
     return {"status": "success", "booking_status": data.status}
 
@@ -552,6 +585,33 @@ async def get_today_stats(token: str):
         "rating": user.get("rating", 5.0),
     }
 
+@quickcut_router.get("/metrics")
+async def get_metrics(token: str):
+    """In-process performance counters for this worker"""
+    user = await get_current_user(token)
+    if user["role"] != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return {"user_cache": user_cache.stats(), "password_hasher": password_hasher.stats()}
+
+@quickcut_router.get("/index-report")
+async def get_index_report(token: str):
+    """Explain the hot query shapes and flag those still doing collection scans"""
+    user = await get_current_user(token)
+    if user["role"] != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    report = await report_collection_scans(db)
+    return {
+        "collection_scans": [r["name"] for r in report if r.get("collection_scan")],
+        "queries": report
+    }
+
+# ============== STARTUP ==============
+
+@quickcut_router.on_event("startup")
+async def setup_indexes():
+    """Apply the QuickCut index registry"""
+    await ensure_indexes(db)
+
 # ============== SEED DATA ==============
 
 @quickcut_router.post("/seed")
@@ -565,7 +625,7 @@ async def seed_database():
             "name": "James Murphy",
             "email": "james@fadedublin.ie",
             "phone": "+353851234567",
-            "password": hash_password("barber123"),
+            "password": await hash_password("barber123"),
             "role": UserRole.BARBER,
             "shop_name": "Fade Factory Dublin",
             "bio": "Master barber with 10+ years experience. Specializing in fades and beard grooming.",
@@ -587,7 +647,7 @@ async def seed_database():
             "name": "Sean O'Connor",
             "email": "sean@craftedcut.ie",
             "phone": "+353852345678",
-            "password": hash_password("barber123"),
+            "password": await hash_password("barber123"),
             "role": UserRole.BARBER,
             "shop_name": "The Crafted Cut",
             "bio": "Traditional and modern styles. Winner of Dublin Barber Awards 2024.",
@@ -608,7 +668,7 @@ async def seed_database():
             "name": "Patrick Kelly",
             "email": "patrick@precisionbarbers.ie",
             "phone": "+353853456789",
-            "password": hash_password("barber123"),
+            "password": await hash_password("barber123"),
             "role": UserRole.BARBER,
             "shop_name": "Precision Barbers",
             "bio": "Expert in hair designs and creative cuts. Your style, perfected.",
@@ -632,7 +692,7 @@ async def seed_database():
         "name": "John Doe",
         "email": "john@example.com",
         "phone": "+353854567890",
-        "password": hash_password("client123"),
+        "password": await hash_password("client123"),
         "role": UserRole.CLIENT,
         "favorite_barbers": [],
         "created_at": datetime.now(timezone.utc).isoformat(),
@@ -641,6 +701,7 @@ async def seed_database():
     # Clear existing data
     await db.quickcut_users.delete_many({})
     await db.quickcut_bookings.delete_many({})
+    user_cache.clear()
     
     # Insert data
     await db.quickcut_users.insert_many(barbers)
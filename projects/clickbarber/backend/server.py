@@ -4,6 +4,7 @@ from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import sys
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
@@ -14,6 +15,11 @@ import hashlib
 import jwt
 import math
 
+# Helpers shared by every backend live in shared/ at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from shared.hydrate import hydrate
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
@@ -360,9 +366,9 @@ async def get_my_position(user: dict = Depends(get_current_user)):
     for e in entries:
         if isinstance(e.get("created_at"), str):
             e["created_at"] = datetime.fromisoformat(e["created_at"])
-        # Get barber info
-        barber = await db.users.find_one({"id": e["barber_id"]}, {"_id": 0, "name": 1, "photo_url": 1, "address": 1})
-        e["barber"] = barber
+    
+    # Barber info for all entries in one query
+    await hydrate(entries, db.users, "barber_id", "barber", {"_id": 0, "name": 1, "photo_url": 1, "address": 1})
     
     return entries
 
@@ -2,45 +2,71 @@
 Chat Module - WebSocket-based real-time chat for Dublin Study
 Features:
 - Real-time messaging via WebSockets
+- Voice messages kept in a content-addressed blob store, referenced by URL
 - General group chat for all users
-- Online presence tracking
-- Message history (auto-delete after 2 days)
+- Online presence tracking, with typing indicators coalesced into periodic diffs
+- Per-user rate limits on message, typing and ping frames
+- Message history (auto-delete after 2 days) with sequence-number sync and resume on reconnect
 - Moderator controls (delete messages, ban users)
 - Emoji support
-- AI Agent "Agente Comunidade" powered by OpenAI GPT
+- AI Agent "Agente Comunidade" powered by OpenAI GPT: streamed answers (the default when OPENAI_API_KEY is set), cached FAQs,
+  bounded worker pool
 """
 
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, Query, UploadFile, File, Header
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Set
+from typing import AsyncIterator, Callable, List, Optional, Dict, Set, Tuple
 from datetime import datetime, timezone, timedelta
 import uuid
 import json
+import time
 import logging
 import jwt
 import asyncio
 import os
 from dotenv import load_dotenv
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from chat_agent import AgentPool, LLMUnavailable, ResponseCache, batched, create_llm, normalize_question
+from chat_bans import CHAT_BAN_RELOAD_SECONDS, ChatBanCache
+from chat_backplane import Backplane, InMemoryBackplane, create_backplane
+from chat_blobs import (
+    FALLBACK_CONTENT_TYPE, BlobStore, BlobTooLarge, audio_content_type, audio_url, create_blob_store,
+    decode_data_url, is_blob_id
+)
+from chat_broadcast import Broadcaster, OutboundConnection
+from chat_throttle import RateLimiter, TypingCoalescer
 
 # Load environment variables
 load_dotenv()
 
-# Import LLM for Agente Comunidade
-try:
-    from emergentintegrations.llm.chat import LlmChat, UserMessage
-    LLM_AVAILABLE = True
-except ImportError:
-    LLM_AVAILABLE = False
-    logging.warning("emergentintegrations not available - Agente Comunidade disabled")
-
 logger = logging.getLogger(__name__)
 
 # Will be set by main server.py
 db = None
 JWT_SECRET = None
+blob_store: Optional[BlobStore] = None
+ban_cache = ChatBanCache()
 JWT_ALGORITHM = "HS256"
 
+CHAT_PRESENCE_HEARTBEAT_SECONDS = int(os.environ.get('CHAT_PRESENCE_HEARTBEAT_SECONDS', '30'))
+CHAT_RESUME_MAX_MESSAGES = int(os.environ.get('CHAT_RESUME_MAX_MESSAGES', '200'))
+# How long a missing change_seq may still be an in-flight write rather than a superseded number
+CHAT_SYNC_GAP_GRACE_SECONDS = float(os.environ.get('CHAT_SYNC_GAP_GRACE_SECONDS', '2'))
+CHAT_BLOB_GC_SECONDS = int(os.environ.get('CHAT_BLOB_GC_SECONDS', '3600'))
+# Clips are uploaded before the message that references them is sent
+CHAT_BLOB_GC_GRACE_SECONDS = int(os.environ.get('CHAT_BLOB_GC_GRACE_SECONDS', '3600'))
+CHAT_BLOB_GC_BATCH = 500
+# Numbering messages stored before sequence numbers existed is a one-off, run by whichever worker leases it
+CHAT_SEQ_BACKFILL_LEASE_SECONDS = int(os.environ.get('CHAT_SEQ_BACKFILL_LEASE_SECONDS', '300'))
+CHAT_SEQ_BACKFILL_BATCH = 500
+
+# Never sent to clients: expire_at is internal, audio is fetched by URL
+MESSAGE_PROJECTION = {"_id": 0, "expire_at": 0, "audio_data": 0}
+
 # ============== AGENTE COMUNIDADE CONFIG ==============
 
 AGENTE_COMUNIDADE_NAME = "Agente Comunidade"
@@ -80,40 +106,50 @@ AGENTE_COMUNIDADE_SYSTEM_PROMPT = """Você é o Agente Comunidade da STUFF Inter
 
 Responda sempre de forma amigável e acolhedora, lembrando que muitos usuários estão ansiosos ou com medo de fazer intercâmbio pela primeira vez! 🇮🇪🇧🇷"""
 
-async def get_agente_comunidade_response(user_message: str, user_name: str) -> str:
-    """Get response from Agente Comunidade AI"""
-    if not LLM_AVAILABLE:
-        return "Desculpe, o Agente Comunidade está temporariamente indisponível. Por favor, tente novamente mais tarde! 🙏"
+AGENTE_UNAVAILABLE_REPLY = "Desculpe, o Agente Comunidade está temporariamente indisponível. Por favor, tente novamente mais tarde! 🙏"
+AGENTE_ERROR_REPLY = "Opa, tive um probleminha aqui! 😅 Pode repetir sua pergunta? Se o erro persistir, tente novamente em alguns minutos."
+AGENTE_BUSY_REPLY = "Estou respondendo muitas perguntas agora! 😅 Tente de novo em um minutinho."
+
+agente_llm = create_llm(AGENTE_COMUNIDADE_SYSTEM_PROMPT)
+agente_cache = ResponseCache()
+
+async def stream_agente_comunidade_response(user_message: str) -> AsyncIterator[str]:
+    """Answer chunks for a question: from the cache when it was asked before, from the call
+    already running when the same question is in flight, else from the LLM.
+    
+    The asker's name stays out of the prompt so answers can be shared between users.
+    """
+    key = normalize_question(user_message)
+    while True:
+        cached = agente_cache.get(key)
+        if cached:
+            yield cached
+            return
+        in_flight = agente_cache.join(key)
+        if in_flight is None:
+            break
+        answer = await in_flight
+        if answer:
+            yield answer
+            return
+        # The shared call failed: ask again
     
+    chunks = []
+    answer = None
     try:
-        api_key = os.getenv("EMERGENT_LLM_KEY")
-        if not api_key:
-            logger.error("EMERGENT_LLM_KEY not found in environment")
-            return "Desculpe, não consegui processar sua pergunta no momento. Tente novamente! 🙏"
-        
-        # Create a unique session for this conversation
-        session_id = f"agente-comunidade-{uuid.uuid4()}"
-        
-        # Initialize the chat
-        chat = LlmChat(
-            api_key=api_key,
-            session_id=session_id,
-            system_message=AGENTE_COMUNIDADE_SYSTEM_PROMPT
-        ).with_model("openai", "gpt-4.1")
-        
-        # Create the user message with context
-        message = UserMessage(
-            text=f"{user_name} perguntou: {user_message}"
-        )
-        
-        # Get response
-        response = await chat.send_message(message)
-        
-        return response
-        
+        async for chunk in agente_llm.stream(user_message):
+            chunks.append(chunk)
+            yield chunk
+        answer = "".join(chunks)
+    except LLMUnavailable as e:
+        logger.warning(f"Agente Comunidade unavailable: {e}")
+        if not chunks:
+            yield AGENTE_UNAVAILABLE_REPLY
     except Exception as e:
         logger.error(f"Error getting Agente Comunidade response: {e}")
-        return "Opa, tive um probleminha aqui! 😅 Pode repetir sua pergunta? Se o erro persistir, tente novamente em alguns minutos."
+        yield ("\n\n" if chunks else "") + AGENTE_ERROR_REPLY
+    finally:
+        agente_cache.finish(key, answer)
 
 def should_trigger_agente(content: str) -> bool:
     """Check if message should trigger Agente Comunidade"""
@@ -145,8 +181,13 @@ class ChatMessage(BaseModel):
     user_avatar: Optional[str] = None
     content: str
     message_type: str = "text"  # text, audio, system, deleted
-    audio_data: Optional[str] = None  # Base64 audio data
+    audio_data: Optional[str] = None  # Legacy inline base64 audio; new messages use audio_blob_id
+    audio_blob_id: Optional[str] = None  # SHA-256 of the clip in the blob store
+    audio_url: Optional[str] = None
     audio_duration: Optional[int] = None  # Duration in seconds
+    seq: Optional[int] = None  # Order of creation
+    change_seq: Optional[int] = None  # Sequence of the last change (creation or deletion), drives sync
+    changed_at: Optional[str] = None  # When change_seq was taken
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
     deleted: bool = False
     deleted_by: Optional[str] = None
@@ -181,49 +222,134 @@ class BanUserRequest(BaseModel):
 # ============== CONNECTION MANAGER ==============
 
 class ConnectionManager:
-    """Manages WebSocket connections for the chat"""
+    """Manages this worker's WebSocket connections and relays events to the other workers.
+
+    Broadcasts and personal messages for users connected elsewhere go through the
+    backplane; presence of remote users is kept from join/leave events and periodic
+    per-worker snapshots, so a worker that vanishes drops out after a few heartbeats.
+    """
     
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}  # user_id -> websocket
+    def __init__(self, backplane: Optional[Backplane] = None):
+        self.broadcaster = Broadcaster()
+        self.backplane = backplane or InMemoryBackplane()
         self.user_info: Dict[str, dict] = {}  # user_id -> user info
+        self.remote_workers: Dict[str, dict] = {}  # worker_id -> {"users": {user_id: info}, "seen": monotonic}
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._snapshot_tasks: Set[asyncio.Task] = set()  # held so the event loop cannot drop them
+        self.event_handlers: Dict[str, Callable[[dict], None]] = {}  # extra event kinds, e.g. "ban"
+    
+    @property
+    def active_connections(self) -> Dict[str, OutboundConnection]:
+        return self.broadcaster.connections  # user_id -> outbound connection
     
-    async def connect(self, websocket: WebSocket, user_id: str, user_info: dict):
+    async def start(self):
+        await self.backplane.start(self.handle_remote_event)
+        self._heartbeat_task = asyncio.create_task(self._presence_heartbeat())
+    
+    async def stop(self):
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+        for task in self._snapshot_tasks:
+            task.cancel()
+        await asyncio.gather(*self._snapshot_tasks, return_exceptions=True)
+        await self.relay({"kind": "presence", "op": "shutdown"})
+        await self.backplane.stop()
+    
+    async def connect(self, websocket: WebSocket, user_id: str, user_info: dict) -> OutboundConnection:
         await websocket.accept()
-        self.active_connections[user_id] = websocket
+        connection = self.broadcaster.add(websocket, user_id)
         self.user_info[user_id] = user_info
+        await self.relay({"kind": "presence", "op": "join", "user": user_info})
         logger.info(f"User {user_info.get('name', user_id)} connected to chat")
+        return connection
     
-    def disconnect(self, user_id: str):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-        if user_id in self.user_info:
-            del self.user_info[user_id]
+    async def disconnect(self, user_id: str, connection: Optional[OutboundConnection] = None) -> bool:
+        """Drop the user's connection; returns False when a newer connection already replaced it"""
+        if not self.broadcaster.remove(user_id, connection):
+            return False
+        self.user_info.pop(user_id, None)
+        await self.relay({"kind": "presence", "op": "leave", "user_id": user_id})
         logger.info(f"User {user_id} disconnected from chat")
+        return True
     
     async def broadcast(self, message: dict):
-        """Send message to all connected users"""
-        disconnected = []
-        for user_id, connection in self.active_connections.items():
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error sending to {user_id}: {e}")
-                disconnected.append(user_id)
-        
-        # Clean up disconnected users
-        for user_id in disconnected:
-            self.disconnect(user_id)
+        """Send message to all connected users on every worker; never waits on a slow socket"""
+        self.broadcaster.broadcast(message)
+        await self.relay({"kind": "broadcast", "message": message})
     
     async def send_personal(self, user_id: str, message: dict):
-        """Send message to specific user"""
+        """Send message to specific user, wherever they are connected"""
         if user_id in self.active_connections:
-            try:
-                await self.active_connections[user_id].send_json(message)
-            except Exception as e:
-                logger.error(f"Error sending personal message to {user_id}: {e}")
+            self.broadcaster.send(user_id, message)
+        elif self._remote_user(user_id):
+            await self.relay({"kind": "personal", "user_id": user_id, "message": message})
+    
+    async def relay(self, event: dict):
+        """Publish an event to the other workers"""
+        try:
+            await self.backplane.publish(event)
+        except Exception as e:
+            logger.error(f"Chat backplane publish failed: {e}")
+    
+    async def handle_remote_event(self, event: dict):
+        """Apply an event published by another worker"""
+        kind = event.get("kind")
+        if kind == "broadcast":
+            self.broadcaster.broadcast(event["message"])
+        elif kind == "personal":
+            self.broadcaster.send(event["user_id"], event["message"])
+        elif kind == "presence":
+            self._apply_presence(event)
+        elif kind in self.event_handlers:
+            self.event_handlers[kind](event)
+    
+    def on_event(self, kind: str, handler: Callable[[dict], None]):
+        """Register a handler for another worker's events of `kind`"""
+        self.event_handlers[kind] = handler
+    
+    def _apply_presence(self, event: dict):
+        origin = event["origin"]
+        known = origin in self.remote_workers
+        worker = self.remote_workers.setdefault(origin, {"users": {}, "seen": 0.0})
+        worker["seen"] = time.monotonic()
+        op = event.get("op")
+        if op == "join":
+            worker["users"][event["user"]["id"]] = event["user"]
+        elif op == "leave":
+            worker["users"].pop(event["user_id"], None)
+        elif op == "snapshot":
+            worker["users"] = {u["id"]: u for u in event["users"]}
+            if not known:
+                # A worker we had not heard from yet: tell it who is connected here
+                task = asyncio.create_task(self._publish_snapshot())
+                self._snapshot_tasks.add(task)
+                task.add_done_callback(self._snapshot_tasks.discard)
+        elif op == "shutdown":
+            self.remote_workers.pop(origin, None)
+    
+    async def _publish_snapshot(self):
+        await self.relay({"kind": "presence", "op": "snapshot", "users": list(self.user_info.values())})
+    
+    async def _presence_heartbeat(self):
+        while True:
+            await self._publish_snapshot()
+            stale_before = time.monotonic() - 3 * CHAT_PRESENCE_HEARTBEAT_SECONDS
+            for worker_id in [w for w, info in self.remote_workers.items() if info["seen"] < stale_before]:
+                del self.remote_workers[worker_id]
+            await asyncio.sleep(CHAT_PRESENCE_HEARTBEAT_SECONDS)
+    
+    def _remote_user(self, user_id: str) -> Optional[dict]:
+        for worker in self.remote_workers.values():
+            if user_id in worker["users"]:
+                return worker["users"][user_id]
+        return None
     
     def get_online_users(self) -> List[dict]:
-        """Get list of online users"""
+        """Get list of online users across all workers"""
+        users = {}
+        for worker in self.remote_workers.values():
+            users.update(worker["users"])
+        users.update(self.user_info)
         return [
             {
                 "user_id": user_id,
@@ -231,21 +357,118 @@ class ConnectionManager:
                 "user_avatar": info.get("avatar"),
                 "role": info.get("role", "student")
             }
-            for user_id, info in self.user_info.items()
+            for user_id, info in users.items()
         ]
     
+    def online_count(self) -> int:
+        return len(self.get_online_users())
+    
     def is_online(self, user_id: str) -> bool:
-        return user_id in self.active_connections
+        return user_id in self.active_connections or self._remote_user(user_id) is not None
+    
+    def stats(self) -> dict:
+        return {
+            **self.broadcaster.stats(),
+            "remote_workers": len(self.remote_workers),
+            "online_users": self.online_count(),
+            "backplane": self.backplane.stats()
+        }
 
 manager = ConnectionManager()
+rate_limiter = RateLimiter()
+typing_coalescer = TypingCoalescer(manager.broadcast)
 
 # ============== HELPER FUNCTIONS ==============
 
 def init_chat_module(database, jwt_secret):
     """Initialize the chat module with database and JWT secret"""
-    global db, JWT_SECRET
+    global db, JWT_SECRET, blob_store
     db = database
     JWT_SECRET = jwt_secret
+    manager.backplane = create_backplane(database)
+    blob_store = create_blob_store(database)
+
+def apply_ban_event(event: dict):
+    """Mirror a ban or unban made on another worker"""
+    if event["op"] == "add":
+        ban_cache.add(event["ban"])
+    else:
+        ban_cache.remove(event["user_id"])
+
+# Strong references to the chat's background loops, cancelled by stop_chat
+chat_tasks: List[asyncio.Task] = []
+
+async def reload_bans_loop():
+    """Reload bans periodically in case an event was missed or a ban was edited in the database"""
+    while True:
+        await asyncio.sleep(CHAT_BAN_RELOAD_SECONDS)
+        try:
+            await ban_cache.load(db)
+        except Exception as e:
+            logger.error(f"Chat ban reload failed: {e}")
+
+async def collect_audio_blobs() -> int:
+    """Delete blobs past the grace period that no live message references; returns how many"""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=CHAT_BLOB_GC_GRACE_SECONDS)
+    deleted = 0
+    blob_ids = await blob_store.older_than(cutoff, CHAT_BLOB_GC_BATCH)
+    # Page forward by id: restarting from the first old blob would stall behind a full batch
+    # of clips that live messages still reference
+    while blob_ids:
+        referenced = set(await db.chat_messages.distinct(
+            "audio_blob_id", {"audio_blob_id": {"$in": blob_ids}, "deleted": False}
+        ))
+        for blob_id in blob_ids:
+            if blob_id not in referenced:
+                await blob_store.delete(blob_id)
+                deleted += 1
+        if len(blob_ids) < CHAT_BLOB_GC_BATCH:
+            break
+        blob_ids = await blob_store.older_than(cutoff, CHAT_BLOB_GC_BATCH, after=blob_ids[-1])
+    return deleted
+
+async def blob_gc_loop():
+    """Reclaim audio once its messages are deleted or expired by the TTL index"""
+    while True:
+        await asyncio.sleep(CHAT_BLOB_GC_SECONDS)
+        try:
+            deleted = await collect_audio_blobs()
+            if deleted:
+                logger.info(f"Chat blob GC removed {deleted} unreferenced clips")
+        except Exception as e:
+            logger.error(f"Chat blob GC failed: {e}")
+
+async def start_chat():
+    """Load bans and start relaying chat events, presence and bans between workers"""
+    await ban_cache.load(db)
+    manager.on_event("ban", apply_ban_event)
+    await manager.start()
+    typing_coalescer.start()
+    agente_pool.start()
+    chat_tasks.extend([
+        asyncio.create_task(reload_bans_loop()),
+        asyncio.create_task(blob_gc_loop())
+    ])
+
+async def stop_chat():
+    for task in chat_tasks:
+        task.cancel()
+    await asyncio.gather(*chat_tasks, return_exceptions=True)
+    chat_tasks.clear()
+    await agente_pool.stop()
+    typing_coalescer.stop()
+    await manager.stop()
+
+def chat_stats() -> dict:
+    """Fan-out, backplane and blob store counters for the metrics endpoint"""
+    return {
+        **manager.stats(),
+        "blobs": blob_store.stats() if blob_store else None,
+        "bans": ban_cache.stats(),
+        "rate_limits": rate_limiter.stats(),
+        "typing": typing_coalescer.stats(),
+        "agente": {**agente_pool.stats(), "cache": agente_cache.stats()}
+    }
 
 async def verify_token(token: str) -> Optional[dict]:
     """Verify JWT token and return user data"""
@@ -257,21 +480,13 @@ async def verify_token(token: str) -> Optional[dict]:
         logger.error(f"Token verification failed: {e}")
         return None
 
-async def is_user_banned(user_id: str) -> bool:
-    """Check if user is currently banned"""
-    ban = await db.chat_bans.find_one({
-        "user_id": user_id,
-        "expires_at": {"$gt": datetime.now(timezone.utc).isoformat()}
-    })
-    return ban is not None
+def is_user_banned(user_id: str) -> bool:
+    """Check if user is currently banned (answered from the in-memory ban cache)"""
+    return ban_cache.get(user_id) is not None
 
-async def get_ban_info(user_id: str) -> Optional[dict]:
+def get_ban_info(user_id: str) -> Optional[dict]:
     """Get ban information for a user"""
-    ban = await db.chat_bans.find_one({
-        "user_id": user_id,
-        "expires_at": {"$gt": datetime.now(timezone.utc).isoformat()}
-    }, {"_id": 0})
-    return ban
+    return ban_cache.get(user_id)
 
 async def setup_ttl_index():
     """Setup TTL index for auto-deleting messages after 2 days"""
@@ -285,26 +500,218 @@ async def setup_ttl_index():
     except Exception as e:
         logger.warning(f"TTL index setup: {e}")
 
+async def next_chat_seq() -> int:
+    """Atomically take the next chat sequence number"""
+    counter = await db.chat_counters.find_one_and_update(
+        {"_id": "chat_messages"},
+        {"$inc": {"seq": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
+
+async def current_chat_seq() -> int:
+    counter = await db.chat_counters.find_one({"_id": "chat_messages"})
+    return counter["seq"] if counter else 0
+
+def first_open_gap(changes: List[dict], after: int, settled_before: str) -> Optional[int]:
+    """Index of the first change preceded by a missing number that may still be in flight.
+
+    Numbers are taken before the write lands, so N+1 can be stored (and broadcast) before N.
+    A gap followed by an older change is settled: its number was superseded (a deleted
+    message takes a new change_seq) or never written.
+    """
+    expected = after + 1
+    for index, change in enumerate(changes):
+        if change["change_seq"] != expected and (change.get("changed_at") or "") > settled_before:
+            return index
+        expected = change["change_seq"] + 1
+    return None
+
+async def messages_since(change_seq: int, limit: int) -> Tuple[List[dict], bool]:
+    """Messages created or deleted after `change_seq`, oldest change first; deletions come back as tombstones.
+    
+    Gap-safe without waiting: changes after a number that may still be in flight are held back,
+    so a client resuming from the highest change_seq returned never skips one. Returns
+    (changes, held_back); when held_back is True the caller should ask again shortly.
+    """
+    changes = await db.chat_messages.find(
+        {"change_seq": {"$gt": change_seq}},
+        MESSAGE_PROJECTION
+    ).sort("change_seq", 1).limit(limit).to_list(limit)
+    settled_before = (datetime.now(timezone.utc) - timedelta(seconds=CHAT_SYNC_GAP_GRACE_SECONDS)).isoformat()
+    gap = first_open_gap(changes, change_seq, settled_before)
+    if gap is None:
+        return changes, False
+    return changes[:gap], True
+
+async def backfill_chat_seq():
+    """Number messages stored before sequence numbers existed, in creation order.
+    
+    Only the worker holding the backfill lease runs it, and it is marked done afterwards, so
+    later startups skip it. Numbers for all of them are taken in one counter update, and each
+    batch is written with a single bulk_write.
+    """
+    now = datetime.now(timezone.utc)
+    lease = {"lease_until": (now + timedelta(seconds=CHAT_SEQ_BACKFILL_LEASE_SECONDS)).isoformat()}
+    try:
+        await db.chat_counters.find_one_and_update(
+            {"_id": "chat_seq_backfill", "done": {"$ne": True}, "$or": [
+                {"lease_until": {"$exists": False}},
+                {"lease_until": {"$lt": now.isoformat()}}
+            ]},
+            {"$set": lease},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return  # already done, or another worker holds the lease
+    
+    unnumbered = {"seq": {"$exists": False}}
+    total = await db.chat_messages.count_documents(unnumbered)
+    if total:
+        counter = await db.chat_counters.find_one_and_update(
+            {"_id": "chat_messages"},
+            {"$inc": {"seq": total}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        seq = counter["seq"] - total
+        while True:
+            batch = await db.chat_messages.find(unnumbered, {"_id": 0, "id": 1}).sort(
+                "created_at", 1
+            ).limit(CHAT_SEQ_BACKFILL_BATCH).to_list(CHAT_SEQ_BACKFILL_BATCH)
+            if not batch:
+                break
+            await db.chat_messages.bulk_write([
+                UpdateOne({"id": m["id"], **unnumbered}, {"$set": {"seq": seq + i, "change_seq": seq + i}})
+                for i, m in enumerate(batch, start=1)
+            ], ordered=False)
+            seq += len(batch)
+            await db.chat_counters.update_one({"_id": "chat_seq_backfill"}, {"$set": {
+                "lease_until": (datetime.now(timezone.utc) + timedelta(seconds=CHAT_SEQ_BACKFILL_LEASE_SECONDS)).isoformat()
+            }})
+        logger.info(f"Numbered {total} chat messages stored before sequence numbers")
+    
+    await db.chat_counters.update_one({"_id": "chat_seq_backfill"}, {"$set": {"done": True}, "$unset": {"lease_until": ""}})
+
+async def migrate_inline_audio():
+    """Move base64 audio still stored inside chat messages into the blob store"""
+    migrated = 0
+    async for message in db.chat_messages.find({"audio_data": {"$nin": [None, ""]}}, {"_id": 0, "id": 1, "audio_data": 1}):
+        try:
+            data, content_type = decode_data_url(message["audio_data"])
+            blob = await blob_store.put(data, content_type)
+        except Exception as e:
+            logger.warning(f"Could not migrate audio of message {message['id']}: {e}")
+            continue
+        await db.chat_messages.update_one(
+            {"id": message["id"]},
+            {"$set": {"audio_blob_id": blob["blob_id"], "audio_url": audio_url(blob["blob_id"]), "audio_data": None}}
+        )
+        migrated += 1
+    if migrated:
+        logger.info(f"Moved {migrated} inline chat audio clips to the blob store")
+
+def parse_range(header: Optional[str], size: int) -> Optional[tuple]:
+    """Parse a single "bytes=start-end" range into an inclusive (start, end); None for the whole blob"""
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise ValueError(header)
+    first, _, last = spec.strip().partition("-")
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start = max(0, size - int(last))  # suffix range: the last N bytes
+        end = size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
 # ============== REST ENDPOINTS ==============
 
 @chat_router.get("/messages")
 async def get_messages(
     limit: int = Query(50, ge=1, le=100),
-    before: Optional[str] = None
+    before: Optional[int] = None,
+    since: Optional[int] = None
 ):
-    """Get recent chat messages"""
+    """Get chat messages keyed by sequence number.
+    
+    - no cursor: the latest `limit` messages
+    - before=<seq>: the `limit` messages preceding that seq (scroll back)
+    - since=<change_seq>: {"messages", "complete"} with what changed after that point, oldest
+      first, deletions included; repeat with the highest change_seq received until complete
+      (changes behind an in-flight write are held back, so retry those after a short pause)
+    """
+    if since is not None:
+        changes, held_back = await messages_since(since, limit)
+        return {"messages": changes, "complete": not held_back and len(changes) < limit}
+    
     query = {"deleted": False}
-    if before:
-        query["created_at"] = {"$lt": before}
+    if before is not None:
+        query["seq"] = {"$lt": before}
     
     messages = await db.chat_messages.find(
         query, 
-        {"_id": 0, "expire_at": 0}  # Exclude only _id and expire_at
-    ).sort("created_at", -1).limit(limit).to_list(limit)
+        MESSAGE_PROJECTION
+    ).sort("seq", -1).limit(limit).to_list(limit)
     
     # Return in chronological order
     return list(reversed(messages))
 
+@chat_router.post("/audio")
+async def upload_audio(token: str = Query(...), file: UploadFile = File(...)):
+    """Store a voice clip once; the returned blob id goes in the WebSocket message"""
+    user = await verify_token(token)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    content_type = audio_content_type(file.content_type)
+    if not content_type:
+        raise HTTPException(status_code=415, detail="Formato de áudio não suportado")
+    
+    data = await file.read(blob_store.max_bytes + 1)
+    try:
+        blob = await blob_store.put(data, content_type)
+    except BlobTooLarge:
+        raise HTTPException(status_code=413, detail="Áudio muito longo")
+    return {**blob, "audio_url": audio_url(blob["blob_id"])}
+
+@chat_router.get("/audio/{blob_id}")
+async def get_audio(blob_id: str, range_header: Optional[str] = Header(None, alias="Range")):
+    """Stream a voice clip, honouring single Range requests so players can seek"""
+    blob = await blob_store.stat(blob_id) if is_blob_id(blob_id) else None
+    if not blob:
+        raise HTTPException(status_code=404, detail="Audio not found")
+    
+    size = blob["size"]
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Invalid range", headers={"Content-Range": f"bytes */{size}"})
+    start, end = byte_range or (0, size - 1)
+    
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(end - start + 1),
+        # Content-addressed: the bytes behind an id never change
+        "Cache-Control": "public, max-age=31536000, immutable",
+        # User uploads: never let the browser sniff them into something renderable
+        "X-Content-Type-Options": "nosniff",
+        "Content-Disposition": "inline"
+    }
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(
+        blob_store.read_range(blob_id, start, end) if size else iter(()),
+        status_code=206 if byte_range else 200,
+        media_type=audio_content_type(blob["content_type"]) or FALLBACK_CONTENT_TYPE,
+        headers=headers
+    )
+
 @chat_router.get("/online")
 async def get_online_users_endpoint():
     """Get list of currently online users"""
@@ -313,7 +720,7 @@ async def get_online_users_endpoint():
 @chat_router.get("/ban-status")
 async def check_ban_status(user_id: str):
     """Check if a user is banned"""
-    ban = await get_ban_info(user_id)
+    ban = get_ban_info(user_id)
     if ban:
         return {
             "banned": True,
@@ -343,14 +750,19 @@ async def delete_message(message_id: str, token: str = Query(...)):
     
     # Mark message as deleted
     deleted_text = "[Mensagem apagada]" if is_own_message else "[Mensagem removida pelo moderador]"
+    change_seq = await next_chat_seq()
     result = await db.chat_messages.update_one(
         {"id": message_id},
         {"$set": {
+            "change_seq": change_seq,
+            "changed_at": datetime.now(timezone.utc).isoformat(),
             "deleted": True,
             "deleted_by": user["id"],
             "content": deleted_text,
             "message_type": "deleted",
-            "audio_data": None  # Remove audio data too
+            "audio_data": None,  # Remove audio data too
+            "audio_blob_id": None,  # the blob itself goes with the next garbage collection
+            "audio_url": None
         }}
     )
     
@@ -358,6 +770,7 @@ async def delete_message(message_id: str, token: str = Query(...)):
     await manager.broadcast({
         "type": "message_deleted",
         "message_id": message_id,
+        "change_seq": change_seq,
         "deleted_by": user["name"]
     })
     
@@ -394,6 +807,8 @@ async def ban_user(request: BanUserRequest, token: str = Query(...)):
     )
     
     await db.chat_bans.insert_one(ban.model_dump())
+    ban_cache.add(ban.model_dump())
+    await manager.relay({"kind": "ban", "op": "add", "ban": ban.model_dump()})
     
     # Notify the banned user and disconnect them
     await manager.send_personal(request.user_id, {
@@ -423,6 +838,8 @@ async def unban_user(user_id: str, token: str = Query(...)):
         raise HTTPException(status_code=403, detail="Admin access required")
     
     result = await db.chat_bans.delete_many({"user_id": user_id})
+    ban_cache.remove(user_id)
+    await manager.relay({"kind": "ban", "op": "remove", "user_id": user_id})
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="No ban found for user")
@@ -450,28 +867,44 @@ async def get_banned_users(token: str = Query(...)):
 # ============== AGENTE COMUNIDADE HANDLER ==============
 
 async def process_agente_comunidade_response(user_message: str, user_name: str):
-    """Process and broadcast Agente Comunidade response"""
+    """Stream an Agente Comunidade answer to everyone, then store it as a normal message.
+    
+    Frames: agent_stream_start, agent_stream_delta (batched chunks), then the usual
+    "message" frame with the same id, so clients that ignore the stream still get the answer.
+    Answers that come in one piece (cache hits, backends without streaming) skip the
+    stream frames and go out as the "message" frame alone.
+    """
+    agent_message = ChatMessage(
+        user_id=AGENTE_COMUNIDADE_ID,
+        user_name=AGENTE_COMUNIDADE_NAME,
+        user_avatar=None,
+        content="",
+        message_type="text"
+    )
     try:
-        # Show typing indicator
-        await manager.broadcast({
-            "type": "typing",
-            "user_id": AGENTE_COMUNIDADE_ID,
-            "user_name": AGENTE_COMUNIDADE_NAME
-        })
+        # Show typing indicator until the answer is out
+        typing_coalescer.mark(AGENTE_COMUNIDADE_ID, AGENTE_COMUNIDADE_NAME, ttl_seconds=60)
         
-        # Get AI response
-        response = await get_agente_comunidade_response(user_message, user_name)
-        
-        # Create agent message
-        agent_message = ChatMessage(
-            user_id=AGENTE_COMUNIDADE_ID,
-            user_name=AGENTE_COMUNIDADE_NAME,
-            user_avatar=None,
-            content=response,
-            message_type="text"
-        )
+        chunks = []
+        async for delta in batched(stream_agente_comunidade_response(user_message)):
+            chunks.append(delta)
+            if len(chunks) == 1:
+                continue  # held back until a second delta shows the answer really streams
+            if len(chunks) == 2:
+                await manager.broadcast({
+                    "type": "agent_stream_start",
+                    "message_id": agent_message.id,
+                    "user_id": AGENTE_COMUNIDADE_ID,
+                    "user_name": AGENTE_COMUNIDADE_NAME,
+                    "created_at": agent_message.created_at
+                })
+                await manager.broadcast({"type": "agent_stream_delta", "message_id": agent_message.id, "delta": chunks[0]})
+            await manager.broadcast({"type": "agent_stream_delta", "message_id": agent_message.id, "delta": delta})
+        agent_message.content = "".join(chunks) or AGENTE_ERROR_REPLY
         
         # Save to database
+        agent_message.seq = agent_message.change_seq = await next_chat_seq()
+        agent_message.changed_at = datetime.now(timezone.utc).isoformat()
         message_dict = agent_message.model_dump()
         message_dict["expire_at"] = datetime.now(timezone.utc) + timedelta(days=2)
         message_dict["is_agent"] = True
@@ -487,6 +920,8 @@ async def process_agente_comunidade_response(user_message: str, user_name: str):
                 "user_avatar": agent_message.user_avatar,
                 "content": agent_message.content,
                 "message_type": agent_message.message_type,
+                "seq": agent_message.seq,
+                "change_seq": agent_message.change_seq,
                 "created_at": agent_message.created_at,
                 "is_agent": True
             }
@@ -496,12 +931,20 @@ async def process_agente_comunidade_response(user_message: str, user_name: str):
         
     except Exception as e:
         logger.error(f"Error in Agente Comunidade handler: {e}")
+    finally:
+        typing_coalescer.clear(AGENTE_COMUNIDADE_ID)
+
+agente_pool = AgentPool(process_agente_comunidade_response)
 
 # ============== WEBSOCKET ENDPOINT ==============
 
 @chat_router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket, token: str = Query(...)):
-    """WebSocket endpoint for real-time chat"""
+async def websocket_endpoint(websocket: WebSocket, token: str = Query(...), resume: Optional[int] = Query(None)):
+    """WebSocket endpoint for real-time chat.
+    
+    `resume` is the highest change_seq the client has seen; what it missed while
+    disconnected is replayed in a "sync" frame right after "connected".
+    """
     
     # Verify token
     user = await verify_token(token)
@@ -512,8 +955,8 @@ async def websocket_endpoint(websocket: WebSocket, token: str = Query(...)):
     user_id = user["id"]
     
     # Check if user is banned
-    if await is_user_banned(user_id):
-        ban_info = await get_ban_info(user_id)
+    ban_info = get_ban_info(user_id)
+    if ban_info:
         await websocket.close(code=4002, reason=f"Banned until {ban_info.get('expires_at')}")
         return
     
@@ -525,16 +968,28 @@ async def websocket_endpoint(websocket: WebSocket, token: str = Query(...)):
         "role": user.get("role", "student")
     }
     
-    await manager.connect(websocket, user_id, user_info)
+    connection = await manager.connect(websocket, user_id, user_info)
     
     try:
-        # Send initial data to user
-        await websocket.send_json({
+        # Send initial data to user (all writes go through the connection's send queue)
+        # The connection is already registered, so nothing can fall between the replay and live frames
+        await manager.send_personal(user_id, {
             "type": "connected",
             "user": user_info,
-            "online_users": manager.get_online_users()
+            "online_users": manager.get_online_users(),
+            "resume_token": await current_chat_seq()
         })
         
+        if resume is not None:
+            missed, held_back = await messages_since(resume, CHAT_RESUME_MAX_MESSAGES + 1)
+            await manager.send_personal(user_id, {
+                "type": "sync",
+                "messages": missed[:CHAT_RESUME_MAX_MESSAGES],
+                # More than the cap, or held back behind an in-flight write: the client pages
+                # the rest with GET /messages?since=
+                "complete": not held_back and len(missed) <= CHAT_RESUME_MAX_MESSAGES
+            })
+        
         # Broadcast user joined
         await manager.broadcast({
             "type": "user_joined",
@@ -543,40 +998,67 @@ async def websocket_endpoint(websocket: WebSocket, token: str = Query(...)):
                 "user_name": user_info["name"],
                 "role": user_info["role"]
             },
-            "online_count": len(manager.active_connections)
+            "online_count": manager.online_count()
         })
         
         # Listen for messages
         while True:
             data = await websocket.receive_json()
             
+            if not rate_limiter.allow(user_id, data.get("type")):
+                # Extra typing and ping frames are dropped silently; messages get an answer
+                if data.get("type") == "message":
+                    await manager.send_personal(user_id, {
+                        "type": "error",
+                        "message": "Você está enviando mensagens rápido demais. Aguarde um pouco."
+                    })
+                continue
+            
             if data.get("type") == "message":
                 content = data.get("content", "").strip()
                 message_type = data.get("message_type", "text")
+                audio_blob_id = data.get("audio_blob_id")
                 audio_data = data.get("audio_data")
                 audio_duration = data.get("audio_duration")
                 
-                logger.info(f"Message from {user_info['name']}: type={message_type}, content_len={len(content)}, has_audio={bool(audio_data)}")
-                
-                # For audio messages, allow larger content (base64)
-                max_length = 5000000 if message_type == "audio" else 1000
+                logger.info(f"Message from {user_info['name']}: type={message_type}, content_len={len(content)}, has_audio={bool(audio_blob_id or audio_data)}")
                 
-                if not content or len(content) > max_length:
+                if not content or len(content) > 1000:
                     logger.warning(f"Invalid message from {user_info['name']}: empty={not content}, len={len(content)}")
-                    await websocket.send_json({
+                    await manager.send_personal(user_id, {
                         "type": "error",
                         "message": "Mensagem inválida (vazia ou muito longa)"
                     })
                     continue
                 
                 # Check if still not banned
-                if await is_user_banned(user_id):
-                    await websocket.send_json({
+                if is_user_banned(user_id):
+                    await manager.send_personal(user_id, {
                         "type": "error",
                         "message": "Você foi banido do chat"
                     })
                     continue
                 
+                # Audio travels as a blob reference; older clients still send base64 inline
+                if message_type == "audio":
+                    try:
+                        if audio_data and not audio_blob_id:
+                            clip, content_type = decode_data_url(audio_data)
+                            if not audio_content_type(content_type):
+                                raise ValueError(f"not an audio clip: {content_type}")
+                            audio_blob_id = (await blob_store.put(clip, content_type))["blob_id"]
+                        elif not (is_blob_id(audio_blob_id) and await blob_store.stat(audio_blob_id)):
+                            raise ValueError("unknown audio blob")
+                    except Exception as e:
+                        logger.warning(f"Rejected audio from {user_info['name']}: {e}")
+                        await manager.send_personal(user_id, {
+                            "type": "error",
+                            "message": "Áudio inválido ou muito longo"
+                        })
+                        continue
+                else:
+                    audio_blob_id = None
+                
                 # Create message
                 message = ChatMessage(
                     user_id=user_id,
@@ -584,11 +1066,14 @@ async def websocket_endpoint(websocket: WebSocket, token: str = Query(...)):
                     user_avatar=user_info.get("avatar"),
                     content=content,
                     message_type=message_type,
-                    audio_data=audio_data,
+                    audio_blob_id=audio_blob_id,
+                    audio_url=audio_url(audio_blob_id) if audio_blob_id else None,
                     audio_duration=audio_duration
                 )
                 
                 # Save to database with TTL (2 days = 48 hours)
+                message.seq = message.change_seq = await next_chat_seq()
+                message.changed_at = datetime.now(timezone.utc).isoformat()
                 message_dict = message.model_dump()
                 message_dict["expire_at"] = datetime.now(timezone.utc) + timedelta(days=2)
                 await db.chat_messages.insert_one(message_dict)
@@ -603,45 +1088,45 @@ async def websocket_endpoint(websocket: WebSocket, token: str = Query(...)):
                         "user_avatar": message.user_avatar,
                         "content": message.content,
                         "message_type": message.message_type,
-                        "audio_data": message.audio_data,
+                        "audio_url": message.audio_url,
                         "audio_duration": message.audio_duration,
+                        "seq": message.seq,
+                        "change_seq": message.change_seq,
                         "created_at": message.created_at,
                         "is_admin": user_info["role"] == "admin"
                     }
                 })
                 
+                typing_coalescer.clear(user_id)
+                
                 # Check if message should trigger Agente Comunidade
                 if message_type == "text" and should_trigger_agente(content):
-                    # Process in background to not block
-                    asyncio.create_task(
-                        process_agente_comunidade_response(
-                            clean_message_for_ai(content),
-                            user_info["name"]
-                        )
-                    )
+                    # Answered by the agent pool; a full queue turns the question away
+                    if not agente_pool.submit(clean_message_for_ai(content), user_info["name"]):
+                        await manager.send_personal(user_id, {
+                            "type": "system",
+                            "content": AGENTE_BUSY_REPLY,
+                            "created_at": datetime.now(timezone.utc).isoformat()
+                        })
             
             elif data.get("type") == "typing":
-                # Broadcast typing indicator
-                await manager.broadcast({
-                    "type": "typing",
-                    "user_id": user_id,
-                    "user_name": user_info["name"]
-                })
+                # Published with everyone else's typing state on the next flush
+                typing_coalescer.mark(user_id, user_info["name"])
             
             elif data.get("type") == "ping":
-                await websocket.send_json({"type": "pong"})
+                await manager.send_personal(user_id, {"type": "pong"})
     
     except WebSocketDisconnect:
         logger.info(f"User {user_info['name']} disconnected")
     except Exception as e:
         logger.error(f"WebSocket error for user {user_id}: {e}")
     finally:
-        manager.disconnect(user_id)
-        
-        # Broadcast user left
-        await manager.broadcast({
-            "type": "user_left",
-            "user_id": user_id,
-            "user_name": user_info["name"],
-            "online_count": len(manager.active_connections)
-        })
+        typing_coalescer.clear(user_id)
+        if await manager.disconnect(user_id, connection):
+            # Broadcast user left
+            await manager.broadcast({
+                "type": "user_left",
+                "user_id": user_id,
+                "user_name": user_info["name"],
+                "online_count": manager.online_count()
+            })
@@ -0,0 +1,296 @@
+"""
+Chat Agent Module - runtime for the Agente Comunidade assistant
+Features:
+- Pluggable LLM backends: Emergent (OpenAI GPT) in production, OpenAI directly with a
+  streaming call, a local stub for tests and dev
+- Response cache keyed by the normalized question, so repeated FAQs (PPS, GNIB, Leap Card)
+  are answered without calling the LLM; identical questions asked at the same time share
+  one LLM call
+- Bounded worker pool with a bounded queue: a flood of mentions waits or is turned away
+  instead of piling up tasks
+- Streamed answers, with deltas batched into a few frames per second; the Emergent backend
+  has no streaming call, so only the openai and stub backends actually stream
+"""
+
+import os
+import re
+import time
+import uuid
+import asyncio
+import logging
+import unicodedata
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# emergent | openai | stub; only the OpenAI backend streams, so it is the default once its key is set
+AGENTE_LLM = os.environ.get('AGENTE_LLM') or ('openai' if os.environ.get('OPENAI_API_KEY') else 'emergent')
+AGENTE_MODEL = os.environ.get('AGENTE_MODEL', 'gpt-4.1')
+AGENTE_WORKERS = int(os.environ.get('AGENTE_WORKERS', '2'))
+AGENTE_QUEUE_SIZE = int(os.environ.get('AGENTE_QUEUE_SIZE', '20'))
+AGENTE_CACHE_MAX_SIZE = int(os.environ.get('AGENTE_CACHE_MAX_SIZE', '500'))
+AGENTE_CACHE_TTL_SECONDS = float(os.environ.get('AGENTE_CACHE_TTL_SECONDS', str(24 * 3600)))
+AGENTE_STREAM_FLUSH_SECONDS = float(os.environ.get('AGENTE_STREAM_FLUSH_SECONDS', '0.1'))
+
+# Words that do not change what is being asked
+STOPWORDS = {
+    "a", "o", "as", "os", "um", "uma", "de", "do", "da", "dos", "das", "no", "na", "nos", "nas",
+    "em", "e", "eu", "me", "meu", "minha", "que", "qual", "quais", "como", "pra", "para", "por",
+    "com", "se", "ou", "oi", "ola", "alguem", "sabe", "voce", "voces", "pode", "favor", "ajuda",
+    "the", "an", "how", "do", "i", "to", "what", "is", "my", "please"
+}
+
+
+class LLMUnavailable(Exception):
+    """The configured LLM backend cannot answer (not installed, no key)"""
+
+
+def normalize_question(text: str) -> str:
+    """Cache key: lowercase, no accents or punctuation, stopwords dropped; word order is kept
+    because it carries meaning ("Dublin para Cork" is not "Cork para Dublin")"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    words = re.findall(r"[a-z0-9]+", text)
+    return " ".join(w for w in words if w not in STOPWORDS)
+
+
+# ============== LLM BACKENDS ==============
+
+class EmergentLLM:
+    """GPT through emergentintegrations.
+
+    LlmChat only exposes send_message, which returns the whole reply; there is no streaming
+    call, so answers arrive as one chunk.
+    """
+
+    def __init__(self, system_prompt: str, model: str = AGENTE_MODEL):
+        self.system_prompt = system_prompt
+        self.model = model
+
+    async def stream(self, question: str) -> AsyncIterator[str]:
+        try:
+            from emergentintegrations.llm.chat import LlmChat, UserMessage
+        except ImportError:
+            raise LLMUnavailable("emergentintegrations not installed")
+        api_key = os.getenv("EMERGENT_LLM_KEY")
+        if not api_key:
+            raise LLMUnavailable("EMERGENT_LLM_KEY not set")
+
+        # Sessions keep conversation history, so each question gets its own
+        chat = LlmChat(
+            api_key=api_key,
+            session_id=f"agente-comunidade-{uuid.uuid4()}",
+            system_message=self.system_prompt
+        ).with_model("openai", self.model)
+        yield await chat.send_message(UserMessage(text=question))
+
+
+class OpenAILLM:
+    """GPT through the OpenAI SDK's streaming chat completions: tokens arrive as generated"""
+
+    def __init__(self, system_prompt: str, model: str = AGENTE_MODEL):
+        self.system_prompt = system_prompt
+        self.model = model
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            try:
+                from openai import AsyncOpenAI
+            except ImportError:
+                raise LLMUnavailable("openai not installed")
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise LLMUnavailable("OPENAI_API_KEY not set")
+            self._client = AsyncOpenAI(api_key=api_key)  # one pooled client for all questions
+        return self._client
+
+    async def stream(self, question: str) -> AsyncIterator[str]:
+        response = await self._get_client().chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": question}
+            ],
+            stream=True
+        )
+        async for event in response:
+            if event.choices and event.choices[0].delta.content:
+                yield event.choices[0].delta.content
+
+
+class StubLLM:
+    """Local stand-in: canned answers streamed word by word, no network"""
+
+    ANSWERS = {
+        "pps": "Para tirar o PPS, agende em mywelfare.ie e leve passaporte e comprovante de endereço. 📄",
+        "gnib": "O registro GNIB/IRP custa €300 e é agendado no Burgh Quay Registration Office. 🛂",
+        "irp": "O registro GNIB/IRP custa €300 e é agendado no Burgh Quay Registration Office. 🛂",
+        "leap": "O Leap Card vale para Dublin Bus, Luas e DART e sai mais barato que pagar em dinheiro. 🚌"
+    }
+    DEFAULT = "Boa pergunta! Confira também citizensinformation.ie para informações oficiais. 🇮🇪"
+
+    def __init__(self, delay_seconds: float = 0.0):
+        self.delay_seconds = delay_seconds
+        self.calls = 0
+
+    async def stream(self, question: str) -> AsyncIterator[str]:
+        self.calls += 1
+        words = normalize_question(question).split()
+        answer = next((self.ANSWERS[w] for w in words if w in self.ANSWERS), self.DEFAULT)
+        for i, word in enumerate(answer.split(" ")):
+            if self.delay_seconds:
+                await asyncio.sleep(self.delay_seconds)
+            yield word if i == 0 else f" {word}"
+
+
+def create_llm(system_prompt: str, kind: str = AGENTE_LLM):
+    if kind == "stub":
+        return StubLLM()
+    if kind == "openai":
+        return OpenAILLM(system_prompt)
+    return EmergentLLM(system_prompt)
+
+
+# ============== RESPONSE CACHE ==============
+
+class ResponseCache:
+    """LRU + TTL cache of answers keyed by normalized question"""
+
+    def __init__(self, max_size: int = AGENTE_CACHE_MAX_SIZE, ttl_seconds: float = AGENTE_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, answer)
+        self._in_flight: Dict[str, asyncio.Future] = {}  # key -> answer of the call already running
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, answer: str):
+        if not key:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def join(self, key: str) -> Optional[asyncio.Future]:
+        """After a miss: None when the caller should compute the answer (and later `finish`),
+        else a future resolving to the answer of the call already in flight (None if it fails)
+        """
+        if not key:
+            return None
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return future
+        self._in_flight[key] = asyncio.get_running_loop().create_future()
+        return None
+
+    def finish(self, key: str, answer: Optional[str]):
+        """Cache the computed answer and hand it to the callers that joined"""
+        if answer:
+            self.set(key, answer)
+        future = self._in_flight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(answer)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+
+# ============== STREAMING ==============
+
+async def batched(chunks: AsyncIterator[str], flush_seconds: float = AGENTE_STREAM_FLUSH_SECONDS) -> AsyncIterator[str]:
+    """Merge token-sized chunks so clients get a few frames per second, not one per token"""
+    buffer = []
+    last_flush = time.monotonic()
+    async for chunk in chunks:
+        buffer.append(chunk)
+        if time.monotonic() - last_flush >= flush_seconds:
+            yield "".join(buffer)
+            buffer = []
+            last_flush = time.monotonic()
+    if buffer:
+        yield "".join(buffer)
+
+
+# ============== WORKER POOL ==============
+
+class AgentPool:
+    """Fixed number of workers draining a bounded queue of questions"""
+
+    def __init__(
+        self,
+        handler: Callable[[str, str], Awaitable[None]],
+        workers: int = AGENTE_WORKERS,
+        queue_size: int = AGENTE_QUEUE_SIZE
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.busy = 0
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, question: str, user_name: str) -> bool:
+        """Queue a question; False when the queue is full"""
+        try:
+            self.queue.put_nowait((question, user_name))
+            return True
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+
+    async def _worker(self):
+        while True:
+            question, user_name = await self.queue.get()
+            self.busy += 1
+            try:
+                await self.handler(question, user_name)
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Agente Comunidade worker error: {e}")
+            finally:
+                self.busy -= 1
+                self.queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "busy": self.busy,
+            "queued": self.queue.qsize(),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "failed": self.failed
+        }
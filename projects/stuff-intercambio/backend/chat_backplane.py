@@ -0,0 +1,223 @@
+"""
+Chat Backplane Module - relays chat events between workers
+Features:
+- Pluggable: in-memory (single process and tests) or MongoDB (several workers or pods)
+- MongoDB mode publishes into a capped chat_events collection and follows it with a
+  change stream, or with a tailable cursor when the server is not a replica set
+- Each event carries the publishing worker's id so a worker never re-delivers its own events
+- Resume tokens so a dropped change stream picks up where it stopped, and a re-opened
+  tailable cursor resumes after the last event seen instead of rescanning the collection;
+  a token that has rolled off the oplog is dropped and the stream reopens from now
+"""
+
+import os
+import uuid
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, List, Optional
+
+from bson import ObjectId
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+CHAT_BACKPLANE = os.environ.get('CHAT_BACKPLANE', 'memory')  # memory | mongo
+CHAT_EVENTS_CAPPED_BYTES = int(os.environ.get('CHAT_EVENTS_CAPPED_BYTES', str(64 * 1024 * 1024)))
+
+# Server errors meaning change streams are unavailable (standalone server)
+CHANGE_STREAM_UNSUPPORTED_CODES = (40573, 40324)
+# ChangeStreamHistoryLost: the resume token is older than anything left in the oplog
+CHANGE_STREAM_HISTORY_LOST_CODE = 286
+SEEN_EVENT_IDS = 10000
+# ObjectIds are minted by each worker's driver, so across workers they only follow insertion
+# order up to clock skew; a re-opened cursor starts this far before the last event seen
+CHAT_BACKPLANE_RESUME_SKEW_SECONDS = float(os.environ.get('CHAT_BACKPLANE_RESUME_SKEW_SECONDS', '5'))
+
+EventHandler = Callable[[dict], Awaitable[None]]
+
+
+class Backplane:
+    """Base class: publish events to the other workers and hand theirs to `handler`"""
+
+    def __init__(self, worker_id: Optional[str] = None):
+        self.worker_id = worker_id or uuid.uuid4().hex
+        self.handler: Optional[EventHandler] = None
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+
+    async def start(self, handler: EventHandler):
+        self.handler = handler
+
+    async def stop(self):
+        pass
+
+    async def publish(self, event: dict):
+        raise NotImplementedError
+
+    async def deliver(self, event: dict):
+        """Pass a remote event to the handler; own events are ignored"""
+        if event.get("origin") == self.worker_id or not self.handler:
+            return
+        self.received += 1
+        try:
+            await self.handler(event)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Chat backplane handler error: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "mode": type(self).__name__,
+            "worker_id": self.worker_id,
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors
+        }
+
+
+class InMemoryBus:
+    """Connects in-process backplanes; one bus stands in for the database in tests"""
+
+    def __init__(self):
+        self.members: List["InMemoryBackplane"] = []
+
+
+class InMemoryBackplane(Backplane):
+    """Backplane for a single process; several instances on one bus behave like several workers"""
+
+    def __init__(self, bus: Optional[InMemoryBus] = None, worker_id: Optional[str] = None):
+        super().__init__(worker_id)
+        self.bus = bus or InMemoryBus()
+
+    async def start(self, handler: EventHandler):
+        await super().start(handler)
+        if self not in self.bus.members:
+            self.bus.members.append(self)
+
+    async def stop(self):
+        if self in self.bus.members:
+            self.bus.members.remove(self)
+
+    async def publish(self, event: dict):
+        event = {**event, "origin": self.worker_id}
+        self.published += 1
+        for member in list(self.bus.members):
+            if member is not self:
+                await member.deliver(event)
+
+
+class MongoBackplane(Backplane):
+    """Backplane over a capped MongoDB collection shared by every worker"""
+
+    def __init__(self, db, collection: str = "chat_events", capped_bytes: int = CHAT_EVENTS_CAPPED_BYTES, worker_id: Optional[str] = None):
+        super().__init__(worker_id)
+        self.db = db
+        self.collection_name = collection
+        self.capped_bytes = capped_bytes
+        self.mode = "change_stream"
+        self.resume_token = None
+        self.history_lost = 0
+        self.resume_after: Optional[ObjectId] = None  # tailable cursors re-open after this _id
+        self._seen = deque(maxlen=SEEN_EVENT_IDS)  # ids inside the resume skew window, never replayed
+        self._seen_set = set()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    async def start(self, handler: EventHandler):
+        await super().start(handler)
+        try:
+            # Capped: old events roll off by size, and natural order is insertion order for tailing
+            await self.db.create_collection(self.collection_name, capped=True, size=self.capped_bytes)
+        except CollectionInvalid:
+            pass
+        # Events already in the collection happened before this worker started
+        newest = await self.collection.find({}, {"_id": 1}).sort("$natural", -1).limit(1).to_list(1)
+        self.resume_after = newest[0]["_id"] if newest else None
+        self._task = asyncio.create_task(self._follow())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def publish(self, event: dict):
+        self.published += 1
+        await self.collection.insert_one({
+            "origin": self.worker_id,
+            "event": event,
+            "sent_at": datetime.now(timezone.utc)
+        })
+
+    async def _receive(self, doc: dict):
+        if doc["_id"] in self._seen_set:
+            return
+        if len(self._seen) == self._seen.maxlen:
+            self._seen_set.discard(self._seen[0])
+        self._seen.append(doc["_id"])
+        self._seen_set.add(doc["_id"])
+        await self.deliver({**doc["event"], "origin": doc.get("origin")})
+
+    async def _follow(self):
+        while True:
+            try:
+                if self.mode == "change_stream":
+                    await self._follow_change_stream()
+                else:
+                    await self._follow_tailable()
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if self.mode == "change_stream" and e.code in CHANGE_STREAM_UNSUPPORTED_CODES:
+                    logger.warning("Change streams unavailable; chat backplane follows a tailable cursor instead")
+                    self.mode = "tailable"
+                    continue
+                if self.mode == "change_stream" and e.code == CHANGE_STREAM_HISTORY_LOST_CODE:
+                    # Retrying the same token fails forever; accept the gap and follow from now
+                    logger.warning("Chat backplane resume token fell off the oplog; events in the gap are lost")
+                    self.history_lost += 1
+                    self.resume_token = None
+                    continue
+                self.errors += 1
+                logger.error(f"Chat backplane follow error: {e}")
+                await asyncio.sleep(1)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Chat backplane follow error: {e}")
+                await asyncio.sleep(1)
+
+    async def _follow_change_stream(self):
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        async with self.collection.watch(pipeline, resume_after=self.resume_token) as stream:
+            async for change in stream:
+                self.resume_token = stream.resume_token
+                await self._receive(change["fullDocument"])
+
+    async def _follow_tailable(self):
+        query = {"_id": {"$gt": self.resume_after}} if self.resume_after else {}
+        cursor = self.collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+        while cursor.alive:
+            async for doc in cursor:
+                await self._receive(doc)
+                self.resume_after = self._resume_point(doc["_id"])
+            await asyncio.sleep(0.1)
+        await asyncio.sleep(1)  # no match yet: the cursor dies at once, retry shortly
+
+    def _resume_point(self, last_id: ObjectId) -> ObjectId:
+        """Where a re-opened cursor starts: the last event seen, minus the clock skew window"""
+        since = ObjectId.from_datetime(last_id.generation_time - timedelta(seconds=CHAT_BACKPLANE_RESUME_SKEW_SECONDS))
+        return max(since, self.resume_after) if self.resume_after else since
+
+    def stats(self) -> dict:
+        return {**super().stats(), "follow_mode": self.mode, "history_lost": self.history_lost}
+
+
+def create_backplane(db, kind: str = CHAT_BACKPLANE) -> Backplane:
+    if kind == "mongo":
+        return MongoBackplane(db)
+    return InMemoryBackplane()
@@ -0,0 +1,67 @@
+"""
+Chat Bans Module - in-memory view of active chat bans
+Features:
+- Every active ban loaded at startup and reloaded periodically as a safety net
+- Ban checks on the message hot path answered from memory, expiry included
+- Updated in place by ban/unban, and by the same events relayed from other workers
+"""
+
+import os
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CHAT_BAN_RELOAD_SECONDS = int(os.environ.get('CHAT_BAN_RELOAD_SECONDS', '300'))
+
+
+class ChatBanCache:
+    """Active bans keyed by user id; expires_at is an ISO string like in db.chat_bans"""
+
+    def __init__(self):
+        self._bans: Dict[str, dict] = {}
+        self.checks = 0
+        self.reloads = 0
+        self.last_reload_at: Optional[str] = None
+
+    async def load(self, db):
+        """Replace the cache with every ban that has not expired yet"""
+        now = datetime.now(timezone.utc).isoformat()
+        bans = {}
+        async for ban in db.chat_bans.find({"expires_at": {"$gt": now}}, {"_id": 0}):
+            current = bans.get(ban["user_id"])
+            if not current or ban["expires_at"] > current["expires_at"]:
+                bans[ban["user_id"]] = ban
+        self._bans = bans
+        self.reloads += 1
+        self.last_reload_at = now
+
+    def add(self, ban: dict):
+        current = self._bans.get(ban["user_id"])
+        if not current or ban["expires_at"] > current["expires_at"]:
+            self._bans[ban["user_id"]] = ban
+
+    def remove(self, user_id: str):
+        self._bans.pop(user_id, None)
+
+    def get(self, user_id: str) -> Optional[dict]:
+        """The user's active ban, or None; expired bans are dropped on sight"""
+        self.checks += 1
+        ban = self._bans.get(user_id)
+        if ban and ban["expires_at"] <= datetime.now(timezone.utc).isoformat():
+            del self._bans[user_id]
+            return None
+        return ban
+
+    def active(self) -> list:
+        now = datetime.now(timezone.utc).isoformat()
+        return [ban for ban in self._bans.values() if ban["expires_at"] > now]
+
+    def stats(self) -> dict:
+        return {
+            "active_bans": len(self._bans),
+            "checks": self.checks,
+            "reloads": self.reloads,
+            "last_reload_at": self.last_reload_at
+        }
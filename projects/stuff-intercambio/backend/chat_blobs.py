@@ -0,0 +1,282 @@
+"""
+Chat Blobs Module - content-addressed storage for chat audio
+Features:
+- Blobs are keyed by the SHA-256 of their bytes, so a re-sent clip is stored once
+- GridFS backend (shared by every worker) or local filesystem backend (single host, dev)
+- Streamed range reads for HTTP Range requests, so players can seek without downloading everything
+- Decoding of the legacy base64 data URLs older clients still send inline
+- Only audio content types are stored or served, so the API origin never hands out HTML or SVG
+- Age listing and deletion for garbage-collecting blobs no message references any more
+"""
+
+import os
+import re
+import base64
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+CHAT_BLOB_STORE = os.environ.get('CHAT_BLOB_STORE', 'gridfs')  # gridfs | filesystem
+CHAT_BLOB_DIR = os.environ.get('CHAT_BLOB_DIR', '/tmp/chat_blobs')
+CHAT_AUDIO_MAX_BYTES = int(os.environ.get('CHAT_AUDIO_MAX_BYTES', str(4 * 1024 * 1024)))
+
+AUDIO_CONTENT_TYPES = {
+    "audio/webm", "audio/ogg", "audio/mpeg", "audio/mp4", "audio/aac",
+    "audio/wav", "audio/x-wav", "audio/wave", "audio/x-m4a"
+}
+FALLBACK_CONTENT_TYPE = "application/octet-stream"
+
+READ_CHUNK_BYTES = 64 * 1024
+BLOB_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+DATA_URL_PATTERN = re.compile(r"^data:(?P<type>[\w.+-]+/[\w.+-]+)?(?:;[^,]*)?;base64,(?P<data>.*)$", re.DOTALL)
+
+
+class BlobTooLarge(Exception):
+    """The payload exceeds CHAT_AUDIO_MAX_BYTES"""
+
+
+def blob_id_for(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def is_blob_id(value: str) -> bool:
+    return bool(value and BLOB_ID_PATTERN.match(value))
+
+def audio_content_type(content_type: Optional[str]) -> Optional[str]:
+    """The allowlisted audio type behind a header value ("audio/webm;codecs=opus" -> "audio/webm"), or None"""
+    base = (content_type or "").split(";")[0].strip().lower()
+    return base if base in AUDIO_CONTENT_TYPES else None
+
+def decode_data_url(value: str) -> Tuple[bytes, str]:
+    """Split a base64 data URL (or bare base64) into bytes and content type"""
+    match = DATA_URL_PATTERN.match(value)
+    if match:
+        return base64.b64decode(match.group("data")), match.group("type") or FALLBACK_CONTENT_TYPE
+    return base64.b64decode(value), FALLBACK_CONTENT_TYPE
+
+def audio_url(blob_id: str) -> str:
+    return f"/api/chat/audio/{blob_id}"
+
+
+class BlobStore:
+    """Base class; `read_range` takes an inclusive byte range like HTTP Range"""
+
+    def __init__(self, max_bytes: int = CHAT_AUDIO_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.puts = 0
+        self.deduplicated = 0
+        self.bytes_stored = 0
+        self.deleted = 0
+
+    def _check_size(self, data: bytes):
+        if len(data) > self.max_bytes:
+            raise BlobTooLarge(f"{len(data)} bytes > {self.max_bytes}")
+
+    async def put(self, data: bytes, content_type: str) -> dict:
+        """Store the bytes; a re-sent clip refreshes the stored blob's age instead of copying it"""
+        raise NotImplementedError
+
+    async def stat(self, blob_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def read_range(self, blob_id: str, start: int, end: int) -> AsyncIterator[bytes]:
+        raise NotImplementedError
+
+    async def older_than(self, cutoff: datetime, limit: int, after: Optional[str] = None) -> List[str]:
+        """Ids of blobs last stored before `cutoff`, in id order and past `after` so callers can page"""
+        raise NotImplementedError
+
+    async def delete(self, blob_id: str):
+        raise NotImplementedError
+
+    def _record_put(self, size: int, created: bool):
+        self.puts += 1
+        if created:
+            self.bytes_stored += size
+        else:
+            self.deduplicated += 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "puts": self.puts,
+            "deduplicated": self.deduplicated,
+            "bytes_stored": self.bytes_stored,
+            "deleted": self.deleted
+        }
+
+
+class GridFSBlobStore(BlobStore):
+    """Blobs in a GridFS bucket; the SHA-256 doubles as the GridFS file id"""
+
+    def __init__(self, db, bucket_name: str = "chat_audio", **kwargs):
+        super().__init__(**kwargs)
+        from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+        self.files = db[f"{bucket_name}.files"]
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket_name)
+
+    async def put(self, data: bytes, content_type: str) -> dict:
+        self._check_size(data)
+        content_type = audio_content_type(content_type) or FALLBACK_CONTENT_TYPE
+        blob_id = blob_id_for(data)
+        created = False
+        # Touching the upload date keeps a re-sent clip clear of garbage collection
+        existing = await self.files.update_one({"_id": blob_id}, {"$set": {"uploadDate": datetime.now(timezone.utc)}})
+        if not existing.matched_count:
+            try:
+                await self.bucket.upload_from_stream_with_id(
+                    blob_id, blob_id, data, metadata={"content_type": content_type}
+                )
+                created = True
+            except DuplicateKeyError:
+                pass  # another worker stored the same bytes first
+        self._record_put(len(data), created)
+        return {"blob_id": blob_id, "size": len(data), "content_type": content_type}
+
+    async def stat(self, blob_id: str) -> Optional[dict]:
+        doc = await self.files.find_one({"_id": blob_id})
+        if not doc:
+            return None
+        return {
+            "blob_id": blob_id,
+            "size": doc["length"],
+            "content_type": (doc.get("metadata") or {}).get("content_type", FALLBACK_CONTENT_TYPE)
+        }
+
+    async def read_range(self, blob_id: str, start: int, end: int) -> AsyncIterator[bytes]:
+        stream = await self.bucket.open_download_stream(blob_id)
+        stream.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await stream.read(min(READ_CHUNK_BYTES, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+    async def older_than(self, cutoff: datetime, limit: int, after: Optional[str] = None) -> List[str]:
+        query = {"uploadDate": {"$lt": cutoff}}
+        if after is not None:
+            query["_id"] = {"$gt": after}
+        docs = await self.files.find(query, {"_id": 1}).sort("_id", 1).limit(limit).to_list(limit)
+        return [doc["_id"] for doc in docs]
+
+    async def delete(self, blob_id: str):
+        from gridfs.errors import NoFile
+        try:
+            await self.bucket.delete(blob_id)
+            self.deleted += 1
+        except NoFile:
+            pass
+
+
+class FilesystemBlobStore(BlobStore):
+    """Blobs as files under CHAT_BLOB_DIR, fanned out by the first two hex digits"""
+
+    def __init__(self, root: str = CHAT_BLOB_DIR, **kwargs):
+        super().__init__(**kwargs)
+        self.root = root
+
+    def _path(self, blob_id: str) -> str:
+        return os.path.join(self.root, blob_id[:2], blob_id)
+
+    def _write(self, blob_id: str, data: bytes, content_type: str) -> bool:
+        path = self._path(blob_id)
+        if os.path.exists(path):
+            os.utime(path)  # keeps a re-sent clip clear of garbage collection
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        with open(f"{tmp}.type", "w") as f:
+            f.write(content_type)
+        os.replace(f"{tmp}.type", f"{path}.type")
+        os.replace(tmp, path)  # atomic: readers never see a partial blob
+        return True
+
+    async def put(self, data: bytes, content_type: str) -> dict:
+        self._check_size(data)
+        content_type = audio_content_type(content_type) or FALLBACK_CONTENT_TYPE
+        blob_id = blob_id_for(data)
+        created = await asyncio.to_thread(self._write, blob_id, data, content_type)
+        self._record_put(len(data), created)
+        return {"blob_id": blob_id, "size": len(data), "content_type": content_type}
+
+    def _stat(self, blob_id: str) -> Optional[dict]:
+        path = self._path(blob_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(f"{path}.type") as f:
+                content_type = f.read().strip()
+        except OSError:
+            content_type = FALLBACK_CONTENT_TYPE
+        return {"blob_id": blob_id, "size": os.path.getsize(path), "content_type": content_type}
+
+    async def stat(self, blob_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self._stat, blob_id)
+
+    def _read(self, path: str, offset: int, size: int) -> bytes:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return f.read(size)
+
+    async def read_range(self, blob_id: str, start: int, end: int) -> AsyncIterator[bytes]:
+        path = self._path(blob_id)
+        offset = start
+        while offset <= end:
+            chunk = await asyncio.to_thread(self._read, path, offset, min(READ_CHUNK_BYTES, end - offset + 1))
+            if not chunk:
+                break
+            offset += len(chunk)
+            yield chunk
+
+    def _older_than(self, cutoff: datetime, limit: int, after: Optional[str]) -> List[str]:
+        blob_ids = []
+        if not os.path.isdir(self.root):
+            return blob_ids
+        cutoff_ts = cutoff.timestamp()
+        # Ids are hex, so walking sorted prefix directories yields them in id order
+        for prefix in sorted(os.listdir(self.root)):
+            directory = os.path.join(self.root, prefix)
+            if not os.path.isdir(directory) or (after is not None and prefix < after[:2]):
+                continue
+            for name in sorted(os.listdir(directory)):
+                if after is not None and name <= after:
+                    continue
+                if is_blob_id(name) and os.path.getmtime(os.path.join(directory, name)) < cutoff_ts:
+                    blob_ids.append(name)
+                    if len(blob_ids) >= limit:
+                        return blob_ids
+        return blob_ids
+
+    async def older_than(self, cutoff: datetime, limit: int, after: Optional[str] = None) -> List[str]:
+        return await asyncio.to_thread(self._older_than, cutoff, limit, after)
+
+    def _delete(self, blob_id: str) -> bool:
+        path = self._path(blob_id)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        try:
+            os.remove(f"{path}.type")
+        except FileNotFoundError:
+            pass
+        return True
+
+    async def delete(self, blob_id: str):
+        if await asyncio.to_thread(self._delete, blob_id):
+            self.deleted += 1
+
+
+def create_blob_store(db, kind: str = CHAT_BLOB_STORE) -> BlobStore:
+    if kind == "filesystem":
+        return FilesystemBlobStore()
+    return GridFSBlobStore(db)
@@ -0,0 +1,208 @@
+"""
+Chat Broadcast Module - fan-out engine for chat WebSocket connections
+Features:
+- Each frame is serialized once per broadcast, not once per socket
+- Every socket gets a bounded outbound queue drained by its own writer task,
+  so one slow client never delays delivery to the others
+- Slow-consumer policy when a queue fills up: drop frames or disconnect the client
+- Fan-out metrics: queue depth, drops, slow disconnects and enqueue-to-write latency
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+CHAT_SEND_QUEUE_SIZE = int(os.environ.get('CHAT_SEND_QUEUE_SIZE', '256'))
+CHAT_SEND_TIMEOUT_SECONDS = float(os.environ.get('CHAT_SEND_TIMEOUT_SECONDS', '10'))
+CHAT_SLOW_CONSUMER_POLICY = os.environ.get('CHAT_SLOW_CONSUMER_POLICY', 'disconnect')  # disconnect | drop
+
+# Close code sent to clients that fall too far behind; they reconnect and resync
+SLOW_CONSUMER_CLOSE_CODE = 4008
+LATENCY_SAMPLES = 1000
+
+# The event loop only keeps weak references to tasks; socket closes in flight are held here until done
+closing_tasks: Set[asyncio.Task] = set()
+
+
+def encode_frame(message: dict) -> str:
+    """Serialize a frame exactly like Starlette's send_json does"""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+class FanoutMetrics:
+    """Counters shared by every outbound connection of one broadcaster"""
+
+    def __init__(self):
+        self.broadcasts = 0
+        self.frames_enqueued = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.slow_disconnects = 0
+        self.send_errors = 0
+        self.peak_queue_depth = 0
+        self.latencies_ms = deque(maxlen=LATENCY_SAMPLES)  # enqueue -> written, most recent frames
+
+    def record_latency(self, seconds: float):
+        self.latencies_ms.append(seconds * 1000)
+
+    def stats(self) -> dict:
+        samples = sorted(self.latencies_ms)
+
+        def percentile(p: float) -> float:
+            if not samples:
+                return 0.0
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))], 2)
+
+        return {
+            "broadcasts": self.broadcasts,
+            "frames_enqueued": self.frames_enqueued,
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "slow_disconnects": self.slow_disconnects,
+            "send_errors": self.send_errors,
+            "peak_queue_depth": self.peak_queue_depth,
+            "latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99), "max": percentile(1.0)}
+        }
+
+
+class OutboundConnection:
+    """A WebSocket plus its bounded send queue and writer task.
+
+    Only the writer task ever sends on the socket, so frames keep their order
+    and concurrent broadcasts never interleave writes.
+    """
+
+    def __init__(
+        self,
+        websocket,
+        user_id: str,
+        metrics: FanoutMetrics,
+        queue_size: int = CHAT_SEND_QUEUE_SIZE,
+        send_timeout: float = CHAT_SEND_TIMEOUT_SECONDS,
+        policy: str = CHAT_SLOW_CONSUMER_POLICY
+    ):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.metrics = metrics
+        self.send_timeout = send_timeout
+        self.policy = policy
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+        self.dropped = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._writer())
+
+    def offer(self, frame: str) -> bool:
+        """Queue a serialized frame without waiting; applies the slow-consumer policy when full"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait((time.monotonic(), frame))
+        except asyncio.QueueFull:
+            if self.policy == "drop":
+                self.dropped += 1
+                self.metrics.frames_dropped += 1
+                return False
+            logger.warning(f"Chat client {self.user_id} is too slow ({self.queue.qsize()} frames queued), disconnecting")
+            self.metrics.slow_disconnects += 1
+            self.close(SLOW_CONSUMER_CLOSE_CODE, "Slow consumer")
+            return False
+        self.metrics.frames_enqueued += 1
+        self.metrics.peak_queue_depth = max(self.metrics.peak_queue_depth, self.queue.qsize())
+        return True
+
+    async def _writer(self):
+        try:
+            while True:
+                enqueued_at, frame = await self.queue.get()
+                await asyncio.wait_for(self.websocket.send_text(frame), self.send_timeout)
+                self.metrics.frames_sent += 1
+                self.metrics.record_latency(time.monotonic() - enqueued_at)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Timeouts and broken sockets end the writer; the receive loop then sees the close
+            self.metrics.send_errors += 1
+            logger.error(f"Error sending to {self.user_id}: {e!r}")
+            self.close(SLOW_CONSUMER_CLOSE_CODE if isinstance(e, asyncio.TimeoutError) else 1011, "Send failed")
+
+    def close(self, code: int = 1000, reason: str = ""):
+        """Stop the writer and close the socket in the background; safe to call twice"""
+        if self.closed:
+            return
+        self.closed = True
+        if self._task and self._task is not asyncio.current_task():
+            self._task.cancel()
+        task = asyncio.create_task(self._close_socket(code, reason))
+        closing_tasks.add(task)
+        task.add_done_callback(closing_tasks.discard)
+
+    async def _close_socket(self, code: int, reason: str):
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass  # already closed by the client
+
+
+class Broadcaster:
+    """Registry of outbound connections keyed by user id"""
+
+    def __init__(self, queue_size: int = CHAT_SEND_QUEUE_SIZE, policy: str = CHAT_SLOW_CONSUMER_POLICY):
+        self.queue_size = queue_size
+        self.policy = policy
+        self.metrics = FanoutMetrics()
+        self.connections: Dict[str, OutboundConnection] = {}
+
+    def add(self, websocket, user_id: str) -> OutboundConnection:
+        """Register a socket; an older socket of the same user is closed"""
+        previous = self.connections.get(user_id)
+        if previous:
+            previous.close(1000, "Replaced by a new connection")
+        connection = OutboundConnection(websocket, user_id, self.metrics, queue_size=self.queue_size, policy=self.policy)
+        connection.start()
+        self.connections[user_id] = connection
+        return connection
+
+    def remove(self, user_id: str, connection: Optional[OutboundConnection] = None) -> bool:
+        """Unregister a user; with `connection`, only if it is still the registered one"""
+        current = self.connections.get(user_id)
+        if current is None or (connection is not None and current is not connection):
+            return False
+        del self.connections[user_id]
+        current.close()
+        return True
+
+    def broadcast(self, message: dict, exclude: Optional[str] = None) -> int:
+        """Serialize once and queue the frame on every socket; returns how many accepted it"""
+        frame = encode_frame(message)
+        self.metrics.broadcasts += 1
+        delivered = 0
+        for user_id, connection in list(self.connections.items()):
+            if user_id != exclude and connection.offer(frame):
+                delivered += 1
+        return delivered
+
+    def send(self, user_id: str, message: dict) -> bool:
+        connection = self.connections.get(user_id)
+        return connection.offer(encode_frame(message)) if connection else False
+
+    def queue_depths(self) -> List[int]:
+        return [c.queue.qsize() for c in self.connections.values()]
+
+    def stats(self) -> dict:
+        depths = self.queue_depths()
+        return {
+            "connections": len(self.connections),
+            "policy": self.policy,
+            "queue_size": self.queue_size,
+            "max_queue_depth": max(depths) if depths else 0,
+            **self.metrics.stats()
+        }
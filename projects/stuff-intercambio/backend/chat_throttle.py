@@ -0,0 +1,133 @@
+"""
+Chat Throttle Module - keeps busy rooms from saturating the socket fan-out
+Features:
+- Per-user token buckets for message, typing and ping frames
+- Typing indicators coalesced into one diff frame per interval (started/stopped users)
+  instead of one broadcast per keystroke per user
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHAT_TYPING_FLUSH_SECONDS = float(os.environ.get('CHAT_TYPING_FLUSH_SECONDS', '0.5'))
+CHAT_TYPING_TTL_SECONDS = float(os.environ.get('CHAT_TYPING_TTL_SECONDS', '3'))
+
+# frame type -> (tokens per second, burst)
+CHAT_RATE_LIMITS = {
+    "message": (float(os.environ.get('CHAT_MESSAGE_RATE_PER_SECOND', '1')), int(os.environ.get('CHAT_MESSAGE_BURST', '5'))),
+    "typing": (float(os.environ.get('CHAT_TYPING_RATE_PER_SECOND', '1')), int(os.environ.get('CHAT_TYPING_BURST', '3'))),
+    "ping": (float(os.environ.get('CHAT_PING_RATE_PER_SECOND', '0.2')), int(os.environ.get('CHAT_PING_BURST', '3')))
+}
+MAX_TRACKED_BUCKETS = 50000
+
+
+class RateLimiter:
+    """Token buckets keyed by (user_id, frame type)"""
+
+    def __init__(self, limits: Dict[str, Tuple[float, int]] = CHAT_RATE_LIMITS, max_buckets: int = MAX_TRACKED_BUCKETS):
+        self.limits = limits
+        self.max_buckets = max_buckets
+        self._buckets: Dict[Tuple[str, str], list] = {}  # (user_id, kind) -> [tokens, last refill]
+        self.allowed: Dict[str, int] = {}
+        self.limited: Dict[str, int] = {}
+
+    def allow(self, user_id: str, kind: str) -> bool:
+        """Take one token; frame types without a limit always pass"""
+        if kind not in self.limits:
+            return True
+        rate, burst = self.limits[kind]
+        now = time.monotonic()
+        bucket = self._buckets.get((user_id, kind))
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                self._prune(now)
+            bucket = self._buckets[(user_id, kind)] = [float(burst), now]
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        if bucket[0] < 1:
+            self.limited[kind] = self.limited.get(kind, 0) + 1
+            return False
+        bucket[0] -= 1
+        self.allowed[kind] = self.allowed.get(kind, 0) + 1
+        return True
+
+    def _prune(self, now: float):
+        """Forget buckets that would be full again anyway"""
+        for key, (tokens, last) in list(self._buckets.items()):
+            rate, burst = self.limits[key[1]]
+            if tokens + (now - last) * rate >= burst:
+                del self._buckets[key]
+
+    def stats(self) -> dict:
+        return {"buckets": len(self._buckets), "allowed": self.allowed, "limited": self.limited}
+
+
+class TypingCoalescer:
+    """Collects typing signals and publishes who started/stopped typing once per interval"""
+
+    def __init__(
+        self,
+        publish: Callable[[dict], Awaitable[None]],
+        flush_seconds: float = CHAT_TYPING_FLUSH_SECONDS,
+        ttl_seconds: float = CHAT_TYPING_TTL_SECONDS
+    ):
+        self.publish = publish
+        self.flush_seconds = flush_seconds
+        self.ttl_seconds = ttl_seconds
+        self._typing: Dict[str, Tuple[str, float]] = {}  # user_id -> (user_name, typing until)
+        self._announced: Dict[str, str] = {}  # user_id -> user_name, as last published
+        self.signals = 0
+        self.frames = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    def mark(self, user_id: str, user_name: str, ttl_seconds: Optional[float] = None):
+        """The user is typing; repeated marks only extend the deadline"""
+        self.signals += 1
+        self._typing[user_id] = (user_name, time.monotonic() + (ttl_seconds or self.ttl_seconds))
+
+    def clear(self, user_id: str):
+        """The user stopped typing (sent a message, left, or the agent answered)"""
+        self._typing.pop(user_id, None)
+
+    def diff(self) -> Optional[dict]:
+        """Frame describing what changed since the last published state, or None"""
+        now = time.monotonic()
+        for user_id in [u for u, (_, until) in self._typing.items() if until <= now]:
+            del self._typing[user_id]
+        current = {user_id: name for user_id, (name, _) in self._typing.items()}
+        started = [{"user_id": u, "user_name": n} for u, n in current.items() if u not in self._announced]
+        stopped = [u for u in self._announced if u not in current]
+        self._announced = current
+        if not started and not stopped:
+            return None
+        return {"type": "typing_update", "started": started, "stopped": stopped}
+
+    async def flush(self):
+        frame = self.diff()
+        if frame:
+            self.frames += 1
+            await self.publish(frame)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Typing flush failed: {e}")
+
+    def stats(self) -> dict:
+        return {"typing_now": len(self._typing), "signals": self.signals, "frames": self.frames}
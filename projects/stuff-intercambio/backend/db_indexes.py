@@ -0,0 +1,113 @@
+"""
+Database Indexes Module - declarative index registry for the Dublin Study API
+Features:
+- One registry of every index the hot query shapes rely on
+- Idempotent creation at startup with background builds
+- Explain-based report of query shapes that still fall back to a collection scan
+"""
+
+import logging
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# ============== INDEX REGISTRY ==============
+
+INDEX_REGISTRY = [
+    # Users: token resolution, login, admin filters
+    {"collection": "users", "keys": [("id", 1)], "unique": True},
+    {"collection": "users", "keys": [("email", 1)], "unique": True},
+    {"collection": "users", "keys": [("role", 1)]},
+    {"collection": "users", "keys": [("plan", 1)]},
+
+    # Schools and courses
+    {"collection": "schools", "keys": [("id", 1)], "unique": True},
+    {"collection": "schools", "keys": [("status", 1)]},
+    {"collection": "schools", "keys": [("stripe_account_id", 1)], "sparse": True},
+    {"collection": "stripe_accounts", "keys": [("account_id", 1)], "unique": True},
+    {"collection": "courses", "keys": [("id", 1)], "unique": True},
+    {"collection": "courses", "keys": [("school_id", 1), ("status", 1)]},
+    {"collection": "courses", "keys": [("status", 1)]},
+
+    # Enrollments: student list, school dashboard/earnings
+    {"collection": "enrollments", "keys": [("id", 1)], "unique": True},
+    {"collection": "enrollments", "keys": [("user_id", 1)]},
+    {"collection": "enrollments", "keys": [("school_id", 1), ("status", 1), ("letter_sent", 1)]},
+    {"collection": "enrollments", "keys": [("status", 1)]},
+
+    # Payments
+    {"collection": "payment_transactions", "keys": [("session_id", 1)]},
+    {"collection": "payment_transactions", "keys": [("status", 1)]},
+
+    # Chat (the expire_at TTL index is owned by chat.setup_ttl_index)
+    {"collection": "chat_messages", "keys": [("id", 1)]},
+    {"collection": "chat_messages", "keys": [("deleted", 1), ("seq", -1)]},
+    {"collection": "chat_messages", "keys": [("change_seq", 1)]},
+    {"collection": "chat_messages", "keys": [("audio_blob_id", 1)], "sparse": True},
+    {"collection": "chat_audio.files", "keys": [("uploadDate", 1)]},
+    {"collection": "chat_bans", "keys": [("user_id", 1), ("expires_at", 1)]},
+    {"collection": "chat_bans", "keys": [("expires_at", 1)]},
+
+    # Static content
+    {"collection": "agencies", "keys": [("category", 1)]},
+]
+
+# Representative filters for the scan report, one per hot route
+QUERY_SHAPES = [
+    {"name": "get_current_user", "collection": "users", "filter": {"id": "x"}},
+    {"name": "login", "collection": "users", "filter": {"email": "x"}},
+    {"name": "get_school", "collection": "schools", "filter": {"id": "x"}},
+    {"name": "admin_get_schools", "collection": "schools", "filter": {"status": "pending"}},
+    {"name": "get_school_courses", "collection": "courses", "filter": {"school_id": "x"}},
+    {"name": "get_courses", "collection": "courses", "filter": {"status": "active"}},
+    {"name": "get_user_enrollments", "collection": "enrollments", "filter": {"user_id": "x"}},
+    {"name": "school_dashboard", "collection": "enrollments", "filter": {"school_id": "x", "status": "paid", "letter_sent": False}},
+    {"name": "get_school_earnings", "collection": "enrollments", "filter": {"school_id": "x", "status": "paid"}},
+    {"name": "get_payment_status", "collection": "payment_transactions", "filter": {"session_id": "x"}},
+    {"name": "get_messages", "collection": "chat_messages", "filter": {"deleted": False}, "sort": {"seq": -1}},
+    {"name": "messages_since", "collection": "chat_messages", "filter": {"change_seq": {"$gt": 0}}, "sort": {"change_seq": 1}},
+    {"name": "collect_audio_blobs", "collection": "chat_messages", "filter": {"audio_blob_id": {"$in": ["x"]}, "deleted": False}},
+    {"name": "load_chat_bans", "collection": "chat_bans", "filter": {"expires_at": {"$gt": "x"}}},
+    {"name": "get_agencies_by_category", "collection": "agencies", "filter": {"category": "x"}},
+]
+
+# ============== HELPER FUNCTIONS ==============
+
+async def ensure_indexes(db, registry: Optional[List[dict]] = None):
+    """Create every registered index; existing indexes are left untouched"""
+    for spec in registry or INDEX_REGISTRY:
+        options = {k: v for k, v in spec.items() if k not in ("collection", "keys")}
+        try:
+            await db[spec["collection"]].create_index(spec["keys"], background=True, **options)
+        except Exception as e:
+            logger.warning(f"Index {spec['collection']}{spec['keys']}: {e}")
+    logger.info(f"Index registry applied ({len(registry or INDEX_REGISTRY)} indexes)")
+
+def _plan_stages(plan: dict) -> List[str]:
+    stages = [plan.get("stage")] if plan.get("stage") else []
+    for child_key in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(child_key), dict):
+            stages += _plan_stages(plan[child_key])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+async def report_collection_scans(db, shapes: Optional[List[dict]] = None) -> List[dict]:
+    """Explain each registered query shape and flag the ones planned as COLLSCAN"""
+    report = []
+    for shape in shapes or QUERY_SHAPES:
+        find = {"find": shape["collection"], "filter": shape["filter"]}
+        if shape.get("sort"):
+            find["sort"] = shape["sort"]
+        try:
+            explain = await db.command({"explain": find, "verbosity": "queryPlanner"})
+            stages = _plan_stages(explain["queryPlanner"]["winningPlan"])
+            report.append({
+                "name": shape["name"],
+                "collection": shape["collection"],
+                "stages": stages,
+                "collection_scan": "COLLSCAN" in stages
+            })
+        except Exception as e:
+            report.append({"name": shape["name"], "collection": shape["collection"], "error": str(e)})
+    return report
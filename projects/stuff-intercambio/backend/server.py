@@ -4,14 +4,15 @@ from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import sys
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
 from typing import List, Optional, Dict, Any, Literal
 import uuid
+import asyncio
 from datetime import datetime, timezone, timedelta
 import jwt
-import bcrypt
 from emergentintegrations.payments.stripe.checkout import (
     StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
 )
@@ -19,11 +20,31 @@ import base64
 import stripe  # Stripe Connect
 
 # Import chat module
-from chat import chat_router, init_chat_module, setup_ttl_index
+from chat import (
+    chat_router, init_chat_module, setup_ttl_index, backfill_chat_seq, migrate_inline_audio,
+    start_chat, stop_chat,
+    chat_stats
+)
 
 # Import email service
 from email_service import send_payment_confirmation_emails
 
+# Helpers shared by every backend live in shared/ at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+# Import user cache
+from shared.user_cache import user_cache
+
+# Import index registry
+from db_indexes import ensure_indexes, report_collection_scans
+
+# Import password hasher
+from shared.password_hasher import password_hasher, PasswordHasherBusy
+
+# Import payment gateway
+from shared.payment_gateway import PaymentGateway
+from shared.connect_status import ConnectStatusCache
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
@@ -36,10 +57,13 @@ db = client[os.environ['DB_NAME']]
 JWT_SECRET = os.environ.get('JWT_SECRET_KEY', 'default-secret-key')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
+ADMIN_STATS_RECONCILE_SECONDS = int(os.environ.get('ADMIN_STATS_RECONCILE_SECONDS', '900'))
 
 # Stripe Config
 STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY', 'sk_test_emergent')
 stripe.api_key = STRIPE_API_KEY
+payment_gateway = PaymentGateway(api_key=STRIPE_API_KEY)
+STRIPE_CONNECT_WEBHOOK_SECRET = os.environ.get('STRIPE_CONNECT_WEBHOOK_SECRET', '')
 
 # Platform Commission Rate (15%)
 PLATFORM_COMMISSION_RATE = 0.15
@@ -305,11 +329,11 @@ class AdminStats(BaseModel):
 
 # ============== AUTH HELPERS ==============
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+async def verify_password(password: str, hashed: str) -> bool:
+    return await password_hasher.verify(password, hashed)
 
 def create_token(user_id: str, email: str, role: str = "student") -> str:
     payload = {
@@ -325,7 +349,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         raise HTTPException(status_code=401, detail="Not authenticated")
     try:
         payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user = await db.users.find_one({"id": payload["sub"]}, {"_id": 0, "password": 0})
+        user = await user_cache.get_or_load(payload["sub"], load_user)
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
         return user
@@ -351,11 +375,14 @@ async def get_optional_user(credentials: HTTPAuthorizationCredentials = Depends(
         return None
     try:
         payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user = await db.users.find_one({"id": payload["sub"]}, {"_id": 0, "password": 0})
+        user = await user_cache.get_or_load(payload["sub"], load_user)
         return user
     except:
         return None
 
+async def load_user(user_id: str) -> Optional[dict]:
+    return await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
+
 # ============== AUTH ROUTES ==============
 
 @api_router.post("/auth/register", response_model=TokenResponse)
@@ -369,12 +396,13 @@ async def register(user_data: UserCreate):
         "id": user_id,
         "name": user_data.name,
         "email": user_data.email,
-        "password": hash_password(user_data.password),
+        "password": await hash_password(user_data.password),
         "role": "student",  # Always student for regular registration
         "plan": "free",  # Plano gratuito por padrão
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.users.insert_one(user)
+    await bump_admin_stats(total_users=1)
     
     token = create_token(user_id, user_data.email, "student")
     return TokenResponse(
@@ -412,13 +440,14 @@ async def register_school(data: SchoolRegister):
         owner_id=user_id
     )
     await db.schools.insert_one(school.model_dump())
+    await bump_admin_stats(total_schools=1, approved_schools=1)
     
     # Create user record
     user = {
         "id": user_id,
         "name": data.name,
         "email": data.email,
-        "password": hash_password(data.password),
+        "password": await hash_password(data.password),
         "role": "school",
         "school_id": school_id,
         "created_at": datetime.now(timezone.utc).isoformat()
@@ -441,7 +470,15 @@ async def register_school(data: SchoolRegister):
 @api_router.post("/auth/login", response_model=TokenResponse)
 async def login(credentials: UserLogin):
     user = await db.users.find_one({"email": credentials.email})
-    if not user or not verify_password(credentials.password, user["password"]):
+    try:
+        valid = bool(user) and await verify_password(credentials.password, user["password"])
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="Muitas tentativas de login, tente novamente em instantes",
+            headers={"Retry-After": "1"}
+        )
+    if not valid:
         raise HTTPException(status_code=401, detail="Email ou senha incorretos")
     
     role = user.get("role", "student")
@@ -486,6 +523,7 @@ async def update_profile(data: UserProfileUpdate, user: dict = Depends(get_curre
         {"id": user["id"]},
         {"$set": update_data}
     )
+    user_cache.invalidate(user["id"])
     
     updated_user = await db.users.find_one({"id": user["id"]}, {"_id": 0, "password": 0})
     return UserResponse(
@@ -521,6 +559,7 @@ async def upload_avatar(file: UploadFile = File(...), user: dict = Depends(get_c
         {"id": user["id"]},
         {"$set": {"avatar": avatar_data}}
     )
+    user_cache.invalidate(user["id"])
     
     logger.info(f"Avatar uploaded for user {user['id']}")
     
@@ -622,14 +661,17 @@ async def check_plus_payment_status(session_id: str, request: Request, user: dic
                 )
                 
                 # Activate PLUS plan for user
-                await db.users.update_one(
-                    {"id": user["id"]},
+                upgraded = await db.users.update_one(
+                    {"id": user["id"], "plan": {"$ne": "plus"}},
                     {"$set": {
                         "plan": "plus",
                         "plan_purchased_at": datetime.now(timezone.utc).isoformat(),
                         "plan_session_id": session_id
                     }}
                 )
+                user_cache.invalidate(user["id"])
+                if upgraded.modified_count:
+                    await bump_admin_stats(plus_subscribers=1)
                 
                 logger.info(f"🎉 PLUS plan activated for user {user['id']} ({user['email']})")
                 logger.info(f"📧 EMAIL: Bem-vindo ao Plano PLUS!")
@@ -668,42 +710,133 @@ async def require_plus_plan(user: dict = Depends(get_current_user)):
 
 # ============== ADMIN ROUTES ==============
 
+# ============== ADMIN STATS ==============
+
+async def compute_admin_stats() -> dict:
+    """Count everything from scratch; the independent queries run concurrently"""
+    (
+        total_users, total_schools, pending_schools, approved_schools,
+        total_courses, total_enrollments, paid_enrollments, revenue_result, plus_subscribers
+    ) = await asyncio.gather(
+        db.users.count_documents({"role": "student"}),
+        db.schools.count_documents({}),
+        db.schools.count_documents({"status": "pending"}),
+        db.schools.count_documents({"status": "approved"}),
+        db.courses.count_documents({}),
+        db.enrollments.count_documents({}),
+        db.enrollments.count_documents({"status": "paid"}),
+        db.payment_transactions.aggregate([
+            {"$match": {"status": "paid"}},
+            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
+        ]).to_list(1),
+        db.users.count_documents({"plan": "plus"})
+    )
+    return {
+        "total_users": total_users,
+        "total_schools": total_schools,
+        "pending_schools": pending_schools,
+        "approved_schools": approved_schools,
+        "total_courses": total_courses,
+        "total_enrollments": total_enrollments,
+        "paid_enrollments": paid_enrollments,
+        "total_revenue": revenue_result[0]["total"] if revenue_result else 0,
+        "plus_subscribers": plus_subscribers
+    }
+
+async def refresh_admin_stats() -> dict:
+    """Recompute and store the materialized stats document"""
+    stats = await compute_admin_stats()
+    stats["reconciled_at"] = datetime.now(timezone.utc).isoformat()
+    await db.admin_stats.replace_one({"_id": "global"}, stats, upsert=True)
+    return stats
+
+async def bump_admin_stats(**deltas):
+    """Apply counter deltas on write; skipped until the document has been materialized"""
+    if not deltas:
+        return
+    await db.admin_stats.update_one({"_id": "global"}, {"$inc": deltas})
+
+def school_status_deltas(old_status: Optional[str], new_status: str) -> dict:
+    deltas = {}
+    for status, delta in ((old_status, -1), (new_status, 1)):
+        if status in ("pending", "approved"):
+            deltas[f"{status}_schools"] = deltas.get(f"{status}_schools", 0) + delta
+    return deltas
+
+async def mark_transaction_paid(session_id: str, transaction: dict):
+    """Flip a payment transaction to paid once and count its revenue"""
+    result = await db.payment_transactions.update_one(
+        {"session_id": session_id, "status": {"$ne": "paid"}},
+        {"$set": {
+            "status": "paid",
+            "payment_status": "paid",
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }}
+    )
+    if result.modified_count:
+        await bump_admin_stats(total_revenue=transaction.get("amount", 0))
+
+async def mark_enrollment_paid(enrollment_id: str, fields: dict):
+    """Flip an enrollment to paid once and count it"""
+    result = await db.enrollments.update_one(
+        {"id": enrollment_id, "status": {"$ne": "paid"}},
+        {"$set": fields}
+    )
+    if result.modified_count:
+        await bump_admin_stats(paid_enrollments=1)
+
+# Strong references to the background loops, cancelled at shutdown
+background_tasks: List[asyncio.Task] = []
+
+async def admin_stats_reconcile_loop():
+    """Periodically recount so missed or raced deltas cannot drift for long"""
+    while True:
+        await asyncio.sleep(ADMIN_STATS_RECONCILE_SECONDS)
+        try:
+            await refresh_admin_stats()
+        except Exception as e:
+            logger.error(f"Admin stats reconcile failed: {e}")
+
 @api_router.get("/admin/stats", response_model=AdminStats)
-async def get_admin_stats(admin: dict = Depends(get_admin_user)):
-    """Get dashboard statistics for admin"""
-    total_users = await db.users.count_documents({"role": "student"})
-    total_schools = await db.schools.count_documents({})
-    pending_schools = await db.schools.count_documents({"status": "pending"})
-    approved_schools = await db.schools.count_documents({"status": "approved"})
-    total_courses = await db.courses.count_documents({})
-    total_enrollments = await db.enrollments.count_documents({})
-    paid_enrollments = await db.enrollments.count_documents({"status": "paid"})
-    
-    # Calculate total revenue
-    pipeline = [
-        {"$match": {"status": "paid"}},
-        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-    ]
-    revenue_result = await db.payment_transactions.aggregate(pipeline).to_list(1)
-    total_revenue = revenue_result[0]["total"] if revenue_result else 0
-    
-    # PLUS subscribers stats
-    plus_subscribers = await db.users.count_documents({"plan": "plus"})
-    plus_revenue = plus_subscribers * STUDENT_PLUS_PLAN["price"]
+async def get_admin_stats(refresh: bool = False, admin: dict = Depends(get_admin_user)):
+    """Get dashboard statistics for admin from the materialized stats document"""
+    stats = None if refresh else await db.admin_stats.find_one({"_id": "global"})
+    if not stats:
+        stats = await refresh_admin_stats()
     
     return AdminStats(
-        total_users=total_users,
-        total_schools=total_schools,
-        pending_schools=pending_schools,
-        approved_schools=approved_schools,
-        total_courses=total_courses,
-        total_enrollments=total_enrollments,
-        paid_enrollments=paid_enrollments,
-        total_revenue=total_revenue,
-        plus_subscribers=plus_subscribers,
-        plus_revenue=plus_revenue
+        total_users=stats["total_users"],
+        total_schools=stats["total_schools"],
+        pending_schools=stats["pending_schools"],
+        approved_schools=stats["approved_schools"],
+        total_courses=stats["total_courses"],
+        total_enrollments=stats["total_enrollments"],
+        paid_enrollments=stats["paid_enrollments"],
+        total_revenue=stats["total_revenue"],
+        plus_subscribers=stats["plus_subscribers"],
+        plus_revenue=stats["plus_subscribers"] * STUDENT_PLUS_PLAN["price"]
     )
 
+@api_router.get("/admin/metrics")
+async def get_admin_metrics(admin: dict = Depends(get_admin_user)):
+    """In-process performance counters for this worker"""
+    return {
+        "user_cache": user_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+        "payment_gateway": payment_gateway.stats(),
+        "connect_status": connect_status.stats(),
+        "chat": chat_stats()
+    }
+
+@api_router.get("/admin/index-report")
+async def get_index_report(admin: dict = Depends(get_admin_user)):
+    """Explain the hot query shapes and flag those still doing collection scans"""
+    report = await report_collection_scans(db)
+    return {
+        "collection_scans": [r["name"] for r in report if r.get("collection_scan")],
+        "queries": report
+    }
+
 @api_router.get("/admin/schools")
 async def admin_get_schools(admin: dict = Depends(get_admin_user), status: Optional[str] = None):
     """Get all schools for admin"""
@@ -716,23 +849,27 @@ async def admin_get_schools(admin: dict = Depends(get_admin_user), status: Optio
 @api_router.put("/admin/schools/{school_id}/approve")
 async def admin_approve_school(school_id: str, admin: dict = Depends(get_admin_user)):
     """Approve a school"""
-    result = await db.schools.update_one(
-        {"id": school_id},
-        {"$set": {"status": "approved"}}
+    previous = await db.schools.find_one_and_update(
+        {"id": school_id, "status": {"$ne": "approved"}},
+        {"$set": {"status": "approved"}},
+        projection={"_id": 0, "status": 1}
     )
-    if result.modified_count == 0:
+    if not previous:
         raise HTTPException(status_code=404, detail="School not found")
+    await bump_admin_stats(**school_status_deltas(previous.get("status"), "approved"))
     return {"message": "School approved", "school_id": school_id}
 
 @api_router.put("/admin/schools/{school_id}/reject")
 async def admin_reject_school(school_id: str, admin: dict = Depends(get_admin_user)):
     """Reject a school"""
-    result = await db.schools.update_one(
-        {"id": school_id},
-        {"$set": {"status": "rejected"}}
+    previous = await db.schools.find_one_and_update(
+        {"id": school_id, "status": {"$ne": "rejected"}},
+        {"$set": {"status": "rejected"}},
+        projection={"_id": 0, "status": 1}
     )
-    if result.modified_count == 0:
+    if not previous:
         raise HTTPException(status_code=404, detail="School not found")
+    await bump_admin_stats(**school_status_deltas(previous.get("status"), "rejected"))
     return {"message": "School rejected", "school_id": school_id}
 
 @api_router.get("/admin/users")
@@ -771,27 +908,36 @@ async def school_dashboard(user: dict = Depends(get_school_user)):
     if not school_id:
         raise HTTPException(status_code=400, detail="No school associated with this account")
     
-    school = await db.schools.find_one({"id": school_id}, {"_id": 0})
+    # One $facet pass over the school's enrollments, run concurrently with the school and course lookups
+    pipeline = [
+        {"$match": {"school_id": school_id}},
+        {"$facet": {
+            "total": [{"$count": "n"}],
+            "paid": [
+                {"$match": {"status": "paid"}},
+                {"$group": {
+                    "_id": None,
+                    "count": {"$sum": 1},
+                    "revenue": {"$sum": "$price"},
+                    "pending_letters": {"$sum": {"$cond": [{"$eq": ["$letter_sent", False]}, 1, 0]}}
+                }}
+            ]
+        }}
+    ]
+    school, total_courses, facets = await asyncio.gather(
+        db.schools.find_one({"id": school_id}, {"_id": 0}),
+        db.courses.count_documents({"school_id": school_id}),
+        db.enrollments.aggregate(pipeline).to_list(1)
+    )
     if not school:
         raise HTTPException(status_code=404, detail="School not found")
     
-    # Get stats
-    total_courses = await db.courses.count_documents({"school_id": school_id})
-    total_enrollments = await db.enrollments.count_documents({"school_id": school_id})
-    paid_enrollments = await db.enrollments.count_documents({"school_id": school_id, "status": "paid"})
-    pending_letters = await db.enrollments.count_documents({
-        "school_id": school_id, 
-        "status": "paid",
-        "letter_sent": False
-    })
-    
-    # Calculate revenue
-    pipeline = [
-        {"$match": {"school_id": school_id, "status": "paid"}},
-        {"$group": {"_id": None, "total": {"$sum": "$price"}}}
-    ]
-    revenue_result = await db.enrollments.aggregate(pipeline).to_list(1)
-    total_revenue = revenue_result[0]["total"] if revenue_result else 0
+    facets = facets[0]
+    total_enrollments = facets["total"][0]["n"] if facets["total"] else 0
+    paid = facets["paid"][0] if facets["paid"] else {}
+    paid_enrollments = paid.get("count", 0)
+    pending_letters = paid.get("pending_letters", 0)
+    total_revenue = paid.get("revenue", 0)
     
     return {
         "school": school,
@@ -855,6 +1001,7 @@ async def create_school_course(data: CourseCreate, user: dict = Depends(get_scho
         **data.model_dump()
     )
     await db.courses.insert_one(course.model_dump())
+    await bump_admin_stats(total_courses=1)
     return course
 
 @api_router.put("/school/courses/{course_id}")
@@ -925,6 +1072,15 @@ async def send_enrollment_letter(enrollment_id: str, letter_url: str, user: dict
 
 # ============== STRIPE CONNECT FOR SCHOOLS ==============
 
+async def sync_school_onboarding(account_id: str, onboarding_complete: bool):
+    """Mirror Connect onboarding completion onto the school record"""
+    await db.schools.update_one(
+        {"stripe_account_id": account_id},
+        {"$set": {"stripe_onboarding_complete": onboarding_complete}}
+    )
+
+connect_status = ConnectStatusCache(db, payment_gateway, on_onboarding_change=sync_school_onboarding)
+
 @api_router.post("/school/stripe/onboard")
 async def create_stripe_onboarding(data: StripeOnboardingRequest, user: dict = Depends(get_school_user)):
     """Create Stripe Connect onboarding link for school"""
@@ -938,29 +1094,29 @@ async def create_stripe_onboarding(data: StripeOnboardingRequest, user: dict = D
         # Check if school already has a Stripe account
         if school.get("stripe_account_id"):
             # Create new account link for existing account
-            account_link = stripe.AccountLink.create(
-                account=school["stripe_account_id"],
-                refresh_url=f"{data.origin_url}/school/stripe/refresh",
-                return_url=f"{data.origin_url}/school/stripe/complete",
-                type="account_onboarding"
-            )
+            account_link = await payment_gateway.create_account_link({
+                "account": school["stripe_account_id"],
+                "refresh_url": f"{data.origin_url}/school/stripe/refresh",
+                "return_url": f"{data.origin_url}/school/stripe/complete",
+                "type": "account_onboarding"
+            })
             return {"url": account_link.url, "account_id": school["stripe_account_id"]}
         
         # Create new Stripe Connect Express account
-        account = stripe.Account.create(
-            type="express",
-            country="IE",  # Ireland
-            email=user.get("email"),
-            capabilities={
+        account = await payment_gateway.create_account({
+            "type": "express",
+            "country": "IE",  # Ireland
+            "email": user.get("email"),
+            "capabilities": {
                 "card_payments": {"requested": True},
                 "transfers": {"requested": True}
             },
-            business_type="company",
-            metadata={
+            "business_type": "company",
+            "metadata": {
                 "school_id": school_id,
                 "school_name": school.get("name")
             }
-        )
+        }, idempotency_key=f"connect-account-{school_id}")
         
         # Save account ID to school record
         await db.schools.update_one(
@@ -969,12 +1125,12 @@ async def create_stripe_onboarding(data: StripeOnboardingRequest, user: dict = D
         )
         
         # Create account onboarding link
-        account_link = stripe.AccountLink.create(
-            account=account.id,
-            refresh_url=f"{data.origin_url}/school/stripe/refresh",
-            return_url=f"{data.origin_url}/school/stripe/complete",
-            type="account_onboarding"
-        )
+        account_link = await payment_gateway.create_account_link({
+            "account": account.id,
+            "refresh_url": f"{data.origin_url}/school/stripe/refresh",
+            "return_url": f"{data.origin_url}/school/stripe/complete",
+            "type": "account_onboarding"
+        })
         
         logger.info(f"Created Stripe Connect account {account.id} for school {school_id}")
         
@@ -985,8 +1141,8 @@ async def create_stripe_onboarding(data: StripeOnboardingRequest, user: dict = D
         raise HTTPException(status_code=400, detail=str(e))
 
 @api_router.get("/school/stripe/status")
-async def get_stripe_connect_status(user: dict = Depends(get_school_user)):
-    """Check if school's Stripe Connect account is fully set up"""
+async def get_stripe_connect_status(refresh: bool = False, user: dict = Depends(get_school_user)):
+    """Check if school's Stripe Connect account is fully set up (cached; refresh=true forces a Stripe lookup)"""
     school_id = user.get("school_id")
     school = await db.schools.find_one({"id": school_id}, {"_id": 0})
     
@@ -1005,22 +1161,17 @@ async def get_stripe_connect_status(user: dict = Depends(get_school_user)):
         }
     
     try:
-        account = stripe.Account.retrieve(stripe_account_id)
-        
-        # Update school record with latest status
-        is_complete = account.charges_enabled and account.payouts_enabled
-        await db.schools.update_one(
-            {"id": school_id},
-            {"$set": {"stripe_onboarding_complete": is_complete}}
-        )
+        account = await connect_status.get(stripe_account_id, force_refresh=refresh)
         
         return {
             "connected": True,
             "account_id": stripe_account_id,
-            "charges_enabled": account.charges_enabled,
-            "payouts_enabled": account.payouts_enabled,
-            "details_submitted": account.details_submitted,
-            "onboarding_complete": is_complete,
+            "charges_enabled": account["charges_enabled"],
+            "payouts_enabled": account["payouts_enabled"],
+            "details_submitted": account["details_submitted"],
+            "onboarding_complete": account["onboarding_complete"],
+            "requirements": account["requirements"],
+            "refreshed_at": account["refreshed_at"],
             "commission_rate": PLATFORM_COMMISSION_RATE * 100
         }
     
@@ -1042,7 +1193,7 @@ async def get_stripe_dashboard_link(user: dict = Depends(get_school_user)):
         raise HTTPException(status_code=400, detail="Stripe não conectado")
     
     try:
-        login_link = stripe.Account.create_login_link(school["stripe_account_id"])
+        login_link = await payment_gateway.create_login_link(school["stripe_account_id"])
         return {"url": login_link.url}
     except stripe.error.StripeError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -1196,28 +1347,34 @@ async def get_school_earnings(user: dict = Depends(get_school_user)):
     # Fixed commission rate of 15%
     commission_rate = PLATFORM_COMMISSION_RATE
     
-    # Get all paid enrollments
-    enrollments = await db.enrollments.find(
-        {"school_id": school_id, "status": "paid"},
-        {"_id": 0}
-    ).to_list(1000)
+    # Group paid enrollments by payment month in the database; only one row per month comes back.
+    # Dates are stored as ISO strings, so the month is their "YYYY-MM" prefix
+    pipeline = [
+        {"$match": {"school_id": school_id, "status": "paid"}},
+        {"$group": {
+            "_id": {"$substrCP": [{"$ifNull": ["$paid_at", {"$ifNull": ["$created_at", ""]}]}, 0, 7]},
+            "gross": {"$sum": "$price"},
+            "count": {"$sum": 1}
+        }},
+        {"$sort": {"_id": 1}}
+    ]
+    months = await db.enrollments.aggregate(pipeline).to_list(None)
     
-    total_gross = sum(e.get("price", 0) for e in enrollments)
+    total_gross = sum(m["gross"] for m in months)
     total_commission = total_gross * commission_rate
     total_net = total_gross - total_commission
-    
-    # Monthly breakdown
-    monthly_earnings = {}
-    for enrollment in enrollments:
-        paid_at = enrollment.get("paid_at", enrollment.get("created_at", ""))
-        if paid_at:
-            month_key = paid_at[:7]  # YYYY-MM
-            if month_key not in monthly_earnings:
-                monthly_earnings[month_key] = {"gross": 0, "commission": 0, "net": 0, "count": 0}
-            monthly_earnings[month_key]["gross"] += enrollment.get("price", 0)
-            monthly_earnings[month_key]["commission"] += enrollment.get("price", 0) * commission_rate
-            monthly_earnings[month_key]["net"] += enrollment.get("price", 0) * (1 - commission_rate)
-            monthly_earnings[month_key]["count"] += 1
+    total_enrollments = sum(m["count"] for m in months)
+    
+    # Monthly breakdown (enrollments without a usable date only count towards the summary)
+    monthly_earnings = {
+        m["_id"]: {
+            "gross": m["gross"],
+            "commission": m["gross"] * commission_rate,
+            "net": m["gross"] * (1 - commission_rate),
+            "count": m["count"]
+        }
+        for m in months if m["_id"]
+    }
     
     return {
         "summary": {
@@ -1225,7 +1382,7 @@ async def get_school_earnings(user: dict = Depends(get_school_user)):
             "total_commission": round(total_commission, 2),
             "commission_rate": commission_rate * 100,  # 15%
             "total_net": round(total_net, 2),
-            "total_enrollments": len(enrollments)
+            "total_enrollments": total_enrollments
         },
         "stripe_connected": school.get("stripe_onboarding_complete", False),
         "monthly": monthly_earnings
@@ -1298,6 +1455,7 @@ async def create_enrollment(
     )
     
     await db.enrollments.insert_one(enrollment.model_dump())
+    await bump_admin_stats(total_enrollments=1)
     return enrollment
 
 @api_router.get("/enrollments", response_model=List[Enrollment])
@@ -1352,9 +1510,9 @@ async def create_checkout(
     try:
         # If school has Stripe Connect, use destination charges
         if stripe_account_id and school.get("stripe_onboarding_complete"):
-            session = stripe.checkout.Session.create(
-                payment_method_types=["card"],
-                line_items=[{
+            session = await payment_gateway.create_checkout_session({
+                "payment_method_types": ["card"],
+                "line_items": [{
                     "price_data": {
                         "currency": "eur",
                         "product_data": {
@@ -1365,16 +1523,16 @@ async def create_checkout(
                     },
                     "quantity": 1
                 }],
-                mode="payment",
-                success_url=success_url,
-                cancel_url=cancel_url,
-                payment_intent_data={
+                "mode": "payment",
+                "success_url": success_url,
+                "cancel_url": cancel_url,
+                "payment_intent_data": {
                     "application_fee_amount": int(platform_fee * 100),  # 15% platform fee
                     "transfer_data": {
                         "destination": stripe_account_id  # 85% goes to school
                     }
                 },
-                metadata={
+                "metadata": {
                     "enrollment_id": enrollment["id"],
                     "user_id": user["id"],
                     "user_email": user["email"],
@@ -1384,7 +1542,7 @@ async def create_checkout(
                     "platform_fee": str(platform_fee),
                     "school_amount": str(school_amount)
                 }
-            )
+            })
             
             payment_type = "stripe_connect"
         else:
@@ -1467,21 +1625,11 @@ async def get_payment_status(session_id: str, http_request: Request):
         )
         
         if transaction and transaction.get("status") != "paid" and status.payment_status == "paid":
-            await db.payment_transactions.update_one(
-                {"session_id": session_id},
-                {"$set": {
-                    "status": "paid",
-                    "payment_status": "paid",
-                    "updated_at": datetime.now(timezone.utc).isoformat()
-                }}
-            )
+            await mark_transaction_paid(session_id, transaction)
             
             enrollment_id = transaction.get("enrollment_id")
             if enrollment_id:
-                await db.enrollments.update_one(
-                    {"id": enrollment_id},
-                    {"$set": {"status": "paid"}}
-                )
+                await mark_enrollment_paid(enrollment_id, {"status": "paid"})
                 
                 logger.info(f"📧 EMAIL NOTIFICATION: Payment confirmed for enrollment {enrollment_id}")
                 logger.info(f"   To: {transaction.get('user_email')}")
@@ -1497,6 +1645,23 @@ async def get_payment_status(session_id: str, http_request: Request):
         logger.error(f"Error checking payment status: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@api_router.post("/webhook/stripe/connect")
+async def stripe_connect_webhook(request: Request):
+    """Stripe Connect webhook; account.updated events refresh the cached account state"""
+    if not STRIPE_CONNECT_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Webhook Connect não configurado")
+    
+    payload = await request.body()
+    try:
+        event = stripe.Webhook.construct_event(
+            payload, request.headers.get("Stripe-Signature"), STRIPE_CONNECT_WEBHOOK_SECRET
+        )
+    except (ValueError, stripe.error.SignatureVerificationError):
+        raise HTTPException(status_code=400, detail="Assinatura do webhook inválida")
+    
+    await connect_status.apply_event(event)
+    return {"received": True}
+
 @api_router.post("/webhook/stripe")
 async def stripe_webhook(request: Request):
     body = await request.body()
@@ -1518,25 +1683,15 @@ async def stripe_webhook(request: Request):
             )
             
             if transaction and transaction.get("status") != "paid":
-                await db.payment_transactions.update_one(
-                    {"session_id": session_id},
-                    {"$set": {
-                        "status": "paid",
-                        "payment_status": "paid",
-                        "updated_at": datetime.now(timezone.utc).isoformat()
-                    }}
-                )
+                await mark_transaction_paid(session_id, transaction)
                 
                 enrollment_id = webhook_response.metadata.get("enrollment_id")
                 if enrollment_id:
                     # Update enrollment status
-                    await db.enrollments.update_one(
-                        {"id": enrollment_id},
-                        {"$set": {
-                            "status": "paid",
-                            "paid_at": datetime.now(timezone.utc).isoformat()
-                        }}
-                    )
+                    await mark_enrollment_paid(enrollment_id, {
+                        "status": "paid",
+                        "paid_at": datetime.now(timezone.utc).isoformat()
+                    })
                     
                     # Get enrollment details for emails
                     enrollment = await db.enrollments.find_one({"id": enrollment_id}, {"_id": 0})
@@ -1949,7 +2104,7 @@ async def seed_database():
             "id": admin_id,
             "name": "Admin",
             "email": "admin@dublinstudy.com",
-            "password": hash_password("admin123"),
+            "password": await hash_password("admin123"),
             "role": "admin",
             "created_at": datetime.now(timezone.utc).isoformat()
         })
@@ -2278,6 +2433,8 @@ async def seed_database():
     for agency in agencies:
         await db.agencies.insert_one(agency.model_dump())
     
+    await refresh_admin_stats()
+    
     return {
         "message": "Database seeded successfully",
         "admin_email": "admin@dublinstudy.com",
@@ -2313,7 +2470,17 @@ app.add_middleware(
 async def startup_event():
     """Initialize on startup"""
     await setup_ttl_index()
+    await ensure_indexes(db)
+    await backfill_chat_seq()
+    await migrate_inline_audio()
+    background_tasks.append(asyncio.create_task(admin_stats_reconcile_loop()))
+    await start_chat()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await stop_chat()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
     client.close()
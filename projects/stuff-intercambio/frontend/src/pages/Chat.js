@@ -49,6 +49,8 @@ import EmojiPicker from 'emoji-picker-react';
 
 const API_URL = process.env.REACT_APP_BACKEND_URL;
 const WS_URL = API_URL.replace('https://', 'wss://').replace('http://', 'ws://');
+// Pause before asking again for changes held back behind an in-flight write
+const SYNC_RETRY_MS = 500;
 
 const LOGO_URL = "https://customer-assets.emergentagent.com/job_dublin-study/artifacts/o9gnc0xi_WhatsApp%20Image%202026-01-11%20at%2023.59.07.jpeg";
 
@@ -212,7 +214,7 @@ export const Chat = () => {
   const [isConnecting, setIsConnecting] = useState(false);
   const [showEmojiPicker, setShowEmojiPicker] = useState(false);
   const [showUsersList, setShowUsersList] = useState(false);
-  const [typingUsers, setTypingUsers] = useState([]);
+  const [typingUsers, setTypingUsers] = useState([]); // [{ user_id, user_name }]
   const [banDialogOpen, setBanDialogOpen] = useState(false);
   const [userToBan, setUserToBan] = useState(null);
   const [banReason, setBanReason] = useState('');
@@ -227,6 +229,8 @@ export const Chat = () => {
   const messagesEndRef = useRef(null);
   const typingTimeoutRef = useRef(null);
   const reconnectTimeoutRef = useRef(null);
+  const lastChangeSeqRef = useRef(null); // every change up to here was received; sent as resume token on reconnect
+  const pendingChangeSeqsRef = useRef(new Set()); // live change_seqs received past a gap in the token
   const inputRef = useRef(null);
   const mediaRecorderRef = useRef(null);
   const audioChunksRef = useRef([]);
@@ -315,12 +319,84 @@ export const Chat = () => {
     scrollToBottom();
   }, [messages, scrollToBottom]);
 
+  // Live frames can arrive out of order (change N+1 before N from another worker), so the
+  // resume token only moves over contiguous numbers; a reconnect replays anything past a gap
+  const advanceChangeSeq = () => {
+    const pending = pendingChangeSeqsRef.current;
+    while (pending.has(lastChangeSeqRef.current + 1)) {
+      lastChangeSeqRef.current += 1;
+      pending.delete(lastChangeSeqRef.current);
+    }
+  };
+
+  const trackChangeSeq = (changeSeq) => {
+    if (changeSeq == null) return;
+    if (lastChangeSeqRef.current == null) {
+      lastChangeSeqRef.current = changeSeq;
+    } else if (changeSeq > lastChangeSeqRef.current) {
+      pendingChangeSeqsRef.current.add(changeSeq);
+      advanceChangeSeq();
+    }
+  };
+
+  // Sync results are gap-free up to their highest change_seq, so the token can jump there
+  const settleChangeSeq = (changeSeq) => {
+    if (changeSeq == null || (lastChangeSeqRef.current != null && changeSeq <= lastChangeSeqRef.current)) return;
+    lastChangeSeqRef.current = changeSeq;
+    pendingChangeSeqsRef.current.forEach(seq => {
+      if (seq <= changeSeq) pendingChangeSeqsRef.current.delete(seq);
+    });
+    advanceChangeSeq();
+  };
+
+  // Place a message by creation order; messages without a seq (system notes) stay where they are
+  const insertBySeq = (list, msg) => {
+    const index = msg.seq == null ? -1 : list.findIndex(m => m.seq != null && m.seq > msg.seq);
+    return index === -1 ? [...list, msg] : [...list.slice(0, index), msg, ...list.slice(index)];
+  };
+
+  // Apply messages created or deleted while we were away, replacing copies we already have
+  const mergeMessages = useCallback((changed) => {
+    setMessages(prev => {
+      const updates = new Map(changed.map(msg => [msg.id, msg]));
+      const known = new Set(prev.map(msg => msg.id));
+      return changed
+        .filter(msg => !known.has(msg.id) && !msg.deleted)
+        .reduce(insertBySeq, prev.map(msg => updates.get(msg.id) || msg));
+    });
+  }, []);
+
+  const highestChangeSeq = (batch) => batch.reduce((max, msg) => Math.max(max, msg.change_seq ?? max), -1);
+
+  // Page through everything that changed after `fromChangeSeq` (the end of the last sync batch)
+  const syncSince = useCallback(async (fromChangeSeq) => {
+    try {
+      let cursor = fromChangeSeq;
+      let page;
+      do {
+        const response = await fetch(`${API_URL}/api/chat/messages?since=${cursor}&limit=100`);
+        if (!response.ok) return;
+        page = await response.json();
+        mergeMessages(page.messages);
+        cursor = Math.max(cursor, highestChangeSeq(page.messages));
+        settleChangeSeq(cursor);
+        // A short page that is not complete is waiting on an in-flight write
+        if (!page.complete && page.messages.length < 100) {
+          await new Promise(resolve => setTimeout(resolve, SYNC_RETRY_MS));
+        }
+      } while (!page.complete);
+    } catch (error) {
+      console.error('Error syncing messages:', error);
+    }
+  }, [mergeMessages]);
+
   // Load initial messages
   const loadMessages = useCallback(async () => {
     try {
       const response = await fetch(`${API_URL}/api/chat/messages?limit=50`);
       if (response.ok) {
         const data = await response.json();
+        data.forEach(msg => trackChangeSeq(msg.change_seq));
         setMessages(data);
       }
     } catch (error) {
@@ -333,7 +409,9 @@ export const Chat = () => {
     if (!token || wsRef.current?.readyState === WebSocket.OPEN) return;
     
     setIsConnecting(true);
-    const ws = new WebSocket(`${WS_URL}/api/chat/ws?token=${token}`);
+    const resumeFrom = lastChangeSeqRef.current;
+    const resume = resumeFrom != null ? `&resume=${resumeFrom}` : '';
+    const ws = new WebSocket(`${WS_URL}/api/chat/ws?token=${token}${resume}`);
     
     ws.onopen = () => {
       setIsConnected(true);
@@ -346,9 +424,40 @@ export const Chat = () => {
       switch (data.type) {
         case 'connected':
           setOnlineUsers(data.online_users || []);
+          setTypingUsers([]);
+          break;
+        case 'sync': {
+          const synced = data.messages || [];
+          mergeMessages(synced);
+          // Live frames may have raced ahead of this batch; keep paging from its own end
+          const syncedTo = Math.max(resumeFrom, highestChangeSeq(synced));
+          settleChangeSeq(syncedTo);
+          if (!data.complete) syncSince(syncedTo);
+          break;
+        }
+        case 'agent_stream_start':
+          setMessages(prev => [...prev, {
+            id: data.message_id,
+            user_id: data.user_id,
+            user_name: data.user_name,
+            content: '',
+            message_type: 'text',
+            created_at: data.created_at,
+            is_agent: true,
+            streaming: true
+          }]);
+          break;
+        case 'agent_stream_delta':
+          setMessages(prev => prev.map(msg =>
+            msg.id === data.message_id ? { ...msg, content: msg.content + data.delta } : msg
+          ));
           break;
         case 'message':
-          setMessages(prev => [...prev, data.message]);
+          trackChangeSeq(data.message.change_seq);
+          // Replaces a streamed agent answer with the stored message
+          setMessages(prev => prev.some(msg => msg.id === data.message.id)
+            ? prev.map(msg => msg.id === data.message.id ? data.message : msg)
+            : insertBySeq(prev, data.message));
           // Play notification sound for messages from others
           if (data.message.user_id !== user?.id) {
             playNotificationSound();
@@ -364,22 +473,19 @@ export const Chat = () => {
           setOnlineUsers(prev => prev.filter(u => u.user_id !== data.user_id));
           break;
         case 'message_deleted':
+          trackChangeSeq(data.change_seq);
           setMessages(prev => prev.map(msg => 
             msg.id === data.message_id 
               ? { ...msg, content: '[Mensagem removida]', deleted: true }
               : msg
           ));
           break;
-        case 'typing':
-          if (data.user_id !== user?.id) {
-            setTypingUsers(prev => {
-              if (prev.includes(data.user_name)) return prev;
-              return [...prev, data.user_name];
-            });
-            setTimeout(() => {
-              setTypingUsers(prev => prev.filter(name => name !== data.user_name));
-            }, 3000);
-          }
+        case 'typing_update':
+          // Coalesced by the server: who started and who stopped typing since the last update
+          setTypingUsers(prev => [
+            ...prev.filter(u => !data.stopped.includes(u.user_id)),
+            ...data.started.filter(u => u.user_id !== user?.id && !prev.some(p => p.user_id === u.user_id))
+          ]);
           break;
         case 'banned':
           toast.error(`Você foi banido. Motivo: ${data.reason}`);
@@ -409,7 +515,7 @@ export const Chat = () => {
     
     ws.onerror = () => setIsConnecting(false);
     wsRef.current = ws;
-  }, [token, user?.id, playNotificationSound]);
+  }, [token, user?.id, playNotificationSound, mergeMessages, syncSince]);
 
   useEffect(() => {
     if (token) {
@@ -438,8 +544,8 @@ export const Chat = () => {
 
   // Typing indicator
   const handleTyping = () => {
-    if (wsRef.current?.readyState === WebSocket.OPEN) {
-      if (typingTimeoutRef.current) clearTimeout(typingTimeoutRef.current);
+    // One typing signal per 2s is enough: the server keeps us marked as typing for 3s
+    if (wsRef.current?.readyState === WebSocket.OPEN && !typingTimeoutRef.current) {
       wsRef.current.send(JSON.stringify({ type: 'typing' }));
       typingTimeoutRef.current = setTimeout(() => {
         typingTimeoutRef.current = null;
@@ -576,33 +682,30 @@ export const Chat = () => {
       }
       setIsPreviewPlaying(false);
       
-      // Convert blob to base64
-      const reader = new FileReader();
-      reader.onloadend = () => {
-        const base64Audio = reader.result;
-        console.log('Sending audio, data length:', base64Audio?.length);
-        
-        try {
-          wsRef.current.send(JSON.stringify({
-            type: 'message',
-            content: `🎤 Mensagem de voz (${formatRecordingTime(recordingTime)})`,
-            message_type: 'audio',
-            audio_data: base64Audio,
-            audio_duration: recordingTime
-          }));
-          setAudioBlob(null);
-          setAudioUrl(null);
-          setRecordingTime(0);
-          toast.success(language === 'pt' ? 'Áudio enviado!' : 'Audio sent!');
-        } catch (sendError) {
-          console.error('Send error:', sendError);
-          toast.error(language === 'pt' ? 'Erro ao enviar. Tente novamente.' : 'Error sending. Try again.');
-        }
-      };
-      reader.onerror = () => {
-        toast.error(language === 'pt' ? 'Erro ao processar áudio' : 'Error processing audio');
-      };
-      reader.readAsDataURL(audioBlob);
+      // Upload the clip once; the chat message only carries its reference
+      const formData = new FormData();
+      formData.append('file', audioBlob, 'voice-message.webm');
+      const uploadResponse = await fetch(`${API_URL}/api/chat/audio?token=${token}`, {
+        method: 'POST',
+        body: formData
+      });
+      if (!uploadResponse.ok) {
+        toast.error(language === 'pt' ? 'Erro ao enviar áudio' : 'Error sending audio');
+        return;
+      }
+      const { blob_id } = await uploadResponse.json();
+      
+      wsRef.current.send(JSON.stringify({
+        type: 'message',
+        content: `🎤 Mensagem de voz (${formatRecordingTime(recordingTime)})`,
+        message_type: 'audio',
+        audio_blob_id: blob_id,
+        audio_duration: recordingTime
+      }));
+      setAudioBlob(null);
+      setAudioUrl(null);
+      setRecordingTime(0);
+      toast.success(language === 'pt' ? 'Áudio enviado!' : 'Audio sent!');
     } catch (error) {
       console.error('Audio send error:', error);
       toast.error(language === 'pt' ? 'Erro ao enviar áudio' : 'Error sending audio');
@@ -932,9 +1035,9 @@ export const Chat = () => {
                       )}
                       
                       {/* Audio Message with Play Button */}
-                      {msg.message_type === 'audio' && msg.audio_data ? (
+                      {msg.message_type === 'audio' && (msg.audio_url || msg.audio_data) ? (
                         <AudioMessage 
-                          audioUrl={msg.audio_data} 
+                          audioUrl={msg.audio_url ? `${API_URL}${msg.audio_url}` : msg.audio_data} 
                           duration={msg.audio_duration || 0}
                           isOwn={isOwn}
                         />
@@ -979,7 +1082,7 @@ export const Chat = () => {
         {/* Typing indicator */}
         {typingUsers.length > 0 && (
           <div className="px-4 py-1 text-xs text-[#00a884] bg-gray-100">
-            {typingUsers.join(', ')} {language === 'pt' ? 'digitando...' : 'typing...'}
+            {typingUsers.map(u => u.user_name).join(', ')} {language === 'pt' ? 'digitando...' : 'typing...'}
           </div>
         )}
 
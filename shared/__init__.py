@@ -0,0 +1,5 @@
+"""
+Shared Backend Helpers - modules used by more than one backend in this repository
+(backend/, projects/clickbarber/backend/, projects/stuff-intercambio/backend/).
+Each backend puts the repository root on sys.path before importing from here.
+"""
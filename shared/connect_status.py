@@ -0,0 +1,143 @@
+"""
+Connect Status Module - cached Stripe Connect account state
+Features:
+- Account state (charges_enabled, payouts_enabled, details_submitted, requirements) kept in Mongo
+- Dashboard reads served locally; Stripe is only asked once the entry is older than the TTL
+- Accounts still onboarding use a much shorter TTL, so an owner returning from Stripe sees
+  completion within seconds even when the Connect webhook is not configured
+- account.updated webhook events overwrite the cached state as soon as Stripe reports a change;
+  Stripe does not deliver events in order, so one older than the cached state is ignored
+- Owner records are only touched when onboarding completion actually flips, and a failed
+  owner update is retried on the next read
+"""
+
+import os
+import time
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+CONNECT_STATUS_TTL_SECONDS = int(os.environ.get('CONNECT_STATUS_TTL_SECONDS', '3600'))
+CONNECT_STATUS_PENDING_TTL_SECONDS = int(os.environ.get('CONNECT_STATUS_PENDING_TTL_SECONDS', '15'))
+
+
+def account_state(account) -> dict:
+    """Extract the fields the dashboards need from a Stripe account object or event payload"""
+    requirements = account.get("requirements") or {}
+    return {
+        "account_id": account["id"],
+        "charges_enabled": bool(account.get("charges_enabled")),
+        "payouts_enabled": bool(account.get("payouts_enabled")),
+        "details_submitted": bool(account.get("details_submitted")),
+        "requirements": {
+            "currently_due": list(requirements.get("currently_due") or []),
+            "past_due": list(requirements.get("past_due") or []),
+            "disabled_reason": requirements.get("disabled_reason")
+        }
+    }
+
+
+class ConnectStatusCache:
+    """Read-through cache of Connect account state in db.stripe_accounts"""
+
+    def __init__(
+        self,
+        db,
+        gateway,
+        on_onboarding_change: Optional[Callable[[str, bool], Awaitable[None]]] = None,
+        ttl_seconds: int = CONNECT_STATUS_TTL_SECONDS,
+        pending_ttl_seconds: int = CONNECT_STATUS_PENDING_TTL_SECONDS
+    ):
+        self.db = db
+        self.gateway = gateway
+        self.on_onboarding_change = on_onboarding_change
+        self.ttl_seconds = ttl_seconds
+        self.pending_ttl_seconds = pending_ttl_seconds
+        self.hits = 0
+        self.refreshes = 0
+        self.webhook_updates = 0
+        self.stale_events = 0
+
+    def _is_fresh(self, cached: dict) -> bool:
+        refreshed_at = datetime.fromisoformat(cached["refreshed_at"])
+        ttl = self.ttl_seconds if cached["onboarding_complete"] else self.pending_ttl_seconds
+        return datetime.now(timezone.utc) - refreshed_at < timedelta(seconds=ttl)
+
+    async def get(self, account_id: str, force_refresh: bool = False) -> dict:
+        """Return cached state, refreshing from Stripe when missing or stale"""
+        if not force_refresh:
+            cached = await self.db.stripe_accounts.find_one({"account_id": account_id}, {"_id": 0})
+            if cached and self._is_fresh(cached):
+                self.hits += 1
+                if cached.get("owner_onboarding_complete") != cached["onboarding_complete"]:
+                    try:
+                        await self._sync_owner(cached)
+                    except Exception as e:
+                        logger.error(f"Owner onboarding sync for {account_id} failed again: {e}")
+                return cached
+        account = await self.gateway.retrieve_account(account_id)
+        self.refreshes += 1
+        return await self.store(account_state(account), source="api", as_of=int(time.time()))
+
+    async def store(self, state: dict, source: str, as_of: int) -> dict:
+        """Upsert account state unless newer state is already cached; `as_of` is a Unix time
+        (the event's `created` for webhooks). Notifies the owner when onboarding completion flips.
+        """
+        state = {
+            **state,
+            "onboarding_complete": state["charges_enabled"] and state["payouts_enabled"],
+            "source": source,
+            "state_as_of": as_of,
+            "refreshed_at": datetime.now(timezone.utc).isoformat()
+        }
+        try:
+            stored = await self.db.stripe_accounts.find_one_and_update(
+                {
+                    "account_id": state["account_id"],
+                    "$or": [{"state_as_of": {"$exists": False}}, {"state_as_of": {"$lte": as_of}}]
+                },
+                {"$set": state},
+                upsert=True,
+                projection={"_id": 0},
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # The account exists with newer state: this update arrived out of order
+            self.stale_events += 1
+            return await self.db.stripe_accounts.find_one({"account_id": state["account_id"]}, {"_id": 0})
+        # Completion flipped, or an earlier owner update failed: bring the owner in step
+        if stored.get("owner_onboarding_complete") != stored["onboarding_complete"]:
+            await self._sync_owner(stored)
+        return stored
+
+    async def _sync_owner(self, state: dict):
+        """Push onboarding completion to the owner record, then remember it was pushed"""
+        if self.on_onboarding_change:
+            await self.on_onboarding_change(state["account_id"], state["onboarding_complete"])
+        await self.db.stripe_accounts.update_one(
+            {"account_id": state["account_id"], "onboarding_complete": state["onboarding_complete"]},
+            {"$set": {"owner_onboarding_complete": state["onboarding_complete"]}}
+        )
+        state["owner_onboarding_complete"] = state["onboarding_complete"]
+
+    async def apply_event(self, event) -> Optional[dict]:
+        """Handle a verified webhook event; only account.updated changes state"""
+        if event["type"] != "account.updated":
+            return None
+        self.webhook_updates += 1
+        return await self.store(account_state(event["data"]["object"]), source="webhook", as_of=event["created"])
+
+    def stats(self) -> dict:
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "pending_ttl_seconds": self.pending_ttl_seconds,
+            "hits": self.hits,
+            "refreshes": self.refreshes,
+            "webhook_updates": self.webhook_updates,
+            "stale_events": self.stale_events
+        }
@@ -0,0 +1,28 @@
+"""
+Hydrate Module - attach related documents without an N+1 query loop
+Features:
+- One $in query per page, whatever the number of documents
+- The join key is fetched even when the projection is an inclusion list, then stripped again
+"""
+
+from typing import List
+
+
+async def hydrate(docs: List[dict], collection, local_field: str, as_field: str, projection: dict, foreign_field: str = "id") -> List[dict]:
+    """Attach the related document for each doc using a single $in query"""
+    ids = list({d[local_field] for d in docs if d.get(local_field)})
+    related = []
+    strip_key = False
+    if ids:
+        # The join key must come back even when the projection is an inclusion list
+        inclusion = any(v for k, v in projection.items() if k != "_id")
+        strip_key = inclusion and not projection.get(foreign_field)
+        fetch_projection = {**projection, foreign_field: 1} if strip_key else projection
+        related = await collection.find({foreign_field: {"$in": ids}}, fetch_projection).to_list(len(ids))
+    by_key = {}
+    for r in related:
+        key = r.pop(foreign_field) if strip_key else r[foreign_field]
+        by_key[key] = r
+    for d in docs:
+        d[as_field] = by_key.get(d.get(local_field))
+    return docs
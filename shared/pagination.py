@@ -0,0 +1,50 @@
+"""
+Pagination Module - keyset pages with opaque cursors
+Features:
+- Cursors are URL-safe tokens; a malformed one is a 400, not a 500
+- Pages are newest first on (created_at, id), so equal timestamps never repeat or skip a row
+- Routes return the token in the body as `next_cursor` (None on the last page)
+"""
+
+import base64
+import json
+from typing import Optional
+
+from fastapi import HTTPException
+
+
+def encode_cursor(data: dict) -> str:
+    """Encode pagination state as an opaque URL-safe token"""
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(",", ":")).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return data
+
+
+# Newest first, with id breaking ties between equal timestamps
+KEYSET_SORT = [("created_at", -1), ("id", -1)]
+
+
+async def fetch_page(collection, query: dict, limit: int, cursor: Optional[str] = None):
+    """Fetch one page in (created_at, id) descending order; returns (docs, next_cursor)"""
+    if cursor:
+        after = decode_cursor(cursor)
+        if "created_at" not in after or "id" not in after:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = {**query, "$or": [
+            {"created_at": {"$lt": after["created_at"]}},
+            {"created_at": after["created_at"], "id": {"$lt": after["id"]}}
+        ]}
+    docs = await collection.find(query, {"_id": 0}).sort(KEYSET_SORT).limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor({"created_at": docs[-1]["created_at"], "id": docs[-1]["id"]})
+    return docs, next_cursor
@@ -0,0 +1,95 @@
+"""
+Password Hasher Module - bcrypt off the event loop
+Features:
+- Hashing and verification run in a dedicated, size-limited thread pool
+- Login shedding: verification is refused once too many calls are queued
+- Queue-depth, wait-time and shed-count metrics
+"""
+
+import os
+import time
+import asyncio
+import logging
+import bcrypt
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', '32'))
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when a sheddable call arrives while the hashing queue is full"""
+
+
+class PasswordHasher:
+    """Runs bcrypt in its own executor so a login burst never blocks other requests"""
+
+    def __init__(self, max_workers: int = PASSWORD_HASH_WORKERS, max_queue: int = PASSWORD_HASH_MAX_QUEUE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self.pending = 0  # calls queued or running
+        self.peak_pending = 0
+        self.completed = 0
+        self.shed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+
+    async def _run(self, fn, *args, sheddable: bool):
+        if sheddable and self.pending >= self.max_queue:
+            self.shed += 1
+            raise PasswordHasherBusy()
+
+        submitted = time.monotonic()
+        timings = {}
+
+        def job():
+            timings["started"] = time.monotonic()
+            return fn(*args)
+
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, job)
+        finally:
+            self.pending -= 1
+            if "started" in timings:
+                wait = timings["started"] - submitted
+                self.completed += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                self.total_run += time.monotonic() - timings["started"]
+
+    async def hash(self, password: str) -> str:
+        """Hash a password; never shed so registrations and resets always complete"""
+        return await self._run(_hashpw, password, sheddable=False)
+
+    async def verify(self, password: str, hashed: str, sheddable: bool = True) -> bool:
+        """Check a password; raises PasswordHasherBusy when the queue is full"""
+        return await self._run(_checkpw, password, hashed, sheddable=sheddable)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "queue_depth": self.pending,
+            "peak_queue_depth": self.peak_pending,
+            "completed": self.completed,
+            "shed": self.shed,
+            "avg_wait_ms": round(self.total_wait / self.completed * 1000, 2) if self.completed else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "avg_run_ms": round(self.total_run / self.completed * 1000, 2) if self.completed else 0.0
+        }
+
+
+def _hashpw(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+def _checkpw(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,143 @@
+"""
+Payment Gateway Module - non-blocking Stripe client layer
+Features:
+- Async Stripe calls over one pooled HTTPX connection pool per worker
+- Per-call deadline covering connect, retries and response
+- Idempotency keys on every money-moving or account-creating call
+- Bounded concurrency so payment traffic cannot exhaust the event loop
+- STRIPE_API_BASE points the client at a local fake server for tests
+"""
+
+import os
+import time
+import asyncio
+import logging
+import uuid
+from typing import Optional
+
+import httpx
+import stripe
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentGateway:
+    """Async facade over the Stripe endpoints the app uses"""
+
+    def __init__(
+        self,
+        api_key: str,
+        api_base: Optional[str] = None,
+        timeout: Optional[float] = None,
+        deadline: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None
+    ):
+        self.api_key = api_key
+        self.api_base = api_base or os.environ.get('STRIPE_API_BASE') or None
+        self.timeout = timeout or float(os.environ.get('STRIPE_TIMEOUT_SECONDS', '10'))
+        self.deadline = deadline or float(os.environ.get('STRIPE_DEADLINE_SECONDS', '25'))
+        self.max_concurrency = max_concurrency or int(os.environ.get('STRIPE_MAX_CONCURRENCY', '16'))
+        self.max_retries = max_retries if max_retries is not None else int(os.environ.get('STRIPE_MAX_RETRIES', '2'))
+        self._client: Optional[stripe.StripeClient] = None
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    @property
+    def client(self) -> stripe.StripeClient:
+        if self._client is None:
+            base_addresses = {"api": self.api_base, "connect": self.api_base} if self.api_base else None
+            self._client = stripe.StripeClient(
+                self.api_key,
+                base_addresses=base_addresses,
+                max_network_retries=self.max_retries,
+                http_client=stripe.HTTPXClient(timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)))
+            )
+        return self._client
+
+    async def _call(self, operation: str, coro_factory):
+        """Run one Stripe request under the concurrency limit and deadline"""
+        async with self._semaphore:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            started = time.monotonic()
+            try:
+                return await asyncio.wait_for(coro_factory(), timeout=self.deadline)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                logger.warning(f"Stripe {operation} exceeded {self.deadline}s deadline")
+                raise stripe.APIConnectionError(f"Stripe {operation} timed out")
+            except stripe.StripeError:
+                self.errors += 1
+                raise
+            finally:
+                elapsed = time.monotonic() - started
+                self.in_flight -= 1
+                self.calls += 1
+                self.total_latency += elapsed
+                self.max_latency = max(self.max_latency, elapsed)
+
+    @staticmethod
+    def _options(idempotency_key: Optional[str]) -> dict:
+        return {"idempotency_key": idempotency_key or str(uuid.uuid4())}
+
+    # ============== CONNECT ==============
+
+    async def create_account(self, params: dict, idempotency_key: Optional[str] = None):
+        return await self._call(
+            "account.create",
+            lambda: self.client.v1.accounts.create_async(params, self._options(idempotency_key))
+        )
+
+    async def retrieve_account(self, account_id: str):
+        return await self._call("account.retrieve", lambda: self.client.v1.accounts.retrieve_async(account_id))
+
+    async def create_account_link(self, params: dict):
+        return await self._call(
+            "account_link.create",
+            lambda: self.client.v1.account_links.create_async(params, self._options(None))
+        )
+
+    async def create_login_link(self, account_id: str):
+        return await self._call(
+            "login_link.create",
+            lambda: self.client.v1.accounts.login_links.create_async(account_id, options=self._options(None))
+        )
+
+    # ============== CHECKOUT AND TRANSFERS ==============
+
+    async def create_checkout_session(self, params: dict, idempotency_key: Optional[str] = None):
+        return await self._call(
+            "checkout.session.create",
+            lambda: self.client.v1.checkout.sessions.create_async(params, self._options(idempotency_key))
+        )
+
+    async def retrieve_checkout_session(self, session_id: str):
+        return await self._call(
+            "checkout.session.retrieve",
+            lambda: self.client.v1.checkout.sessions.retrieve_async(session_id)
+        )
+
+    async def create_transfer(self, params: dict, idempotency_key: Optional[str] = None):
+        return await self._call(
+            "transfer.create",
+            lambda: self.client.v1.transfers.create_async(params, self._options(idempotency_key))
+        )
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "avg_latency_ms": round(self.total_latency / self.calls * 1000, 2) if self.calls else 0.0,
+            "max_latency_ms": round(self.max_latency * 1000, 2)
+        }
@@ -0,0 +1,116 @@
+"""
+User Cache Module - in-process cache for token-to-user resolution
+Features:
+- Bounded LRU eviction keyed by user id
+- Per-entry TTL so other workers' writes become visible within seconds
+- Explicit invalidation after profile, status, plan, role or password changes; a load that
+  was in flight when its user was invalidated is returned but not cached
+- Hit-rate metrics
+"""
+
+import os
+import time
+import copy
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_MAX_SIZE = int(os.environ.get('USER_CACHE_MAX_SIZE', '10000'))
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '30'))
+
+
+class UserCache:
+    """LRU + TTL cache of user documents (without password) keyed by user id"""
+
+    def __init__(self, max_size: int = USER_CACHE_MAX_SIZE, ttl_seconds: float = USER_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # user_id -> (expires_at, user)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_loads = 0
+        self._generation = 0  # bumped by every invalidate() and clear()
+        self._cleared_at = 0
+        self._loading: Dict[str, int] = {}  # user_id -> loads in flight
+        self._invalidated_at: Dict[str, int] = {}  # user_id -> generation, only while loading
+
+    def get(self, user_id: str) -> Optional[dict]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, user = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        # Handlers may mutate the user dict, so never hand out the cached instance
+        return copy.deepcopy(user)
+
+    def set(self, user_id: str, user: dict):
+        self._entries[user_id] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(user))
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: str):
+        """Drop a user after any write to their document"""
+        self._generation += 1
+        if user_id in self._loading:
+            self._invalidated_at[user_id] = self._generation
+        if self._entries.pop(user_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self._generation += 1
+        self._cleared_at = self._generation
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    async def get_or_load(self, user_id: str, loader: Callable[[str], Awaitable[Optional[dict]]]) -> Optional[dict]:
+        """Return the cached user or load it with `loader` and cache the result"""
+        user = self.get(user_id)
+        if user is not None:
+            return user
+        started = self._generation
+        self._loading[user_id] = self._loading.get(user_id, 0) + 1
+        try:
+            user = await loader(user_id)
+        finally:
+            stale = max(self._invalidated_at.get(user_id, 0), self._cleared_at) > started
+            self._loading[user_id] -= 1
+            if not self._loading[user_id]:
+                del self._loading[user_id]
+                self._invalidated_at.pop(user_id, None)
+        if not user:
+            return user
+        if stale:
+            # Read before a write that invalidated it: caching it would hide that write for a TTL
+            self.stale_loads += 1
+        else:
+            self.set(user_id, user)
+        return user
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "stale_loads": self.stale_loads
+        }
+
+
+user_cache = UserCache()
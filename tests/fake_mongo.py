@@ -0,0 +1,339 @@
+"""
+In-memory stand-in for the Motor calls the backend money, rating and pagination paths make.
+Supports the query operators, update operators and the $match/$group/$sort/$limit
+aggregation stages those paths use ($group with $sum and $push); sessions are accepted and ignored.
+"""
+import copy
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+
+def get_field(doc: dict, path: str):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def has_field(doc: dict, path: str) -> bool:
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return False
+        value = value[part]
+    return True
+
+
+def compare(value, op: str, operand) -> bool:
+    if op == "$in":
+        return value in operand
+    if op == "$nin":
+        return value not in operand
+    if op == "$ne":
+        return value != operand
+    if op == "$exists":
+        return True  # handled by the caller
+    if value is None:
+        return False
+    return {
+        "$gt": lambda: value > operand,
+        "$gte": lambda: value >= operand,
+        "$lt": lambda: value < operand,
+        "$lte": lambda: value <= operand,
+    }[op]()
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(doc, q) for q in condition):
+                return False
+            continue
+        if field == "$and":
+            if not all(matches(doc, q) for q in condition):
+                return False
+            continue
+        value = get_field(doc, field)
+        if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+            for op, operand in condition.items():
+                if op == "$exists":
+                    if has_field(doc, field) != operand:
+                        return False
+                elif not compare(value, op, operand):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def set_field(doc: dict, path: str, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def unset_field(doc: dict, path: str):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part, {})
+    doc.pop(parts[-1], None)
+
+
+def apply_update(doc: dict, update: dict, inserting: bool):
+    for op, fields in update.items():
+        for path, value in fields.items():
+            if op == "$set":
+                set_field(doc, path, copy.deepcopy(value))
+            elif op == "$setOnInsert":
+                if inserting:
+                    set_field(doc, path, copy.deepcopy(value))
+            elif op == "$inc":
+                set_field(doc, path, (get_field(doc, path) or 0) + value)
+            elif op == "$max":
+                current = get_field(doc, path)
+                if current is None or value > current:
+                    set_field(doc, path, value)
+            elif op == "$unset":
+                unset_field(doc, path)
+            else:
+                raise NotImplementedError(op)
+
+
+def project(doc: dict, projection: Optional[dict]) -> dict:
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    included = [f for f, v in projection.items() if v and f != "_id"]
+    if included:
+        result = {f: doc[f] for f in included if f in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+    return {f: v for f, v in doc.items() if projection.get(f, 1)}
+
+
+def sort_docs(docs: List[dict], keys) -> List[dict]:
+    if isinstance(keys, str):
+        keys = [(keys, 1)]
+    for field, direction in reversed(list(keys)):
+        docs.sort(key=lambda d: (get_field(d, field) is not None, get_field(d, field)), reverse=direction == -1)
+    return docs
+
+
+def evaluate(expr, doc: dict):
+    if isinstance(expr, str) and expr.startswith("$"):
+        return get_field(doc, expr[1:])
+    if isinstance(expr, dict):
+        if len(expr) == 1 and next(iter(expr)).startswith("$"):
+            (op, args), = expr.items()
+            if op in ("$substrBytes", "$substrCP"):
+                value, start, length = (evaluate(a, doc) for a in args)
+                return (value or "")[start:start + length]
+            if op == "$multiply":
+                result = 1
+                for a in args:
+                    result *= evaluate(a, doc)
+                return result
+            if op == "$toString":
+                return str(evaluate(args, doc))
+            raise NotImplementedError(op)
+        return {k: evaluate(v, doc) for k, v in expr.items()}
+    return expr
+
+
+class UpdateResult:
+    def __init__(self, matched: int, modified: int, upserted_id=None):
+        self.matched_count = matched
+        self.modified_count = modified
+        self.upserted_id = upserted_id
+
+
+class FakeCursor:
+    def __init__(self, docs: List[dict], projection: Optional[dict]):
+        self.docs = docs
+        self.projection = projection
+
+    def sort(self, keys, direction: Optional[int] = None):
+        if direction is not None:
+            keys = [(keys, direction)]
+        sort_docs(self.docs, keys)
+        return self
+
+    def limit(self, n: int):
+        self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, n: Optional[int]):
+        docs = self.docs[:n] if n else self.docs
+        return [project(d, self.projection) for d in docs]
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for doc in list(self.docs):
+            yield project(doc, self.projection)
+
+
+class FakeCollection:
+    def __init__(self, unique: Tuple[Tuple[str, ...], ...] = ()):
+        self.docs: List[dict] = []
+        self.unique = unique
+        self._next_id = 0
+
+    def _check_unique(self, candidate: dict, ignore: Optional[dict] = None):
+        for keys in self.unique:
+            if not all(has_field(candidate, k) for k in keys):
+                continue
+            for doc in self.docs:
+                if doc is not ignore and all(get_field(doc, k) == get_field(candidate, k) for k in keys):
+                    raise DuplicateKeyError(f"duplicate key {keys}")
+
+    def _insert(self, doc: dict) -> dict:
+        if "_id" not in doc:
+            self._next_id += 1
+            doc["_id"] = self._next_id
+        self._check_unique(doc)
+        self.docs.append(copy.deepcopy(doc))
+        return doc
+
+    async def insert_one(self, doc: dict, session=None):
+        self._insert(doc)
+
+    async def insert_many(self, docs: List[dict], session=None, ordered: bool = True):
+        for doc in docs:
+            self._insert(doc)
+
+    def find(self, query: Optional[dict] = None, projection: Optional[dict] = None, session=None):
+        return FakeCursor([d for d in self.docs if matches(d, query or {})], projection)
+
+    async def find_one(self, query: Optional[dict] = None, projection: Optional[dict] = None, session=None):
+        for doc in self.docs:
+            if matches(doc, query or {}):
+                return project(doc, projection)
+        return None
+
+    def _upsert_doc(self, query: dict) -> dict:
+        return {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False, session=None):
+        for doc in self.docs:
+            if matches(doc, query):
+                updated = copy.deepcopy(doc)
+                apply_update(updated, update, inserting=False)
+                self._check_unique(updated, ignore=doc)
+                changed = updated != doc
+                doc.clear()
+                doc.update(updated)
+                return UpdateResult(1, 1 if changed else 0)
+        if upsert:
+            doc = self._upsert_doc(query)
+            apply_update(doc, update, inserting=True)
+            self._insert(doc)
+            return UpdateResult(0, 0, doc["_id"])
+        return UpdateResult(0, 0)
+
+    async def update_many(self, query: dict, update: dict, session=None):
+        modified = 0
+        for doc in self.docs:
+            if matches(doc, query):
+                before = copy.deepcopy(doc)
+                apply_update(doc, update, inserting=False)
+                modified += doc != before
+        return UpdateResult(modified, modified)
+
+    async def find_one_and_update(
+        self, query: dict, update: dict, projection: Optional[dict] = None, sort=None,
+        upsert: bool = False, return_document=ReturnDocument.BEFORE, session=None
+    ):
+        candidates = [d for d in self.docs if matches(d, query)]
+        if sort:
+            sort_docs(candidates, sort)
+        if candidates:
+            doc = candidates[0]
+            before = project(doc, projection)
+            await self.update_one({"_id": doc["_id"]}, update)
+            return project(doc, projection) if return_document == ReturnDocument.AFTER else before
+        if not upsert:
+            return None
+        doc = self._upsert_doc(query)
+        apply_update(doc, update, inserting=True)
+        self._insert(doc)
+        return project(doc, projection) if return_document == ReturnDocument.AFTER else None
+
+    async def count_documents(self, query: dict, session=None) -> int:
+        return sum(1 for d in self.docs if matches(d, query))
+
+    async def distinct(self, field: str, query: Optional[dict] = None, session=None) -> list:
+        values = []
+        for doc in self.docs:
+            value = get_field(doc, field)
+            if matches(doc, query or {}) and value is not None and value not in values:
+                values.append(value)
+        return values
+
+    async def bulk_write(self, requests, ordered: bool = True, session=None):
+        for request in requests:
+            doc = request._doc
+            await self.update_one(request._filter, doc, upsert=bool(request._upsert))
+
+    def aggregate(self, pipeline: List[dict], session=None):
+        docs = [copy.deepcopy(d) for d in self.docs]
+        for stage in pipeline:
+            (name, spec), = stage.items()
+            if name == "$match":
+                docs = [d for d in docs if matches(d, spec)]
+            elif name == "$sort":
+                docs = sort_docs(docs, list(spec.items()))
+            elif name == "$limit":
+                docs = docs[:spec]
+            elif name == "$group":
+                groups: Dict = {}
+                for d in docs:
+                    key = evaluate(spec["_id"], d)
+                    group = groups.setdefault(repr(key), {"_id": key})
+                    for out, acc in spec.items():
+                        if out == "_id":
+                            continue
+                        (op, expr), = acc.items()
+                        if op == "$sum":
+                            group[out] = group.get(out, 0) + (evaluate(expr, d) or 0)
+                        elif op == "$push":
+                            group.setdefault(out, []).append(evaluate(expr, d))
+                        else:
+                            raise NotImplementedError(op)
+                docs = list(groups.values())
+            else:
+                raise NotImplementedError(name)
+        return FakeCursor(docs, None)
+
+
+class FakeDatabase:
+    """Collections are created on first access; `unique` declares unique keys per collection"""
+
+    def __init__(self, unique: Optional[Dict[str, Tuple[Tuple[str, ...], ...]]] = None):
+        self._unique = unique or {}
+        self._collections: Dict[str, FakeCollection] = {}
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(self._unique.get(name, ()))
+        return self._collections[name]
+
+
+class NoTransactionClient:
+    """A client on a standalone server: starting a transaction fails like MongoDB does"""
+
+    async def start_session(self):
+        from pymongo.errors import OperationFailure
+        raise OperationFailure("Transaction numbers are only allowed on a replica set member or mongos", code=20)
@@ -0,0 +1,145 @@
+"""
+Test suite for the auto payout scheduler (backend/auto_payouts.py)
+Runs against the in-memory Mongo stand-in
+Tests: run time spreading, due-wallet claims and leases, completion, backoff, stuck runs
+"""
+import pytest
+import asyncio
+import sys
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+pytest.importorskip("pymongo")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from auto_payouts import AUTO_PAYOUT_MAX_BACKOFF_SECONDS, AutoPayoutScheduler, next_run_time
+
+from tests.fake_mongo import FakeDatabase
+
+NOW = datetime(2026, 3, 4, 15, 30, tzinfo=timezone.utc)  # a Wednesday
+
+
+def scheduler_for(db, run_payout, **kwargs) -> AutoPayoutScheduler:
+    return AutoPayoutScheduler(db, run_payout, rate_per_second=0, **kwargs)
+
+
+async def add_wallet(db, barber_id: str, due: datetime, **fields):
+    await db.wallets.insert_one({
+        "barber_id": barber_id,
+        "auto_payout": {"enabled": True, "frequency": "weekly", "minimum_amount": 50},
+        "auto_payout_next_run_at": due.isoformat(),
+        **fields
+    })
+
+
+class TestNextRunTime:
+    """Runs fall at the start of the next period plus a stable per-barber offset"""
+
+    def test_daily_is_within_a_day_and_stable(self):
+        first = next_run_time("daily", "b1", NOW)
+        assert NOW < first <= NOW + timedelta(days=1)
+        assert next_run_time("daily", "b1", NOW) == first
+        assert next_run_time("daily", "b1", first) == first + timedelta(days=1)
+
+    def test_weekly_falls_on_monday(self):
+        first = next_run_time("weekly", "b1", NOW)
+        second = next_run_time("weekly", "b1", first)
+        assert NOW < first <= NOW + timedelta(days=7)
+        assert first.weekday() == 0  # the offset is under a day, so runs stay on Monday
+        assert second - first == timedelta(days=7)
+
+    def test_monthly_falls_in_the_first_day_of_a_month(self):
+        first = next_run_time("monthly", "b1", NOW)
+        assert first.month == 4 and first.day == 1
+        assert next_run_time("monthly", "b1", first).month == 5
+
+    def test_barbers_are_spread_across_the_day(self):
+        offsets = {next_run_time("daily", f"barber-{i}", NOW).time() for i in range(20)}
+        assert len(offsets) > 15
+
+
+class TestScheduler:
+    """Due wallets are claimed once, paid with a pinned run key, and rescheduled"""
+
+    def test_due_wallet_is_paid_and_rescheduled(self):
+        async def run():
+            db = FakeDatabase()
+            calls = []
+
+            async def run_payout(wallet, run_key):
+                calls.append((wallet["barber_id"], run_key))
+                return "paid"
+
+            await add_wallet(db, "b1", NOW - timedelta(minutes=5))
+            await add_wallet(db, "b2", datetime.now(timezone.utc) + timedelta(days=1))
+            scheduler = scheduler_for(db, run_payout)
+            processed = await scheduler.run_once()
+            wallet = await db.wallets.find_one({"barber_id": "b1"})
+            return processed, calls, wallet, scheduler.stats()
+
+        processed, calls, wallet, stats = asyncio.run(run())
+        assert processed == 1
+        assert calls == [("b1", f"auto-{(NOW - timedelta(minutes=5)).isoformat()}")]
+        assert "auto_payout_run_key" not in wallet
+        assert "auto_payout_lease_until" not in wallet
+        assert wallet["auto_payout_next_run_at"] > datetime.now(timezone.utc).isoformat()
+        assert stats["outcomes"] == {"paid": 1}
+
+    def test_leased_wallet_is_not_claimed_twice(self):
+        async def run():
+            db = FakeDatabase()
+            await add_wallet(db, "b1", NOW)
+            scheduler = scheduler_for(db, None)
+            now = datetime.now(timezone.utc)
+            return await scheduler.claim(now), await scheduler.claim(now)
+
+        first, second = asyncio.run(run())
+        assert first["barber_id"] == "b1"
+        assert second is None
+
+    def test_failure_backs_off_and_keeps_the_run_key(self):
+        async def run():
+            db = FakeDatabase()
+            keys = []
+
+            async def run_payout(wallet, run_key):
+                keys.append(run_key)
+                raise RuntimeError("stripe timeout")
+
+            await add_wallet(db, "b1", NOW)
+            scheduler = scheduler_for(db, run_payout)
+            await scheduler.run_once()
+            wallet = await db.wallets.find_one({"barber_id": "b1"})
+            # Make it due again: the retry must reuse the pinned key
+            await db.wallets.update_one({"barber_id": "b1"}, {"$set": {"auto_payout_next_run_at": NOW.isoformat()}})
+            await scheduler.run_once()
+            return keys, wallet, scheduler.stats()
+
+        keys, wallet, stats = asyncio.run(run())
+        assert keys[0] == keys[1]
+        assert wallet["auto_payout_attempts"] == 1
+        assert wallet["auto_payout_run_key"] == keys[0]
+        assert "auto_payout_lease_until" not in wallet
+        assert wallet["auto_payout_next_run_at"] > datetime.now(timezone.utc).isoformat()
+        assert stats["retries"] == 2
+
+    def test_run_that_keeps_failing_is_flagged_not_skipped(self):
+        async def run():
+            db = FakeDatabase()
+
+            async def run_payout(wallet, run_key):
+                raise RuntimeError("still down")
+
+            await add_wallet(db, "b1", NOW, auto_payout_attempts=4, auto_payout_run_key="auto-pinned")
+            scheduler = scheduler_for(db, run_payout, max_attempts=5)
+            before = datetime.now(timezone.utc)
+            await scheduler.run_once()
+            return before, await db.wallets.find_one({"barber_id": "b1"}), scheduler.stats()
+
+        before, wallet, stats = asyncio.run(run())
+        assert stats["stuck"] == 1
+        assert wallet["auto_payout_run_key"] == "auto-pinned"
+        assert "auto_payout_stuck_since" in wallet
+        next_run = datetime.fromisoformat(wallet["auto_payout_next_run_at"])
+        assert next_run >= before + timedelta(seconds=AUTO_PAYOUT_MAX_BACKOFF_SECONDS)
@@ -0,0 +1,158 @@
+"""
+Test suite for the Agente Comunidade runtime (projects/stuff-intercambio/backend/chat_agent.py)
+Uses the local stub LLM, no network
+Tests: question normalization, backend selection, response cache, single-flight misses, streamed chunks, bounded worker pool
+"""
+import asyncio
+import importlib
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "projects" / "stuff-intercambio" / "backend"))
+
+import chat_agent
+from chat_agent import AgentPool, ResponseCache, StubLLM, batched, normalize_question
+
+
+class TestNormalization:
+    """Rephrasings of the same FAQ share a cache key"""
+
+    def test_accents_case_punctuation_and_stopwords(self):
+        assert normalize_question("Como tirar o PPS?") == normalize_question("como TIRAR pps")
+        assert normalize_question("Onde fica o GNIB, alguém sabe?") == normalize_question("onde fica gnib")
+
+    def test_different_questions_differ(self):
+        assert normalize_question("como tirar o PPS") != normalize_question("como tirar o GNIB")
+
+    def test_word_order_kept(self):
+        assert normalize_question("ônibus de Dublin para Cork") != normalize_question("ônibus de Cork para Dublin")
+
+
+class TestResponseCache:
+    """Answers are reused until they expire"""
+
+    def test_hit_after_set(self):
+        cache = ResponseCache()
+        cache.set("pps tirar", "resposta")
+        assert cache.get("pps tirar") == "resposta"
+        assert cache.stats()["hits"] == 1
+
+    def test_expired_entry_misses(self):
+        cache = ResponseCache(ttl_seconds=-1)
+        cache.set("pps tirar", "resposta")
+        assert cache.get("pps tirar") is None
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(max_size=1)
+        cache.set("a", "1")
+        cache.set("b", "2")
+        assert cache.get("a") is None
+        assert cache.get("b") == "2"
+
+    def test_concurrent_misses_share_one_call(self):
+        async def run():
+            cache = ResponseCache()
+            llm = StubLLM(delay_seconds=0.001)
+
+            async def answer(question):
+                key = normalize_question(question)
+                if cache.get(key) is None:
+                    in_flight = cache.join(key)
+                    if in_flight is not None:
+                        return await in_flight
+                    text = "".join([chunk async for chunk in llm.stream(question)])
+                    cache.finish(key, text)
+                    return text
+                return cache.get(key)
+
+            answers = await asyncio.gather(*(answer("Como tirar o PPS?") for _ in range(5)))
+            return answers, llm.calls, cache.stats()
+
+        answers, calls, stats = asyncio.run(run())
+        assert calls == 1
+        assert len(set(answers)) == 1
+        assert stats["coalesced"] == 4
+
+    def test_failed_call_releases_waiters(self):
+        async def run():
+            cache = ResponseCache()
+            assert cache.join("pps") is None
+            waiter = cache.join("pps")
+            cache.finish("pps", None)
+            return await waiter, cache.join("pps")
+
+        result, retry = asyncio.run(run())
+        assert result is None
+        assert retry is None  # the next caller computes the answer itself
+
+
+class TestStreaming:
+    """The stub streams word by word; batching merges chunks"""
+
+    def test_stub_streams_faq_answer(self):
+        async def run():
+            llm = StubLLM()
+            return [chunk async for chunk in llm.stream("Como tirar o Leap Card?")]
+
+        chunks = asyncio.run(run())
+        assert len(chunks) > 1
+        assert "Leap Card" in "".join(chunks)
+
+    def test_batched_merges_fast_chunks(self):
+        async def run():
+            llm = StubLLM()
+            return [chunk async for chunk in batched(llm.stream("pps"), flush_seconds=60)]
+
+        chunks = asyncio.run(run())
+        assert len(chunks) == 1
+        assert chunks[0].startswith("Para tirar o PPS")
+
+
+class TestAgentPool:
+    """A flood of mentions is bounded by workers and queue size"""
+
+    def test_queue_full_rejects(self):
+        async def run():
+            running = []
+            release = asyncio.Event()
+
+            async def handler(question, user_name):
+                running.append(question)
+                await release.wait()
+
+            pool = AgentPool(handler, workers=2, queue_size=3)
+            pool.start()
+            await asyncio.sleep(0)
+            accepted = [pool.submit(f"q{i}", "Ana") for i in range(10)]
+            await asyncio.sleep(0.01)
+            peak = len(running)
+            release.set()
+            await pool.queue.join()
+            workers = list(pool._tasks)
+            await pool.stop()
+            return accepted, peak, pool.stats(), workers
+
+        accepted, peak, stats, workers = asyncio.run(run())
+        assert all(w.done() for w in workers)
+        assert peak == 2
+        # Two questions are taken by the workers only after the submits, so the queue holds 3
+        assert accepted.count(True) == 3
+        assert stats["rejected"] == 7
+        assert stats["completed"] == 3
+
+
+class TestBackendSelection:
+    """The streaming backend is the default whenever it can run"""
+
+    def test_openai_key_selects_streaming_backend(self, monkeypatch):
+        monkeypatch.delenv("AGENTE_LLM", raising=False)
+        monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+        try:
+            assert importlib.reload(chat_agent).AGENTE_LLM == "openai"
+            monkeypatch.delenv("OPENAI_API_KEY")
+            assert importlib.reload(chat_agent).AGENTE_LLM == "emergent"
+            monkeypatch.setenv("AGENTE_LLM", "stub")
+            assert importlib.reload(chat_agent).AGENTE_LLM == "stub"
+        finally:
+            monkeypatch.undo()
+            importlib.reload(chat_agent)
@@ -0,0 +1,120 @@
+"""
+Test suite for the chat backplane (projects/stuff-intercambio/backend/chat_backplane.py)
+Two in-memory backplanes on one bus stand in for two workers
+Tests: relay between workers, no echo to the publisher, tailable resume point, lost resume token
+"""
+import pytest
+import asyncio
+import sys
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+pytest.importorskip("pymongo")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "projects" / "stuff-intercambio" / "backend"))
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+from chat_backplane import CHAT_BACKPLANE_RESUME_SKEW_SECONDS, InMemoryBackplane, InMemoryBus, MongoBackplane
+
+
+class TestInMemoryBackplane:
+    """Events published by one worker reach the others only"""
+
+    def test_event_reaches_other_worker(self):
+        async def run():
+            bus = InMemoryBus()
+            received = {"a": [], "b": []}
+            a, b = InMemoryBackplane(bus, "a"), InMemoryBackplane(bus, "b")
+
+            async def handler_a(event):
+                received["a"].append(event)
+
+            async def handler_b(event):
+                received["b"].append(event)
+
+            await a.start(handler_a)
+            await b.start(handler_b)
+            await a.publish({"kind": "broadcast", "message": {"type": "message"}})
+            return received, a.stats(), b.stats()
+
+        received, stats_a, stats_b = asyncio.run(run())
+        assert received["a"] == []
+        assert received["b"] == [{"kind": "broadcast", "message": {"type": "message"}, "origin": "a"}]
+        assert stats_a["published"] == 1
+        assert stats_b["received"] == 1
+
+    def test_stopped_worker_receives_nothing(self):
+        async def run():
+            bus = InMemoryBus()
+            received = []
+            a, b = InMemoryBackplane(bus, "a"), InMemoryBackplane(bus, "b")
+
+            async def handler(event):
+                received.append(event)
+
+            await a.start(handler)
+            await b.start(handler)
+            await b.stop()
+            await a.publish({"kind": "presence", "op": "snapshot", "users": []})
+            return received
+
+        assert asyncio.run(run()) == []
+
+
+class TestTailableResume:
+    """A re-opened tailable cursor starts near the last event, not at the oldest one"""
+
+    def test_resume_point_is_last_event_minus_skew(self):
+        backplane = MongoBackplane(db=None)
+        last = ObjectId.from_datetime(datetime(2024, 5, 1, 12, 0, 0, tzinfo=timezone.utc))
+        resume = backplane._resume_point(last)
+        assert resume.generation_time == last.generation_time - timedelta(seconds=CHAT_BACKPLANE_RESUME_SKEW_SECONDS)
+
+    def test_resume_point_never_moves_back_before_startup(self):
+        backplane = MongoBackplane(db=None)
+        newest_at_start = ObjectId.from_datetime(datetime(2024, 5, 1, 12, 0, 0, tzinfo=timezone.utc))
+        backplane.resume_after = newest_at_start
+        assert backplane._resume_point(ObjectId.from_datetime(datetime(2024, 5, 1, 12, 0, 1, tzinfo=timezone.utc))) == newest_at_start
+
+    def test_events_in_the_skew_window_are_delivered_once(self):
+        async def run():
+            backplane = MongoBackplane(db=None, worker_id="a")
+            received = []
+
+            async def handler(event):
+                received.append(event)
+
+            backplane.handler = handler
+            doc = {"_id": ObjectId(), "origin": "b", "event": {"kind": "broadcast", "message": {}}}
+            await backplane._receive(doc)
+            await backplane._receive(doc)  # re-read after the cursor re-opened
+            return received
+
+        assert len(asyncio.run(run())) == 1
+
+
+class TestChangeStreamResume:
+    """A resume token that rolled off the oplog is dropped instead of retried forever"""
+
+    def test_history_lost_reopens_without_token(self):
+        async def run():
+            backplane = MongoBackplane(db=None)
+            backplane.resume_token = {"_data": "expired"}
+            tokens = []
+
+            async def follow_change_stream():
+                tokens.append(backplane.resume_token)
+                if backplane.resume_token:
+                    raise OperationFailure("history lost", code=286)
+                raise asyncio.CancelledError
+
+            backplane._follow_change_stream = follow_change_stream
+            with pytest.raises(asyncio.CancelledError):
+                await backplane._follow()
+            return tokens, backplane.stats()
+
+        tokens, stats = asyncio.run(run())
+        assert tokens == [{"_data": "expired"}, None]
+        assert stats["history_lost"] == 1
@@ -0,0 +1,45 @@
+"""
+Test suite for the chat ban cache (projects/stuff-intercambio/backend/chat_bans.py)
+Tests: active bans, expiry, unban, longest ban wins
+"""
+import sys
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "projects" / "stuff-intercambio" / "backend"))
+
+from chat_bans import ChatBanCache
+
+
+def ban(user_id: str, hours: float) -> dict:
+    expires_at = (datetime.now(timezone.utc) + timedelta(hours=hours)).isoformat()
+    return {"user_id": user_id, "reason": "spam", "expires_at": expires_at}
+
+
+class TestChatBanCache:
+    """Ban checks answered from memory"""
+
+    def test_active_ban_is_found(self):
+        cache = ChatBanCache()
+        cache.add(ban("u1", 1))
+        assert cache.get("u1")["reason"] == "spam"
+        assert cache.get("u2") is None
+
+    def test_expired_ban_is_dropped(self):
+        cache = ChatBanCache()
+        cache.add(ban("u1", -1))
+        assert cache.get("u1") is None
+        assert cache.stats()["active_bans"] == 0
+
+    def test_unban_removes_entry(self):
+        cache = ChatBanCache()
+        cache.add(ban("u1", 1))
+        cache.remove("u1")
+        assert cache.get("u1") is None
+
+    def test_longest_ban_wins(self):
+        cache = ChatBanCache()
+        long_ban = ban("u1", 48)
+        cache.add(long_ban)
+        cache.add(ban("u1", 1))
+        assert cache.get("u1")["expires_at"] == long_ban["expires_at"]
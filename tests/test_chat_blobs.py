@@ -0,0 +1,127 @@
+"""
+Test suite for the chat audio blob store (projects/stuff-intercambio/backend/chat_blobs.py)
+Uses the filesystem backend in a temporary directory
+Tests: content addressing, size limit, range reads, legacy data URLs,
+content type allowlist, garbage collection listing
+"""
+import pytest
+import asyncio
+import base64
+import os
+import sys
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+pytest.importorskip("pymongo")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "projects" / "stuff-intercambio" / "backend"))
+
+from chat_blobs import BlobTooLarge, FilesystemBlobStore, audio_content_type, blob_id_for, decode_data_url
+
+
+async def collect(chunks):
+    return b"".join([chunk async for chunk in chunks])
+
+
+class TestFilesystemBlobStore:
+    """Clips are stored once and read back by range"""
+
+    def test_same_bytes_stored_once(self, tmp_path):
+        async def run():
+            store = FilesystemBlobStore(root=str(tmp_path))
+            first = await store.put(b"voice", "audio/webm")
+            second = await store.put(b"voice", "audio/webm")
+            return first, second, store.stats(), await store.stat(first["blob_id"])
+
+        first, second, stats, stat = asyncio.run(run())
+        assert first["blob_id"] == second["blob_id"] == blob_id_for(b"voice")
+        assert stats["deduplicated"] == 1
+        assert stat == {"blob_id": first["blob_id"], "size": 5, "content_type": "audio/webm"}
+
+    def test_range_read(self, tmp_path):
+        async def run():
+            store = FilesystemBlobStore(root=str(tmp_path))
+            blob = await store.put(bytes(range(200)), "audio/webm")
+            return await collect(store.read_range(blob["blob_id"], 10, 19))
+
+        assert asyncio.run(run()) == bytes(range(10, 20))
+
+    def test_oversized_clip_rejected(self, tmp_path):
+        store = FilesystemBlobStore(root=str(tmp_path), max_bytes=4)
+        with pytest.raises(BlobTooLarge):
+            asyncio.run(store.put(b"too long", "audio/webm"))
+
+
+    def test_non_audio_type_stored_as_octet_stream(self, tmp_path):
+        async def run():
+            store = FilesystemBlobStore(root=str(tmp_path))
+            blob = await store.put(b"<script>alert(1)</script>", "text/html")
+            return blob, await store.stat(blob["blob_id"])
+
+        blob, stat = asyncio.run(run())
+        assert blob["content_type"] == stat["content_type"] == "application/octet-stream"
+
+    def test_older_than_and_delete(self, tmp_path):
+        async def run():
+            store = FilesystemBlobStore(root=str(tmp_path))
+            old = await store.put(b"old clip", "audio/webm")
+            new = await store.put(b"new clip", "audio/webm")
+            past = (datetime.now(timezone.utc) - timedelta(hours=2)).timestamp()
+            os.utime(store._path(old["blob_id"]), (past, past))
+            stale = await store.older_than(datetime.now(timezone.utc) - timedelta(hours=1), 10)
+            await store.delete(old["blob_id"])
+            return old, new, stale, await store.stat(old["blob_id"]), await store.stat(new["blob_id"])
+
+        old, new, stale, old_stat, new_stat = asyncio.run(run())
+        assert stale == [old["blob_id"]]
+        assert old_stat is None
+        assert new_stat is not None
+
+    def test_older_than_pages_in_id_order(self, tmp_path):
+        async def run():
+            store = FilesystemBlobStore(root=str(tmp_path))
+            past = (datetime.now(timezone.utc) - timedelta(hours=2)).timestamp()
+            for i in range(5):
+                blob = await store.put(f"clip {i}".encode(), "audio/webm")
+                os.utime(store._path(blob["blob_id"]), (past, past))
+            cutoff = datetime.now(timezone.utc) - timedelta(hours=1)
+            first = await store.older_than(cutoff, 2)
+            second = await store.older_than(cutoff, 2, after=first[-1])
+            third = await store.older_than(cutoff, 2, after=second[-1])
+            return first, second, third, await store.older_than(cutoff, 10)
+
+        first, second, third, everything = asyncio.run(run())
+        assert first + second + third == sorted(everything)
+        assert len(third) == 1
+
+    def test_resent_clip_refreshes_age(self, tmp_path):
+        async def run():
+            store = FilesystemBlobStore(root=str(tmp_path))
+            blob = await store.put(b"clip", "audio/webm")
+            past = (datetime.now(timezone.utc) - timedelta(hours=2)).timestamp()
+            os.utime(store._path(blob["blob_id"]), (past, past))
+            await store.put(b"clip", "audio/webm")
+            return await store.older_than(datetime.now(timezone.utc) - timedelta(hours=1), 10)
+
+        assert asyncio.run(run()) == []
+
+
+class TestContentTypes:
+    """Only audio types are stored and served"""
+
+    def test_audio_types_normalized(self):
+        assert audio_content_type("audio/webm;codecs=opus") == "audio/webm"
+        assert audio_content_type("Audio/MP4") == "audio/mp4"
+
+    def test_other_types_rejected(self):
+        assert audio_content_type("text/html") is None
+        assert audio_content_type("image/svg+xml") is None
+        assert audio_content_type(None) is None
+
+
+class TestDataUrls:
+    """Legacy clients send base64 data URLs inline"""
+
+    def test_decode_data_url(self):
+        encoded = "data:audio/webm;codecs=opus;base64," + base64.b64encode(b"clip").decode()
+        assert decode_data_url(encoded) == (b"clip", "audio/webm")
@@ -0,0 +1,135 @@
+"""
+Test suite for the chat broadcast engine (projects/stuff-intercambio/backend/chat_broadcast.py)
+Uses in-memory sockets, no server needed
+Tests: serialize-once fan-out, slow consumer isolation, drop/disconnect policies
+"""
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "projects" / "stuff-intercambio" / "backend"))
+
+import chat_broadcast
+from chat_broadcast import Broadcaster, SLOW_CONSUMER_CLOSE_CODE
+
+
+class FakeSocket:
+    """Records frames; `delay` simulates a slow mobile client"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.frames = []
+        self.closed_with = None
+
+    async def send_text(self, frame: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.frames.append(json.loads(frame))
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        self.closed_with = code
+
+
+async def drain():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class TestFanout:
+    """Frames reach every socket, serialized once"""
+
+    def test_broadcast_serializes_once(self, monkeypatch):
+        calls = []
+        original = chat_broadcast.encode_frame
+        monkeypatch.setattr(chat_broadcast, "encode_frame", lambda m: calls.append(m) or original(m))
+
+        async def run():
+            broadcaster = Broadcaster()
+            sockets = [FakeSocket() for _ in range(50)]
+            for i, socket in enumerate(sockets):
+                broadcaster.add(socket, f"u{i}")
+            delivered = broadcaster.broadcast({"type": "message", "content": "olá"})
+            await drain()
+            return delivered, sockets, broadcaster.stats()
+
+        delivered, sockets, stats = asyncio.run(run())
+        assert delivered == 50
+        assert len(calls) == 1
+        assert all(s.frames == [{"type": "message", "content": "olá"}] for s in sockets)
+        assert stats["frames_sent"] == 50
+
+    def test_slow_client_does_not_delay_others(self):
+        async def run():
+            broadcaster = Broadcaster()
+            slow, fast = FakeSocket(delay=1.0), FakeSocket()
+            broadcaster.add(slow, "slow")
+            broadcaster.add(fast, "fast")
+            broadcaster.broadcast({"type": "message", "n": 1})
+            await asyncio.sleep(0.05)
+            return slow, fast
+
+        slow, fast = asyncio.run(run())
+        assert fast.frames == [{"type": "message", "n": 1}]
+        assert slow.frames == []
+
+    def test_replaced_connection_is_closed_and_not_removed_by_old_handler(self):
+        async def run():
+            broadcaster = Broadcaster()
+            first_socket, second_socket = FakeSocket(), FakeSocket()
+            first = broadcaster.add(first_socket, "u1")
+            broadcaster.add(second_socket, "u1")
+            removed = broadcaster.remove("u1", first)
+            await drain()
+            return removed, first_socket, broadcaster
+
+        removed, first_socket, broadcaster = asyncio.run(run())
+        assert removed is False
+        assert first_socket.closed_with == 1000
+        assert "u1" in broadcaster.connections
+
+    def test_close_in_flight_is_referenced_until_done(self):
+        async def run():
+            broadcaster = Broadcaster()
+            socket = FakeSocket()
+            broadcaster.add(socket, "u1")
+            broadcaster.remove("u1")
+            pending = set(chat_broadcast.closing_tasks)
+            await drain()
+            return pending, set(chat_broadcast.closing_tasks), socket
+
+        pending, after, socket = asyncio.run(run())
+        assert len(pending) == 1
+        assert after == set()
+        assert socket.closed_with == 1000
+
+
+class TestSlowConsumerPolicy:
+    """Full queues either drop frames or disconnect the client"""
+
+    def test_drop_policy_counts_dropped_frames(self):
+        async def run():
+            broadcaster = Broadcaster(queue_size=2, policy="drop")
+            socket = FakeSocket(delay=1.0)
+            broadcaster.add(socket, "u1")
+            for n in range(5):
+                broadcaster.broadcast({"n": n})
+            return broadcaster.stats(), socket
+
+        stats, socket = asyncio.run(run())
+        assert stats["frames_dropped"] == 3
+        assert socket.closed_with is None
+
+    def test_disconnect_policy_closes_slow_socket(self):
+        async def run():
+            broadcaster = Broadcaster(queue_size=2, policy="disconnect")
+            socket = FakeSocket(delay=1.0)
+            broadcaster.add(socket, "u1")
+            for n in range(5):
+                broadcaster.broadcast({"n": n})
+            await drain()
+            return broadcaster.stats(), socket
+
+        stats, socket = asyncio.run(run())
+        assert stats["slow_disconnects"] == 1
+        assert socket.closed_with == SLOW_CONSUMER_CLOSE_CODE
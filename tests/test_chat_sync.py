@@ -0,0 +1,189 @@
+"""
+Test suite for chat sequence-number sync (projects/stuff-intercambio/backend/chat.py)
+Uses the in-memory Mongo stand-in, no database needed
+Tests: since with tombstones, before paging, in-flight gaps, resume cap, leased counter backfill
+"""
+import pytest
+import asyncio
+import sys
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+pytest.importorskip("fastapi")
+pytest.importorskip("pymongo")
+pytest.importorskip("jwt")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "projects" / "stuff-intercambio" / "backend"))
+
+import jwt
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import chat
+from chat_blobs import FilesystemBlobStore
+
+from tests.fake_mongo import FakeDatabase
+
+TEST_SECRET = "chat-sync-test-secret-0123456789abcdef"
+
+
+@pytest.fixture
+def db(monkeypatch, tmp_path):
+    database = FakeDatabase(unique={"chat_counters": (("_id",),)})
+    monkeypatch.setattr(chat, "create_blob_store", lambda _: FilesystemBlobStore(root=str(tmp_path)))
+    chat.init_chat_module(database, TEST_SECRET)
+    monkeypatch.setattr(chat, "CHAT_SYNC_GAP_GRACE_SECONDS", 0.2)
+    return database
+
+
+async def post(content: str) -> dict:
+    """Store a message the way the WebSocket handler does"""
+    seq = await chat.next_chat_seq()
+    message = {
+        "id": f"m{seq}", "user_id": "u1", "user_name": "Ana", "content": content,
+        "message_type": "text", "seq": seq, "change_seq": seq, "deleted": False,
+        "changed_at": datetime.now(timezone.utc).isoformat(),
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    await chat.db.chat_messages.insert_one(message)
+    return message
+
+
+def token_for(user_id: str) -> str:
+    return jwt.encode({"sub": user_id}, TEST_SECRET, algorithm=chat.JWT_ALGORITHM)
+
+
+class TestSince:
+    """Changes after a change_seq, deletions included"""
+
+    def test_since_returns_new_messages_and_tombstones(self, db):
+        async def run():
+            await db.users.insert_one({"id": "u1", "name": "Ana", "role": "student"})
+            first = await post("um")
+            await post("dois")
+            await chat.delete_message(first["id"], token_for("u1"))
+            return await chat.messages_since(1, 50)
+
+        changes, held_back = asyncio.run(run())
+        assert held_back is False
+        assert [c["id"] for c in changes] == ["m2", "m1"]
+        assert [c["change_seq"] for c in changes] == [2, 3]
+        assert changes[1]["deleted"] is True
+        assert changes[1]["audio_blob_id"] is None
+
+    def test_before_pages_back_by_seq(self, db):
+        async def run():
+            for n in range(5):
+                await post(f"msg {n}")
+            return await chat.get_messages(limit=2, before=4, since=None)
+
+        page = asyncio.run(run())
+        assert [m["seq"] for m in page] == [2, 3]
+
+    def test_in_flight_change_holds_back_the_rest(self, db):
+        async def run():
+            await post("um")
+            in_flight = await chat.next_chat_seq()  # number taken, write not landed yet
+            await post("tres")
+            before = await chat.messages_since(1, 50)
+            await db.chat_messages.insert_one({
+                "id": "late", "content": "dois", "seq": in_flight, "change_seq": in_flight,
+                "deleted": False, "changed_at": datetime.now(timezone.utc).isoformat()
+            })
+            return before, await chat.messages_since(1, 50)
+
+        (held, held_back), (landed, still_held) = asyncio.run(run())
+        assert (held, held_back) == ([], True)
+        assert [c["change_seq"] for c in landed] == [2, 3]
+        assert still_held is False
+
+    def test_since_page_reports_completeness(self, db):
+        async def run():
+            await post("um")
+            in_flight = await chat.next_chat_seq()
+            await post("tres")
+            held = await chat.get_messages(limit=50, before=None, since=0)
+            await db.chat_messages.insert_one({
+                "id": "late", "content": "dois", "seq": in_flight, "change_seq": in_flight,
+                "deleted": False, "changed_at": datetime.now(timezone.utc).isoformat()
+            })
+            return held, await chat.get_messages(limit=2, before=None, since=0), await chat.get_messages(limit=50, before=None, since=0)
+
+        held, full_page, rest = asyncio.run(run())
+        assert ([m["change_seq"] for m in held["messages"]], held["complete"]) == ([1], False)
+        assert ([m["change_seq"] for m in full_page["messages"]], full_page["complete"]) == ([1, 2], False)
+        assert ([m["change_seq"] for m in rest["messages"]], rest["complete"]) == ([1, 2, 3], True)
+
+    def test_settled_gap_is_skipped(self, db):
+        async def run():
+            await chat.next_chat_seq()  # taken by a write that never landed
+            message = await post("dois")
+            old = (datetime.now(timezone.utc) - timedelta(seconds=5)).isoformat()
+            await db.chat_messages.update_one({"id": message["id"]}, {"$set": {"changed_at": old}})
+            return await chat.messages_since(0, 50)
+
+        changes, held_back = asyncio.run(run())
+        assert [c["change_seq"] for c in changes] == [2]
+        assert held_back is False
+
+
+class TestResume:
+    """Reconnecting clients get what they missed in a sync frame"""
+
+    def test_resume_cap_marks_sync_incomplete(self, db, monkeypatch):
+        monkeypatch.setattr(chat, "CHAT_RESUME_MAX_MESSAGES", 3)
+
+        async def seed():
+            await db.users.insert_one({"id": "u1", "name": "Ana", "role": "student"})
+            for n in range(6):
+                await post(f"msg {n}")
+
+        asyncio.run(seed())
+        app = FastAPI()
+        app.include_router(chat.chat_router)
+        with TestClient(app) as client:
+            with client.websocket_connect(f"/api/chat/ws?token={token_for('u1')}&resume=1") as ws:
+                assert ws.receive_json()["type"] == "connected"
+                sync = ws.receive_json()
+        assert sync["type"] == "sync"
+        assert [m["change_seq"] for m in sync["messages"]] == [2, 3, 4]
+        assert sync["complete"] is False
+
+    def test_backfill_numbers_old_messages_in_creation_order(self, db):
+        async def run():
+            base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+            for n, name in enumerate(["b", "a", "c"]):
+                created_at = (base + timedelta(minutes={"a": 0, "b": 1, "c": 2}[name])).isoformat()
+                await db.chat_messages.insert_one({"id": name, "created_at": created_at, "deleted": False})
+            await chat.backfill_chat_seq()
+            return {d["id"]: (d["seq"], d["change_seq"]) for d in db.chat_messages.docs}, await chat.next_chat_seq()
+
+        numbered, next_seq = asyncio.run(run())
+        assert numbered == {"a": (1, 1), "b": (2, 2), "c": (3, 3)}
+        assert next_seq == 4
+
+    def test_backfill_runs_once(self, db, monkeypatch):
+        async def run():
+            await db.chat_messages.insert_one({"id": "a", "created_at": "2024-01-01T00:00:00+00:00", "deleted": False})
+            await chat.backfill_chat_seq()
+
+            async def count_documents(*args, **kwargs):
+                raise AssertionError("backfill ran again")
+
+            monkeypatch.setattr(db.chat_messages, "count_documents", count_documents)
+            await chat.backfill_chat_seq()
+            return await db.chat_counters.find_one({"_id": "chat_seq_backfill"}), await chat.current_chat_seq()
+
+        marker, seq = asyncio.run(run())
+        assert marker["done"] is True and "lease_until" not in marker
+        assert seq == 1
+
+    def test_backfill_skipped_while_another_worker_holds_the_lease(self, db):
+        async def run():
+            until = (datetime.now(timezone.utc) + timedelta(minutes=5)).isoformat()
+            await db.chat_counters.insert_one({"_id": "chat_seq_backfill", "lease_until": until})
+            await db.chat_messages.insert_one({"id": "a", "created_at": "2024-01-01T00:00:00+00:00", "deleted": False})
+            await chat.backfill_chat_seq()
+            return await db.chat_messages.find_one({"id": "a"})
+
+        assert "seq" not in asyncio.run(run())
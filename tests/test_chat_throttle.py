@@ -0,0 +1,62 @@
+"""
+Test suite for chat throttling (projects/stuff-intercambio/backend/chat_throttle.py)
+Tests: token buckets per user and frame type, typing diffs
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "projects" / "stuff-intercambio" / "backend"))
+
+from chat_throttle import RateLimiter, TypingCoalescer
+
+
+class TestRateLimiter:
+    """Bursts pass, floods do not"""
+
+    def test_burst_then_limited(self):
+        limiter = RateLimiter({"message": (0.001, 3)})
+        results = [limiter.allow("u1", "message") for _ in range(5)]
+        assert results == [True, True, True, False, False]
+        assert limiter.stats()["limited"] == {"message": 2}
+
+    def test_buckets_are_per_user_and_type(self):
+        limiter = RateLimiter({"message": (0.001, 1), "typing": (0.001, 1)})
+        assert limiter.allow("u1", "message")
+        assert limiter.allow("u2", "message")
+        assert limiter.allow("u1", "typing")
+        assert not limiter.allow("u1", "message")
+
+    def test_unlimited_frame_types_pass(self):
+        limiter = RateLimiter({"message": (0.001, 1)})
+        assert all(limiter.allow("u1", "subscribe") for _ in range(10))
+
+
+class TestTypingCoalescer:
+    """Many keystrokes become one diff per interval"""
+
+    def test_repeated_marks_publish_once(self):
+        frames = []
+
+        async def publish(frame):
+            frames.append(frame)
+
+        async def run():
+            coalescer = TypingCoalescer(publish)
+            for _ in range(20):
+                coalescer.mark("u1", "Ana")
+            coalescer.mark("u2", "Bia")
+            await coalescer.flush()
+            await coalescer.flush()  # nothing changed
+            coalescer.clear("u1")
+            await coalescer.flush()
+
+        asyncio.run(run())
+        assert len(frames) == 2
+        assert {u["user_id"] for u in frames[0]["started"]} == {"u1", "u2"}
+        assert frames[1] == {"type": "typing_update", "started": [], "stopped": ["u1"]}
+
+    def test_typing_expires(self):
+        coalescer = TypingCoalescer(None, ttl_seconds=0.0001)
+        coalescer.mark("u1", "Ana", ttl_seconds=-1)
+        assert coalescer.diff() is None
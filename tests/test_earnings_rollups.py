@@ -0,0 +1,71 @@
+"""
+Test suite for daily earnings rollups (backend/server.py record/sum/rebuild_daily_earnings)
+Runs against the in-memory Mongo stand-in
+Tests: per-day increments, inclusive day ranges, rebuild from transactions
+"""
+import pytest
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+pytest.importorskip("fastapi")
+pytest.importorskip("stripe")
+pytest.importorskip("resend")
+pytest.importorskip("dotenv")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "barbero_test")
+
+import server
+
+from tests.fake_mongo import FakeDatabase
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeDatabase(unique={"earnings_daily": (("barber_id", "day"),)})
+    monkeypatch.setattr(server, "db", db)
+    return db
+
+
+class TestDailyRollups:
+    """Each earning lands in its UTC day's row; totals read at most one row per day"""
+
+    def test_earnings_accumulate_per_day(self, db):
+        async def run():
+            await server.record_daily_earning("b1", 20.0, "2026-03-02T09:00:00+00:00")
+            await server.record_daily_earning("b1", 15.5, "2026-03-02T18:30:00.123456+00:00")
+            await server.record_daily_earning("b1", 10.0, "2026-03-03T08:00:00+00:00")
+            await server.record_daily_earning("b2", 99.0, "2026-03-02T10:00:00+00:00")
+            return await db.earnings_daily.find_one({"barber_id": "b1", "day": "2026-03-02"}, {"_id": 0})
+
+        assert asyncio.run(run()) == {"barber_id": "b1", "day": "2026-03-02", "total": 35.5, "count": 2}
+
+    def test_sum_is_inclusive_of_both_days(self, db):
+        async def run():
+            for day, amount in [("2026-03-01", 5.0), ("2026-03-02", 7.25), ("2026-03-03", 3.0), ("2026-03-04", 100.0)]:
+                await server.record_daily_earning("b1", amount, f"{day}T12:00:00+00:00")
+            return (
+                await server.sum_daily_earnings("b1", "2026-03-02", "2026-03-03"),
+                await server.sum_daily_earnings("b1", "2026-03-02"),
+                await server.sum_daily_earnings("b1", "2026-04-01")
+            )
+
+        assert asyncio.run(run()) == (10.25, 110.25, 0)
+
+    def test_rebuild_matches_transactions(self, db):
+        async def run():
+            await db.transactions.insert_many([
+                {"barber_id": "b1", "type": "earning", "amount": 12.0, "created_at": "2026-03-02T09:00:00+00:00"},
+                {"barber_id": "b1", "type": "earning", "amount": 8.0, "created_at": "2026-03-02T23:59:59+00:00"},
+                {"barber_id": "b1", "type": "payout", "amount": -20.0, "created_at": "2026-03-02T23:00:00+00:00"},
+                {"barber_id": "b1", "type": "earning", "amount": 4.0, "created_at": "2026-03-03T00:00:00+00:00"}
+            ])
+            # A stale row is overwritten, not added to
+            await db.earnings_daily.insert_one({"barber_id": "b1", "day": "2026-03-02", "total": 999.0, "count": 9})
+            rows = await server.rebuild_daily_earnings(["b1"])
+            return rows, await server.sum_daily_earnings("b1", "2026-03-02", "2026-03-02"), await server.sum_daily_earnings("b1", "2026-03-01")
+
+        assert asyncio.run(run()) == (2, 20.0, 24.0)
@@ -0,0 +1,61 @@
+"""
+Test suite for related-document hydration (shared/hydrate.py)
+Runs against the in-memory Mongo stand-in
+Tests: one $in query, inclusion projections keep the join key internal, missing relations
+"""
+import pytest
+import asyncio
+
+pytest.importorskip("pymongo")
+
+from shared.hydrate import hydrate
+
+from tests.fake_mongo import FakeDatabase
+
+
+class TestHydrate:
+    """Related documents are attached in one query"""
+
+    def test_attaches_related_documents(self):
+        async def run():
+            db = FakeDatabase()
+            await db.users.insert_many([
+                {"id": "b1", "name": "Rafa", "photo_url": "r.png", "password": "x"},
+                {"id": "b2", "name": "Leo", "photo_url": None, "password": "y"}
+            ])
+            queries = []
+            find = db.users.find
+
+            def counting_find(*args, **kwargs):
+                queries.append(args[0])
+                return find(*args, **kwargs)
+
+            db.users.find = counting_find
+            entries = [{"barber_id": "b1"}, {"barber_id": "b2"}, {"barber_id": "b1"}, {"barber_id": "gone"}]
+            await hydrate(entries, db.users, "barber_id", "barber", {"_id": 0, "name": 1, "photo_url": 1})
+            return entries, queries
+
+        entries, queries = asyncio.run(run())
+        assert len(queries) == 1
+        assert entries[0]["barber"] == {"name": "Rafa", "photo_url": "r.png"}
+        assert entries[1]["barber"] == {"name": "Leo", "photo_url": None}
+        assert entries[2]["barber"] == entries[0]["barber"]
+        assert entries[3]["barber"] is None
+
+    def test_exclusion_projection_keeps_key(self):
+        async def run():
+            db = FakeDatabase()
+            await db.users.insert_one({"id": "b1", "name": "Rafa", "password": "x"})
+            entries = [{"barber_id": "b1"}]
+            await hydrate(entries, db.users, "barber_id", "barber", {"_id": 0, "password": 0})
+            return entries
+
+        assert asyncio.run(run())[0]["barber"] == {"id": "b1", "name": "Rafa"}
+
+    def test_no_ids_no_query(self):
+        async def run():
+            entries = [{"barber_id": None}]
+            await hydrate(entries, None, "barber_id", "barber", {"_id": 0})
+            return entries
+
+        assert asyncio.run(run()) == [{"barber_id": None, "barber": None}]
@@ -0,0 +1,131 @@
+"""
+Test suite for the wallet ledger (backend/ledger.py)
+Uses the in-memory Mongo stand-in on a server without transactions
+Tests: balanced journals, idempotency keys, snapshots, balances, reconciliation
+"""
+import pytest
+import asyncio
+import sys
+from pathlib import Path
+
+pytest.importorskip("pymongo")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from ledger import JournalAlreadyPosted, Ledger, OPENING_BALANCES, wallet_account, to_cents
+
+from tests.fake_mongo import FakeDatabase, NoTransactionClient
+
+
+def make_ledger(settle_seconds: float = 0) -> Ledger:
+    db = FakeDatabase(unique={"ledger_journals": (("idempotency_key",),), "ledger_snapshots": (("account",),)})
+    return Ledger(NoTransactionClient(), db, settle_seconds=settle_seconds)
+
+
+async def fund(ledger: Ledger, barber_id: str, cents: int, key: str = "fund"):
+    await ledger.post(key, "opening_balance", [(OPENING_BALANCES, -cents), (wallet_account(barber_id), cents)], barber_id=barber_id)
+
+
+class TestPost:
+    """Journals are balanced and posted at most once per key"""
+
+    def test_unbalanced_journal_rejected(self):
+        ledger = make_ledger()
+        with pytest.raises(ValueError):
+            asyncio.run(ledger.post("k", "payment", [(wallet_account("b1"), 100), (OPENING_BALANCES, -99)]))
+
+    def test_reused_key_returns_original_journal(self):
+        async def run():
+            ledger = make_ledger()
+            await fund(ledger, "b1", 1000)
+            first = await ledger.db.ledger_journals.find_one({"idempotency_key": "fund"}, {"_id": 0})
+            with pytest.raises(JournalAlreadyPosted) as error:
+                await fund(ledger, "b1", 1000)
+            return first, error.value.journal, await ledger.balance(wallet_account("b1"))
+
+        first, original, balance = asyncio.run(run())
+        assert original["id"] == first["id"]
+        assert balance == 1000
+
+    def test_zero_postings_are_not_written(self):
+        async def run():
+            ledger = make_ledger()
+            await ledger.post("k", "payment", [(wallet_account("b1"), 0), (OPENING_BALANCES, 0)])
+            return await ledger.db.ledger_postings.count_documents({})
+
+        assert asyncio.run(run()) == 0
+
+    def test_falls_back_without_transactions(self):
+        async def run():
+            ledger = make_ledger()
+            result = await ledger.run_transaction(lambda session: asyncio.sleep(0, result=session))
+            return result, ledger.transactions_supported
+
+        assert asyncio.run(run()) == (None, False)
+
+
+class TestSnapshots:
+    """Balances are snapshot totals plus later postings, and a window is folded once"""
+
+    def test_balance_is_unchanged_by_snapshot(self):
+        async def run():
+            ledger = make_ledger()
+            await fund(ledger, "b1", 1500, key="a")
+            folded = await ledger.snapshot(lag_seconds=0)
+            again = await ledger.snapshot(lag_seconds=0)
+            await fund(ledger, "b1", 250, key="b")
+            snapshot = await ledger.db.ledger_snapshots.find_one({"account": wallet_account("b1")})
+            return folded, again, snapshot["balance_cents"], await ledger.balance(wallet_account("b1"))
+
+        folded, again, snapshotted, balance = asyncio.run(run())
+        assert folded == 2  # the wallet and the opening balances account
+        assert again == 0
+        assert snapshotted == 1500
+        assert balance == 1750
+
+    def test_recent_postings_wait_for_the_lag(self):
+        async def run():
+            ledger = make_ledger()
+            await fund(ledger, "b1", 500)
+            return await ledger.snapshot(lag_seconds=3600), await ledger.balance(wallet_account("b1"))
+
+        assert asyncio.run(run()) == (0, 500)
+
+
+class TestReconcile:
+    """Without transactions, only drift that holds still is corrected"""
+
+    def test_stable_drift_is_corrected(self):
+        async def run():
+            ledger = make_ledger()
+            await fund(ledger, "b1", 4200)
+            await ledger.db.wallets.insert_one({"barber_id": "b1", "available_balance": 40.0, "ledger_opened": True})
+            drifted = await ledger.reconcile_wallets()
+            wallet = await ledger.db.wallets.find_one({"barber_id": "b1"})
+            return drifted, wallet["available_balance"]
+
+        assert asyncio.run(run()) == (1, 42.0)
+
+    def test_matching_wallet_is_left_alone(self):
+        async def run():
+            ledger = make_ledger()
+            await fund(ledger, "b1", to_cents(12.34))
+            await ledger.db.wallets.insert_one({"barber_id": "b1", "available_balance": 12.34, "ledger_opened": True})
+            return await ledger.reconcile_wallet("b1")
+
+        assert asyncio.run(run()) is False
+
+    def test_wallet_update_in_flight_is_not_overwritten(self):
+        async def run():
+            ledger = make_ledger(settle_seconds=0.05)
+            await ledger.db.wallets.insert_one({"barber_id": "b1", "available_balance": 0.0, "ledger_opened": True})
+            # A payment has posted its journal; its wallet $inc lands during the settle window
+            await fund(ledger, "b1", 1000)
+            reconcile = asyncio.create_task(ledger.reconcile_wallet("b1"))
+            await asyncio.sleep(0.01)
+            await ledger.db.wallets.update_one({"barber_id": "b1"}, {"$inc": {"available_balance": 10.0}})
+            drifted = await reconcile
+            wallet = await ledger.db.wallets.find_one({"barber_id": "b1"})
+            return drifted, wallet["available_balance"]
+
+        assert asyncio.run(run()) == (False, 10.0)
@@ -0,0 +1,83 @@
+"""
+Test suite for keyset pagination (shared/pagination.py)
+Runs against the in-memory Mongo stand-in
+Tests: cursor round trips, ties on created_at, last page, malformed cursors
+"""
+import pytest
+import asyncio
+
+pytest.importorskip("fastapi")
+pytest.importorskip("pymongo")
+
+from fastapi import HTTPException
+
+from shared.pagination import decode_cursor, encode_cursor, fetch_page
+from tests.fake_mongo import FakeDatabase
+
+
+async def walk(collection, query: dict, limit: int):
+    """Follow next_cursor until the last page; returns the pages' ids"""
+    pages, cursor = [], None
+    while True:
+        docs, cursor = await fetch_page(collection, query, limit, cursor)
+        pages.append([d["id"] for d in docs])
+        if cursor is None:
+            return pages
+
+
+class TestCursor:
+    """Cursors are opaque tokens that decode back to the same state"""
+
+    def test_round_trip(self):
+        state = {"created_at": "2026-03-02T09:00:00+00:00", "id": "r-7"}
+        token = encode_cursor(state)
+        assert "/" not in token and "+" not in token
+        assert decode_cursor(token) == state
+
+    @pytest.mark.parametrize("token", ["not a cursor", "WzEsMl0="])
+    def test_malformed_cursor_is_a_400(self, token):
+        # The second token is valid base64 JSON, but a list rather than an object
+        with pytest.raises(HTTPException) as error:
+            decode_cursor(token)
+        assert error.value.status_code == 400
+
+    def test_cursor_missing_keys_is_a_400(self):
+        async def run():
+            await fetch_page(FakeDatabase().reviews, {}, 10, encode_cursor({"id": "r-1"}))
+
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(run())
+        assert error.value.status_code == 400
+
+
+class TestFetchPage:
+    """Following next_cursor visits every row once, newest first"""
+
+    def test_pages_cover_every_row_once(self):
+        async def run():
+            db = FakeDatabase()
+            # Three rows share a timestamp, so id has to break the tie across a page boundary
+            await db.reviews.insert_many([
+                {"id": f"r-{i}", "barber_id": "b1", "created_at": f"2026-03-0{1 + i // 3}T12:00:00+00:00"}
+                for i in range(7)
+            ] + [{"id": "other", "barber_id": "b2", "created_at": "2026-03-09T12:00:00+00:00"}])
+            return await walk(db.reviews, {"barber_id": "b1"}, limit=2)
+
+        pages = asyncio.run(run())
+        assert pages == [["r-6", "r-5"], ["r-4", "r-3"], ["r-2", "r-1"], ["r-0"]]
+
+    def test_exact_multiple_has_no_empty_trailing_page(self):
+        async def run():
+            db = FakeDatabase()
+            await db.payouts.insert_many([
+                {"id": f"p-{i}", "created_at": f"2026-03-0{i + 1}T00:00:00+00:00"} for i in range(4)
+            ])
+            return await walk(db.payouts, {}, limit=2)
+
+        assert asyncio.run(run()) == [["p-3", "p-2"], ["p-1", "p-0"]]
+
+    def test_empty_collection(self):
+        async def run():
+            return await fetch_page(FakeDatabase().payouts, {}, 10)
+
+        assert asyncio.run(run()) == ([], None)
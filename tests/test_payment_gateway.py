@@ -0,0 +1,140 @@
+"""
+Test suite for the async Stripe payment gateway
+Runs shared/payment_gateway.py against the local fake Stripe server (backend/fake_stripe.py)
+Tests: idempotent account creation, checkout round trip, transfers, deadlines
+"""
+import pytest
+import asyncio
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+uvicorn = pytest.importorskip("uvicorn")
+pytest.importorskip("stripe")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import fake_stripe
+from shared.payment_gateway import PaymentGateway
+
+
+@pytest.fixture(scope="module")
+def fake_stripe_url():
+    """Start the fake Stripe server on a free local port"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(fake_stripe.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+def make_gateway(url, **kwargs):
+    return PaymentGateway(api_key="sk_test_fake", api_base=url, max_retries=0, **kwargs)
+
+
+class TestConnectAccounts:
+    """Account creation, retrieval and links"""
+
+    def test_create_account_is_idempotent(self, fake_stripe_url):
+        async def run():
+            gateway = make_gateway(fake_stripe_url)
+            params = {"type": "express", "country": "IE", "metadata": {"barber_id": "b1"}}
+            first = await gateway.create_account(params, idempotency_key="connect-account-b1")
+            second = await gateway.create_account(params, idempotency_key="connect-account-b1")
+            return first, second
+
+        first, second = asyncio.run(run())
+        assert first.id == second.id, "Same idempotency key should return the same account"
+        assert first.metadata["barber_id"] == "b1"
+
+    def test_retrieve_account_reflects_onboarding(self, fake_stripe_url):
+        async def run():
+            gateway = make_gateway(fake_stripe_url)
+            account = await gateway.create_account({"type": "express"})
+            before = await gateway.retrieve_account(account.id)
+            fake_stripe.accounts[account.id]["charges_enabled"] = True
+            after = await gateway.retrieve_account(account.id)
+            link = await gateway.create_login_link(account.id)
+            return before, after, link
+
+        before, after, link = asyncio.run(run())
+        assert before.charges_enabled is False
+        assert after.charges_enabled is True
+        assert link.url.startswith(fake_stripe_url)
+
+
+class TestCheckoutAndTransfers:
+    """Checkout sessions and payouts"""
+
+    def test_checkout_session_round_trip(self, fake_stripe_url):
+        async def run():
+            gateway = make_gateway(fake_stripe_url)
+            session = await gateway.create_checkout_session({"mode": "payment", "metadata": {"client_id": "c1"}})
+            fake_stripe.sessions[session.id]["payment_status"] = "paid"
+            return await gateway.retrieve_checkout_session(session.id)
+
+        session = asyncio.run(run())
+        assert session.payment_status == "paid"
+        assert session.metadata["client_id"] == "c1"
+
+    def test_retried_transfer_moves_money_once(self, fake_stripe_url):
+        async def run():
+            gateway = make_gateway(fake_stripe_url)
+            account = await gateway.create_account({"type": "express"})
+            params = {"amount": 1500, "currency": "eur", "destination": account.id}
+            first = await gateway.create_transfer(params, idempotency_key="payout-p1")
+            second = await gateway.create_transfer(params, idempotency_key="payout-p1")
+            return first, second
+
+        first, second = asyncio.run(run())
+        assert first.id == second.id
+        assert len([t for t in fake_stripe.transfers.values() if t["id"] == first.id]) == 1
+
+    def test_stripe_errors_propagate(self, fake_stripe_url):
+        import stripe
+
+        async def run():
+            gateway = make_gateway(fake_stripe_url)
+            await gateway.retrieve_account("acct_missing")
+
+        with pytest.raises(stripe.error.StripeError):
+            asyncio.run(run())
+
+
+class TestDeadlinesAndConcurrency:
+    """Slow Stripe responses must not hold callers past the deadline"""
+
+    def test_deadline_raises_connection_error(self, fake_stripe_url, monkeypatch):
+        import stripe
+        monkeypatch.setattr(fake_stripe, "FAKE_STRIPE_LATENCY_MS", 1000)
+
+        async def run():
+            gateway = make_gateway(fake_stripe_url, deadline=0.2)
+            try:
+                await gateway.retrieve_account("acct_any")
+            finally:
+                assert gateway.stats()["timeouts"] == 1
+
+        with pytest.raises(stripe.error.APIConnectionError):
+            asyncio.run(run())
+
+    def test_concurrency_is_bounded(self, fake_stripe_url, monkeypatch):
+        monkeypatch.setattr(fake_stripe, "FAKE_STRIPE_LATENCY_MS", 100)
+
+        async def run():
+            gateway = make_gateway(fake_stripe_url, max_concurrency=2)
+            await asyncio.gather(*[gateway.create_checkout_session({"mode": "payment"}) for _ in range(6)])
+            return gateway.stats()
+
+        stats = asyncio.run(run())
+        assert stats["calls"] == 6
+        assert stats["peak_in_flight"] == 2
@@ -0,0 +1,101 @@
+"""
+Test suite for wallet payouts (backend/server.py reserve_payout / submit_payout)
+Runs against the in-memory Mongo stand-in without transactions; Stripe is stubbed out
+Tests: reservation moves funds, refused payouts leave the idempotency key usable, retries resume
+"""
+import pytest
+import asyncio
+import os
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+pytest.importorskip("fastapi")
+pytest.importorskip("stripe")
+pytest.importorskip("resend")
+pytest.importorskip("dotenv")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "barbero_test")
+
+import server
+from ledger import InsufficientFunds, Ledger, OPENING_BALANCES, payouts_in_transit_account, wallet_account
+
+from tests.fake_mongo import FakeDatabase, NoTransactionClient
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    db = FakeDatabase(unique={"ledger_journals": (("idempotency_key",),), "wallets": (("barber_id",),)})
+    ledger = Ledger(NoTransactionClient(), db)
+    transfers = []
+
+    async def execute_payout(payout, stripe_account_id):
+        transfers.append(payout["id"])
+        return SimpleNamespace(id=f"tr_{len(transfers)}")
+
+    monkeypatch.setattr(server, "db", db)
+    monkeypatch.setattr(server, "ledger", ledger)
+    monkeypatch.setattr(server, "execute_payout", execute_payout)
+    return SimpleNamespace(db=db, ledger=ledger, transfers=transfers)
+
+
+async def fund(backend, barber_id: str, amount: float, key: str):
+    cents = round(amount * 100)
+    await backend.ledger.post(key, "payment", [(OPENING_BALANCES, -cents), (wallet_account(barber_id), cents)])
+    await backend.db.wallets.update_one(
+        {"barber_id": barber_id}, {"$inc": {"available_balance": amount}, "$set": {"ledger_opened": True}}, upsert=True
+    )
+
+
+class TestReservePayout:
+    """Without a transaction the wallet is debited before the journal is posted"""
+
+    def test_payout_moves_funds_to_transit(self, backend):
+        async def run():
+            await fund(backend, "b1", 80.0, key="p1")
+            payout = await server.submit_payout("b1", "acct_1", 50.0, "standard", idempotency_key="key-1")
+            wallet = await backend.db.wallets.find_one({"barber_id": "b1"})
+            return (
+                payout,
+                wallet["available_balance"],
+                await backend.ledger.balance(wallet_account("b1")),
+                await backend.ledger.balance(payouts_in_transit_account("b1"))
+            )
+
+        payout, available, ledger_wallet, in_transit = asyncio.run(run())
+        assert payout["status"] == "pending"
+        assert available == 30.0
+        assert ledger_wallet == 3000
+        assert in_transit == 5000
+
+    def test_refused_payout_leaves_key_usable(self, backend):
+        async def run():
+            await fund(backend, "b1", 10.0, key="p1")
+            with pytest.raises(InsufficientFunds):
+                await server.submit_payout("b1", "acct_1", 50.0, "standard", idempotency_key="key-1")
+            journals_after_refusal = await backend.db.ledger_journals.count_documents({"type": "payout_reserve"})
+            await fund(backend, "b1", 60.0, key="p2")
+            payout = await server.submit_payout("b1", "acct_1", 50.0, "standard", idempotency_key="key-1")
+            wallet = await backend.db.wallets.find_one({"barber_id": "b1"})
+            return journals_after_refusal, payout, wallet["available_balance"]
+
+        journals_after_refusal, payout, available = asyncio.run(run())
+        assert journals_after_refusal == 0
+        assert payout["status"] == "pending"
+        assert available == 20.0
+
+    def test_retry_resumes_original_payout_without_debiting_twice(self, backend):
+        async def run():
+            await fund(backend, "b1", 100.0, key="p1")
+            first = await server.submit_payout("b1", "acct_1", 40.0, "standard", idempotency_key="key-1")
+            await backend.db.payouts.update_one({"id": first["id"]}, {"$set": {"status": "paid"}})
+            retry = await server.submit_payout("b1", "acct_1", 40.0, "standard", idempotency_key="key-1")
+            wallet = await backend.db.wallets.find_one({"barber_id": "b1"})
+            return first, retry, wallet["available_balance"]
+
+        first, retry, available = asyncio.run(run())
+        assert retry["id"] == first["id"]
+        assert available == 60.0
+        assert len(backend.transfers) == 1
@@ -0,0 +1,58 @@
+"""
+Test suite for joining a barber's queue (backend/server.py join_queue)
+Runs against the in-memory Mongo stand-in
+Tests: the pre-check and the unique index both answer a duplicate join with the same 400
+"""
+import pytest
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+pytest.importorskip("fastapi")
+pytest.importorskip("stripe")
+pytest.importorskip("resend")
+pytest.importorskip("dotenv")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "barbero_test")
+
+from fastapi import HTTPException
+
+import server
+
+from tests.fake_mongo import FakeDatabase
+
+CLIENT = {"id": "c1", "name": "Ana", "user_type": "client"}
+SERVICE = {"name": "Corte", "price": 30.0}
+
+
+@pytest.fixture
+def db(monkeypatch):
+    # Stands in for the unique index on (client_id, barber_id) where status is "waiting"
+    db = FakeDatabase(unique={"queue": (("client_id", "barber_id", "status"),)})
+    monkeypatch.setattr(server, "db", db)
+    asyncio.run(db.users.insert_one({"id": "b1", "user_type": "barber", "name": "Rui"}))
+    asyncio.run(db.queue.insert_one({"id": "q1", "client_id": "c1", "barber_id": "b1", "status": "waiting", "ticket": 1}))
+    return db
+
+
+class TestDuplicateJoin:
+    """A client already waiting for a barber cannot take a second spot"""
+
+    def test_pre_check_rejects(self, db):
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(server.join_queue("b1", SERVICE, user=CLIENT))
+        assert (error.value.status_code, error.value.detail) == (400, "Already in queue for this barber")
+
+    def test_join_that_loses_the_race_gets_the_same_400(self, db, monkeypatch):
+        async def find_one(query, projection=None, session=None):
+            # The concurrent join's insert lands after this request's pre-check
+            return None
+
+        monkeypatch.setattr(db.queue, "find_one", find_one)
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(server.join_queue("b1", SERVICE, user=CLIENT))
+        assert (error.value.status_code, error.value.detail) == (400, "Already in queue for this barber")
+        assert asyncio.run(db.queue.count_documents({"client_id": "c1"})) == 1
@@ -0,0 +1,106 @@
+"""
+Test suite for barber rating aggregates (backend/server.py recompute/backfill_rating_aggregates)
+Runs against the in-memory Mongo stand-in
+Tests: rebuild from reviews, barbers left without reviews, startup repair of drifted totals
+"""
+import pytest
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+pytest.importorskip("fastapi")
+pytest.importorskip("stripe")
+pytest.importorskip("resend")
+pytest.importorskip("dotenv")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "barbero_test")
+
+import server
+
+from tests.fake_mongo import FakeDatabase
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeDatabase()
+    monkeypatch.setattr(server, "db", db)
+    return db
+
+
+async def add_reviews(db, barber_id: str, *ratings: int):
+    await db.reviews.insert_many([{"id": f"{barber_id}-{i}", "barber_id": barber_id, "rating": r} for i, r in enumerate(ratings)])
+
+
+async def barber(db, barber_id: str) -> dict:
+    return await db.users.find_one({"id": barber_id}, {"_id": 0})
+
+
+class TestRecompute:
+    """Aggregates are rebuilt from the reviews collection"""
+
+    def test_totals_and_histogram_match_reviews(self, db):
+        async def run():
+            await db.users.insert_one({"id": "b1", "user_type": "barber", "rating": 1.0, "rating_count": 9, "rating_sum": 9})
+            await add_reviews(db, "b1", 5, 4, 4, 2)
+            updated = await server.recompute_rating_aggregates(["b1"])
+            return updated, await barber(db, "b1")
+
+        updated, b1 = asyncio.run(run())
+        assert updated == 1
+        assert (b1["rating_count"], b1["rating_sum"], b1["total_reviews"], b1["rating"]) == (4, 15, 4, 3.8)
+        assert b1["rating_histogram"] == {"5": 1, "4": 2, "2": 1}
+
+    def test_barber_whose_reviews_were_deleted_gets_the_default_rating(self, db):
+        async def run():
+            await db.users.insert_one({"id": "b1", "user_type": "barber", "rating": 2.0, "rating_count": 1, "rating_sum": 2})
+            await server.recompute_rating_aggregates()
+            return await barber(db, "b1")
+
+        b1 = asyncio.run(run())
+        assert b1["rating"] == server.User.model_fields["rating"].default
+        assert (b1["rating_count"], b1["rating_sum"], b1["total_reviews"]) == (0, 0, 0)
+
+    def test_untracked_barber_keeps_its_rating(self, db):
+        async def run():
+            await db.users.insert_one({"id": "b1", "user_type": "barber", "rating": 4.8})
+            await server.recompute_rating_aggregates()
+            return await barber(db, "b1")
+
+        b1 = asyncio.run(run())
+        assert b1["rating"] == 4.8
+        assert b1["rating_count"] == 0
+
+
+class TestBackfill:
+    """Startup repairs barbers that were never tracked or whose totals drifted, and leaves the rest"""
+
+    def test_only_drifted_barbers_are_recomputed(self, db, monkeypatch):
+        async def run():
+            await db.users.insert_many([
+                {"id": "ok", "user_type": "barber", "rating": 4.5, "rating_count": 2, "rating_sum": 9},
+                {"id": "drifted", "user_type": "barber", "rating": 5.0, "rating_count": 1, "rating_sum": 5},
+                {"id": "legacy", "user_type": "barber", "rating": 3.0}
+            ])
+            await add_reviews(db, "ok", 5, 4)
+            await add_reviews(db, "drifted", 5, 1)
+            await add_reviews(db, "legacy", 3)
+
+            recomputed = []
+            recompute = server.recompute_rating_aggregates
+
+            async def spy(barber_ids=None):
+                recomputed.append(sorted(barber_ids))
+                return await recompute(barber_ids)
+
+            monkeypatch.setattr(server, "recompute_rating_aggregates", spy)
+            await server.backfill_rating_aggregates()
+            await server.backfill_rating_aggregates()
+            return recomputed, await barber(db, "drifted"), await barber(db, "legacy")
+
+        recomputed, drifted, legacy = asyncio.run(run())
+        assert recomputed == [["drifted", "legacy"]]
+        assert (drifted["rating_count"], drifted["rating_sum"], drifted["rating"]) == (2, 6, 3.0)
+        assert (legacy["rating_count"], legacy["rating"]) == (1, 3.0)
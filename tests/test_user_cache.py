@@ -0,0 +1,90 @@
+"""
+Test suite for the token-to-user cache (shared/user_cache.py)
+Tests: hits and copies, TTL expiry, LRU eviction, invalidation, invalidation during a load
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from shared.user_cache import UserCache
+
+
+class TestUserCache:
+    """Users are served from memory until they expire, are evicted or invalidated"""
+
+    def test_hit_returns_a_copy(self):
+        cache = UserCache()
+        cache.set("u1", {"id": "u1", "name": "Ana"})
+        cache.get("u1")["name"] = "changed by a handler"
+        assert cache.get("u1")["name"] == "Ana"
+        assert cache.stats()["hits"] == 2
+
+    def test_entry_expires_after_ttl(self):
+        cache = UserCache(ttl_seconds=0)
+        cache.set("u1", {"id": "u1"})
+        assert cache.get("u1") is None
+        assert cache.stats()["misses"] == 1
+
+    def test_least_recently_used_is_evicted(self):
+        cache = UserCache(max_size=2)
+        cache.set("u1", {"id": "u1"})
+        cache.set("u2", {"id": "u2"})
+        cache.get("u1")
+        cache.set("u3", {"id": "u3"})
+        assert cache.get("u2") is None
+        assert cache.get("u1") is not None
+        assert cache.stats()["evictions"] == 1
+
+    def test_invalidate_forces_a_reload(self):
+        async def run():
+            cache = UserCache()
+            loads = []
+
+            async def loader(user_id):
+                loads.append(user_id)
+                return {"id": user_id, "version": len(loads)}
+
+            await cache.get_or_load("u1", loader)
+            await cache.get_or_load("u1", loader)
+            cache.invalidate("u1")
+            return await cache.get_or_load("u1", loader), loads
+
+        user, loads = asyncio.run(run())
+        assert loads == ["u1", "u1"]
+        assert user["version"] == 2
+
+    def test_load_racing_an_invalidation_is_not_cached(self):
+        async def run():
+            cache = UserCache()
+            started = asyncio.Event()
+            release = asyncio.Event()
+
+            async def slow_loader(user_id):
+                started.set()
+                await release.wait()
+                return {"id": user_id, "is_online": False}  # read before the write below
+
+            load = asyncio.create_task(cache.get_or_load("u1", slow_loader))
+            await started.wait()
+            cache.invalidate("u1")  # the write lands while the read is in flight
+            release.set()
+            user = await load
+            return user, cache.get("u1"), cache.stats()
+
+        user, cached, stats = asyncio.run(run())
+        assert user == {"id": "u1", "is_online": False}
+        assert cached is None
+        assert stats["stale_loads"] == 1
+
+    def test_missing_user_is_not_cached(self):
+        async def run():
+            cache = UserCache()
+
+            async def loader(user_id):
+                return None
+
+            return await cache.get_or_load("ghost", loader), cache.stats()["size"]
+
+        assert asyncio.run(run()) == (None, 0)